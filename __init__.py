@@ -1,13 +1,14 @@
 import bpy
 from bpy_extras.io_utils import ImportHelper
-from bpy.props import StringProperty, BoolProperty, EnumProperty, IntProperty
+from bpy.props import StringProperty, BoolProperty, EnumProperty, IntProperty, FloatProperty
 from bpy.types import Operator
 from .qmap.Map import Map, Brush, Patch
+from .qmap.GeoCache import GeometryCache
 from .builders.MaterialBuilder import BuildMaterials
-from .builders.BrushBuilder import BuildBrushGeo
+from .builders.BrushBuilder import BuildBrushGeo, BuildEntityGeo
 from .builders.PatchBuilder import BuildPatchGeo
 from .builders.LightBuilder import BuildLight
-from .builders.LmapBuilder import BuildLightmapUVs, BakeLightmap
+from .builders.LmapBuilder import PackLightmaps, BakeLightmap
 from .builders.LevelBuilder import BuildLevel
 
 bl_info = {
@@ -40,11 +41,94 @@ class ImportMap(Operator, ImportHelper):
         maxlen=1024
     )
 
+    parse_workers: IntProperty(
+        name="Parser Processes",
+        default=1,
+        min=1
+    )
+
+    geo_workers: IntProperty(
+        name="Brush Processes",
+        description="Number of processes that calculate brush vertices and uvs",
+        default=1,
+        min=1
+    )
+
+    geo_chunk_size: IntProperty(
+        name="Brushes per Task",
+        default=256,
+        min=1
+    )
+
+    use_cache: BoolProperty(
+        name="Cache Parsed Map",
+        description="Keep the parsed map and its brush geometry in a .mapcache file next to the map",
+        default=False
+    )
+
+    csg_engine: EnumProperty(
+        items=(
+            ("NUMPY", "NumPy", "Solve every plane triple of a brush at once"),
+            ("PYTHON", "Python", "Loop over every plane triple of a brush"),
+            ("CLIP", "Clip", "Clip a winding on each face plane against the other planes")
+        ),
+        name="Brush Engine",
+        default="NUMPY"
+    )
+
+    cross_check_engines: BoolProperty(
+        name="Cross Check Brush Engines",
+        description="Compare the brush corners of the Clip and NumPy engines and list the brushes where they disagree. Slow",
+        default=False
+    )
+
+    use_geo_cache: BoolProperty(
+        name="Cache Repeated Geometry",
+        description="Calculate brushes and patches that only differ by translation once",
+        default=True
+    )
+
+    geo_cache_path: StringProperty(
+        name="Geometry Cache Folder",
+        description="Folder that keeps cached geometry between imports. Leave empty to keep it in memory only",
+        default="",
+        maxlen=1024
+    )
+
+    mesh_mode: EnumProperty(
+        items=(
+            ("ENTITY", "Entity", "One mesh per entity, with a material slot per material"),
+            ("MATERIAL", "Material", "One mesh per material of each entity"),
+            ("FACE", "Face", "One mesh per brush face")
+        ),
+        name="Brush Meshes",
+        default="ENTITY"
+    )
+
+    import_patches: BoolProperty(
+        name="Import Patches",
+        default=True
+    )
+
     patch_tessellation: IntProperty(
         name="Patch Tessellation Level",
+        description="Tessellation level of every patch, or the highest level adaptive tessellation can use",
         default=8
     )
 
+    adaptive_patches: BoolProperty(
+        name="Adaptive Patch Tessellation",
+        description="Pick the tessellation level of each part of a patch from how much it bends",
+        default=True
+    )
+
+    patch_tolerance: FloatProperty(
+        name="Patch Tolerance",
+        description="How far in map units adaptive tessellation can be from the curved surface",
+        default=2.0,
+        min=0.01
+    )
+
     bake_lightmaps: BoolProperty(
         name="Bake Lightmaps",
         default=False
@@ -63,16 +147,49 @@ class ImportMap(Operator, ImportHelper):
         default="1024"
     )
 
+    lightmap_luxel_size: FloatProperty(
+        name="Lightmap Luxel Size",
+        description="Map units per lightmap texel. Made larger if the map doesn't fit in the lightmap image",
+        default=16.0,
+        min=0.01
+    )
+
     save_level: BoolProperty(
         name="Compile",
         default=False
     )
 
     def execute(self, context):
-        mapData = Map.Load(self.filepath)
+        Brush.engine = self.csg_engine
+
+        cache = GeometryCache.active
+        if not self.use_geo_cache:
+            GeometryCache.active = None
+        elif cache is None or cache.path != (self.geo_cache_path or None):
+            GeometryCache.active = GeometryCache(path=self.geo_cache_path or None)
+
+        mapData = Map.Load(self.filepath, self.parse_workers, cache=self.use_cache)
+
+        if self.cross_check_engines:
+            mismatches = mapData.CrossCheckEngines()
+            if len(mismatches) != 0:
+                self.report({'WARNING'}, f"Brush engines disagree on {len(mismatches)} brushes, see the console")
 
         lighmap_size = (int(self.lightmap_size), int(self.lightmap_size))
+        patch_tolerance = self.patch_tolerance if self.adaptive_patches else None
         BuildMaterials(mapData, self.game_path, lighmap_size)
+        mapData.ProcessGeo(self.geo_workers, self.geo_chunk_size)
+
+        # the lightmaps and builders read the brushes from the store, so brushes calculated in a process pool are never unpacked
+        # into Face and Vector objects, and the ones that were can be freed
+        mapData.BuildGeometry(release=True)
+
+        try:
+            luxelSize = PackLightmaps(mapData, lighmap_size, self.lightmap_luxel_size, patches=self.import_patches)
+            if luxelSize != self.lightmap_luxel_size:
+                print(f"Lightmap luxel size raised to {luxelSize:.2f} to fit the lightmap image")
+        except ValueError as e:
+            self.report({'WARNING'}, f"{e}. Lightmap uvs are left empty, try a larger lightmap image")
 
         for i, entity in enumerate(mapData.entities):
             classname = entity["classname"]
@@ -82,20 +199,23 @@ class ImportMap(Operator, ImportHelper):
                 continue
 
             if len(entity.geo) != 0:
-                for j, geo in enumerate(entity.geo):
-                    if isinstance(geo, Brush):
-                        BuildBrushGeo(geo, i, j)
-                    elif isinstance(geo, Patch):
-                        continue
-                        # BuildPatchGeo(geo, i, j, self.patch_tessellation)
+                if self.mesh_mode != "FACE":
+                    BuildEntityGeo(mapData.geometry, i, mapData.materials, self.mesh_mode == "MATERIAL")
 
-        BuildLightmapUVs(lighmap_size)
+                for j, geo in enumerate(entity.geo):
+                    if isinstance(geo, Brush) and self.mesh_mode == "FACE":
+                        BuildBrushGeo(geo, i, j, mapData.materials)
+                    elif isinstance(geo, Patch) and self.import_patches:
+                        BuildPatchGeo(geo, i, j, self.patch_tessellation, mapData.materials, patch_tolerance)
 
         if self.bake_lightmaps:
             BakeLightmap()
         
         if self.save_level:
-            BuildLevel(self.filepath, mapData)
+            BuildLevel(self.filepath, mapData, self.patch_tessellation, patch_tolerance)
+
+        if GeometryCache.active is not None:
+            print(f"Geometry cache: {GeometryCache.active}")
 
         return {'FINISHED'}
 
@@ -0,0 +1,42 @@
+"""
+Compares parsing brush faces one line at a time with `Face.FromTokens` against the bulk `FaceBatch` path.
+
+Run it from Blender with the addon installed:
+
+    blender --background --python benchmarks/FaceParsing.py -- path/to/file.map
+"""
+
+import sys
+from timeit import timeit
+from io_import_mapcompiler.qmap.Face import Face
+from io_import_mapcompiler.qmap.FaceBatch import FaceBatch
+
+def IsFaceLine(tok) -> bool:
+    """
+    Checks for three `( x y z )` point groups followed by a material, so patch headers and control rows are left out.
+    """
+
+    return (
+        len(tok) >= 21 and
+        tok[0] == "(" and tok[4] == ")" and tok[5] == "(" and tok[9] == ")" and tok[10] == "(" and tok[14] == ")"
+    )
+
+def ReadFaceLines(path: str):
+    with open(path, "r") as file:
+        return [tok for tok in (line.split() for line in file) if IsFaceLine(tok)]
+
+def Benchmark(path: str, number=5):
+    faces = ReadFaceLines(path)
+
+    perLine = timeit(lambda: [Face.FromTokens(tok) for tok in faces], number=number) / number
+    bulk = timeit(lambda: FaceBatch.FromTokens(faces), number=number) / number
+    bulkFaces = timeit(lambda: FaceBatch.FromTokens(faces).GetFaces(), number=number) / number
+
+    print(f"{len(faces)} faces")
+    print(f"Face.FromTokens:                {perLine * 1000:.2f} ms")
+    print(f"FaceBatch.FromTokens:           {bulk * 1000:.2f} ms ({perLine / bulk:.2f}x)")
+    print(f"FaceBatch.FromTokens+GetFaces:  {bulkFaces * 1000:.2f} ms ({perLine / bulkFaces:.2f}x)")
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    Benchmark(argv[0])
@@ -0,0 +1,27 @@
+"""
+Times packing lightmap charts with `PackCharts` for 10k, 100k and 1M charts of random sizes.
+
+Run it from Blender with the addon installed:
+
+    blender --background --python benchmarks/LightmapPacking.py -- [atlas size]
+"""
+
+import sys
+import numpy as np
+from timeit import timeit
+from io_import_mapcompiler.qmap.Lightmap import PackCharts
+
+def Benchmark(atlasSize: int = 4096, counts=(10_000, 100_000, 1_000_000), number=3):
+    rng = np.random.default_rng(0)
+
+    for count in counts:
+        # chart sizes in map units, mostly small faces with a long tail of big ones
+        sizes = rng.gamma(2.0, 40.0, (count, 2))
+        _, _, scale = PackCharts(sizes, (atlasSize, atlasSize), 1.0 / 16.0)
+        time = timeit(lambda: PackCharts(sizes, (atlasSize, atlasSize), 1.0 / 16.0), number=number) / number
+
+        print(f"{count:>9} charts: {time * 1000:9.2f} ms, {1.0 / scale:6.2f} map units per texel")
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    Benchmark(int(argv[0]) if len(argv) != 0 else 4096)
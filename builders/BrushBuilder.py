@@ -1,12 +1,75 @@
 import bpy
+import numpy as np
 from mathutils import Vector
+from typing import Dict, List, Tuple
 from ..qmap.Brush import Brush
 from ..qmap.Face import Face
-from ..func.Helpers import newPath
+from ..qmap.Geometry import MapGeometry, Offsets, Ranges
+from ..qmap.MaterialRegistry import MaterialRegistry
+from .MaterialBuilder import DIFFUSE_NODE
 
-def BuildBrushGeo(brush: Brush, entity: int, brushID: int):
+def GetMaterial(materialID: int, materials: MaterialRegistry) -> Tuple[bpy.types.Material, Vector]:
+    """
+    Returns the Blender material of a material id and the size of its texture,
+    or None for the size if it isn't known, or the material wasn't found and the "404" material is returned.
+    """
+
+    matName = materials.GetPath(materialID)
+    if matName not in bpy.data.materials:
+        return bpy.data.materials["404"], None
+
+    material = bpy.data.materials[matName]
+    texSize = materials.GetSize(materialID)
+
+    if texSize is None:
+        node = material.node_tree.nodes.get(DIFFUSE_NODE)
+        image = node.image if node is not None else None
+
+        # without an image, or with one Blender couldn't load, faces keep their size
+        if image is not None and image.size[0] != 0 and image.size[1] != 0:
+            texSize = Vector(image.size)
+            materials.SetSize(materialID, texSize)
+
+    return material, texSize
+
+def GetFaceMaterial(face: Face, materials: MaterialRegistry) -> Tuple[bpy.types.Material, Vector]:
+    """
+    Returns the Blender material of the face and the size of its texture.
+    """
+
+    material, texSize = GetMaterial(face.materialID, materials)
+    return material, texSize if texSize is not None else face.texSize
+
+def GetBrushMaterials(brush: Brush, materials: MaterialRegistry) -> List[bpy.types.Material]:
+    """
+    Returns the Blender material of each face of the brush.
+
+    Faces get the size of their material's texture. Uvs calculated by `Map.ProcessGeo` are kept,
+    unless the size of any face turned out different, then the uvs of the brush are calculated again once.
+    """
+
+    res = []
+    changed = False
+
+    for face in brush.faces:
+        material, texSize = GetFaceMaterial(face, materials)
+        res.append(material)
+
+        if face.texSize != texSize:
+            face.texSize = texSize
+            changed = True
+        elif len(face.uv_idx) != len(face.vert_idx):
+            changed = True
+
+    if changed:
+        brush.CalculateUVs()
+
+    return res
+
+def BuildBrushGeo(brush: Brush, entity: int, brushID: int, materials: MaterialRegistry):
     brush.CalculateVerts()
-    default_material = bpy.data.materials["404"]
+    faceMaterials = GetBrushMaterials(brush, materials)
+
     for i, face in enumerate(brush.faces):
         if face.material.startswith("common/"):
             continue
@@ -25,26 +88,142 @@ def BuildBrushGeo(brush: Brush, entity: int, brushID: int):
         mesh_data.update()
 
         mesh_obj = bpy.data.objects.new(name=f"ent_{entity}_brush_{brushID}_face_{i}", object_data=mesh_data)
-        
-        matName = newPath(face.material)
-        if matName in bpy.data.materials:
-            material = bpy.data.materials[newPath(face.material)]
-            mesh_obj.data.materials.append(material)
-            face.texSize = Vector(material.node_tree.nodes["Image Texture"].image.size)
-        else:
-            material = default_material
-            mesh_obj.data.materials.append(material)
-
-        face.CalculateUVs()
-        uvs = [Vector((uv.x, -uv.y)) for uv in face.GetUVs()]
+        mesh_obj.data.materials.append(faceMaterials[i])
+
+        # the face is a single polygon, so its loops are its vertices in order
+        uvs = np.array([tuple(uv) for uv in face.GetUVs()], dtype=np.float32).reshape(-1, 2)
+        uvs[:, 1] *= -1.0
+        # loops past the face's lightmap uvs are left at the origin
+        lms = np.zeros((len(verts), 2), dtype=np.float32)
+        lm = np.array([tuple(lm) for lm in face.lm[:len(verts)]], dtype=np.float32).reshape(-1, 2)
+        lms[:len(lm)] = lm
+
         uv_layer = mesh_data.uv_layers.new(name="TextureUV")
+        uv_layer.data.foreach_set("uv", uvs.ravel())
         lm_layer = mesh_data.uv_layers.new(name="LightmapUV")
+        lm_layer.data.foreach_set("uv", lms.ravel())
         lm_layer.active = True
-        
-        for loop in mesh_data.loops:
-            vertex_index = loop.vertex_index
-            uv_layer.data[loop.index].uv = uvs[vertex_index]
-        
+
         bpy.context.scene.collection.objects.link(mesh_obj)
 
-        face.lm = [lm.uv for lm in mesh_data.uv_layers["LightmapUV"].data]
+def UpdateTextureSizes(geometry: MapGeometry, faces: np.ndarray, sizes: Dict[int, Vector]) -> None:
+    """
+    Gives the faces of the store the texture sizes known for their materials.
+
+    Uvs calculated by `Map.ProcessGeo` are kept, unless the size of a face turned out different,
+    then the uvs of every brush with such a face are calculated again in one `MapGeometry.CalculateUVs` call.
+    """
+
+    known = {id: size for id, size in sizes.items() if size is not None}
+    ids = np.array(list(known.keys()), dtype=np.int32)
+    texSizes = np.array([tuple(size) for size in known.values()], dtype=np.float32).reshape(-1, 2)
+
+    # material ids of the faces, as indices into ids
+    lookup = np.full(len(geometry.materials), -1, dtype=np.int32)
+    lookup[ids] = np.arange(len(ids), dtype=np.int32)
+    found = lookup[geometry.faceMaterial[faces]]
+    sized = faces[found != -1]
+    newSizes = texSizes[found[found != -1]]
+
+    changed = geometry.faceUVStart[faces + 1] - geometry.faceUVStart[faces] != geometry.faceVertStart[faces + 1] - geometry.faceVertStart[faces]
+    changed[found != -1] |= np.any(geometry.texSizes[sized] != newSizes, axis=1)
+    geometry.texSizes[sized] = newSizes
+
+    if changed.any():
+        geometry.CalculateUVs(np.unique(geometry.faceBrush[faces[changed]]))
+
+def BuildEntityGeo(geometry: MapGeometry, entity: int, materials: MaterialRegistry, splitMaterials: bool = False) -> List[bpy.types.Object]:
+    """
+    Puts the brush faces of an entity into a single mesh with a material slot per material,
+    or into a mesh per material if `splitMaterials` is set.
+
+    The mesh is built from the buffers of the map's `MapGeometry`, vertices are shared by the faces of the same brush.
+    Mesh data is written with `foreach_set` from flat arrays instead of looping over loops in Python.
+    """
+
+    brushes = np.flatnonzero(geometry.brushEntity == entity)
+    faces = Ranges(geometry.brushFaceStart[brushes], geometry.brushFaceStart[brushes + 1])
+
+    # Blender materials are looked up once per material instead of once per face
+    ids = np.unique(geometry.faceMaterial[faces]).tolist()
+    found = {id: GetMaterial(id, materials) for id in ids}
+    UpdateTextureSizes(geometry, faces, {id: texSize for id, (_, texSize) in found.items()})
+
+    hidden = np.array([material.startswith("common/") for material in geometry.materials], dtype=bool)
+    counts = geometry.faceVertStart[faces + 1] - geometry.faceVertStart[faces]
+    visible = ~hidden[geometry.faceMaterial[faces]] & (counts >= 3)
+    faces, totals = faces[visible], counts[visible].astype(np.int32)
+
+    if len(faces) == 0:
+        return []
+
+    # a slot per Blender material, in the order the materials first appear in the entity
+    names = np.array([found[id][0].name for id in geometry.faceMaterial[faces].tolist()], dtype=object)
+    slotNames, first, slots = np.unique(names, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    rank = np.empty(len(order), dtype=np.int32)
+    rank[order] = np.arange(len(order), dtype=np.int32)
+    slots = rank[slots.reshape(-1)]
+    slotList = [bpy.data.materials[name] for name in slotNames[order].tolist()]
+
+    loops = Ranges(geometry.faceVertStart[faces], geometry.faceVertStart[faces + 1])
+    loopVerts = geometry.faceVerts[loops]
+    loopUVs = geometry.faceUVs[Ranges(geometry.faceUVStart[faces], geometry.faceUVStart[faces + 1])]
+
+    verts = geometry.verts.astype(np.float32) * np.float32(0.0254)
+    uvs = geometry.uvs[loopUVs].astype(np.float32)
+    uvs[:, 1] *= -1.0 # in place, so the array stays float32 for foreach_set
+    loopLms = np.where(np.repeat(geometry.faceLm[faces], totals)[:, None], geometry.lms[loops], 0.0).astype(np.float32)
+    # face normals point into the brush
+    normals = -geometry.planes[faces, 0:3].astype(np.float32)
+
+    starts = Offsets(totals)[:-1]
+    polyOfLoop = np.repeat(np.arange(len(totals)), totals)
+
+    if not splitMaterials:
+        groups = [(f"ent_{entity}", np.arange(len(faces)))]
+    else:
+        groups = [(f"ent_{entity}_mat_{slot}", np.flatnonzero(slots == slot)) for slot in range(len(slotList))]
+
+    res = []
+
+    for name, polys in groups:
+        meshTotals = totals[polys]
+        meshStarts = Offsets(meshTotals)[:-1]
+
+        # loops of the polygons in this mesh, as indices into the loops of the entity
+        meshLoops = Ranges(starts[polys], starts[polys] + meshTotals)
+        usedVerts, meshLoopVerts = np.unique(loopVerts[meshLoops], return_inverse=True)
+        usedSlots, meshSlots = np.unique(slots[polys], return_inverse=True)
+
+        mesh = bpy.data.meshes.new(f"{name}_data")
+        mesh.vertices.add(len(usedVerts))
+        mesh.vertices.foreach_set("co", verts[usedVerts].ravel())
+        mesh.loops.add(len(meshLoops))
+        mesh.loops.foreach_set("vertex_index", meshLoopVerts.reshape(-1).astype(np.int32))
+        mesh.polygons.add(len(polys))
+        mesh.polygons.foreach_set("loop_start", meshStarts)
+        if bpy.app.version < (4, 0, 0):
+            mesh.polygons.foreach_set("loop_total", meshTotals)
+        mesh.polygons.foreach_set("material_index", meshSlots.reshape(-1).astype(np.int32))
+
+        for slot in usedSlots.tolist():
+            mesh.materials.append(slotList[slot])
+
+        mesh.update(calc_edges=True)
+
+        uv_layer = mesh.uv_layers.new(name="TextureUV")
+        uv_layer.data.foreach_set("uv", uvs[meshLoops].ravel())
+        lm_layer = mesh.uv_layers.new(name="LightmapUV")
+        lm_layer.data.foreach_set("uv", loopLms[meshLoops].ravel())
+        lm_layer.active = True
+
+        if hasattr(mesh, "use_auto_smooth"):
+            mesh.use_auto_smooth = True
+        mesh.normals_split_custom_set(normals[polyOfLoop[meshLoops]])
+
+        obj = bpy.data.objects.new(name=name, object_data=mesh)
+        bpy.context.scene.collection.objects.link(obj)
+        res.append(obj)
+
+    return res
@@ -1,7 +1,9 @@
+import numpy as np
 from os import remove
 from os.path import splitext, basename, dirname, exists
 from struct import pack
-from ..qmap.Map import Map
+from ..qmap.Map import Map, Brush, Patch
+from .PatchBuilder import TessellatePatch
 from .LmapBuilder import GetLightmapData
 from .OctreeBuilder import GetMapBoundingBox, Node
 
@@ -9,7 +11,14 @@ H = "16s" # header length
 KV = "128s" # key/value length
 M = "256s" # material name length
 
-def BuildLevel(mapPath: str, mapData: Map):
+# version of the .lvl layout, written after the header. bump it whenever the layout changes
+# 1: original layout
+# 2: triangle index buffers of each face
+# 3: plane table, and the plane id of each face
+# 4: patch count of each entity, and patches as tessellated grids
+VERSION = 4
+
+def BuildLevel(mapPath: str, mapData: Map, tessellationLevel: int = 8, tolerance: float = None):
     mapDir = dirname(mapPath)
     mapName = basename(mapPath)
     mapName, _ = splitext(mapName)
@@ -24,6 +33,7 @@ def BuildLevel(mapPath: str, mapData: Map):
         write = lambda size, *data: file.write(pack(size, *data))
         # level header
         write(H, b"JDLEVEL")
+        write("i", VERSION)
 
         # material data
         write(H, b"MATERIALS")
@@ -32,7 +42,10 @@ def BuildLevel(mapPath: str, mapData: Map):
         for mat in mapData.materials:
             write(M, bytes(mat, "ASCII"))
 
-        mat_idx = {matname: idx for idx, matname in enumerate(mapData.materials)}
+        # plane table. planes i and i ^ 1 face each other
+        write(H, b"PLANES")
+        write("i", len(mapData.planes))
+        file.write(np.concatenate((mapData.planes.normals, mapData.planes.dists[:, None]), axis=1).astype(np.float32).tobytes())
 
         # lightmap image data
         lmap_image, lmap_pixels = GetLightmapData()
@@ -52,8 +65,13 @@ def BuildLevel(mapPath: str, mapData: Map):
             else:
                 write("6f", *([0.0] * 6))
 
+            # brushes clipped away to nothing have no vertices or bounding box, so they are left out
+            brushes = [geo for geo in entity.geo if isinstance(geo, Brush) and geo.GetBoundingBox() is not None]
+            patches = [geo for geo in entity.geo if isinstance(geo, Patch)]
+
             write("i", len(entity.properties)) # num key/values
-            write("i", len(entity.geo)) # number of brushes. should be 0 for point entities like models, lights etc.
+            write("i", len(brushes)) # number of brushes. should be 0 for point entities like models, lights etc.
+            write("i", len(patches)) # number of patches
             for key, value in entity.properties.items():
                 write(KV, bytes(key, "ASCII"))
                 write(KV, bytes(value, "ASCII"))
@@ -61,37 +79,50 @@ def BuildLevel(mapPath: str, mapData: Map):
             if len(entity.geo) == 0:
                 continue
 
-            for brush in entity.geo:
+            for brush in brushes:
                 # bounding box
                 min, max = brush.GetBoundingBox()
                 write("3f", *min)
                 write("3f", *max)
                 # write vertices
                 write("i", len(brush.verts)) # num verts
-                for vert in brush.verts:
-                    write("3f", *vert)
+                file.write(np.array([tuple(vert) for vert in brush.verts], dtype=np.float32).tobytes())
                 
                 # write uvs
                 write("i", len(brush.uvs)) #num uvs
-                for uv in brush.uvs:
-                    write("2f", *uv)
+                file.write(np.array([tuple(uv) for uv in brush.uvs], dtype=np.float32).tobytes())
+
+                triStart, triVerts, _ = brush.GetTriangles()
                 
                 # write faces
                 write("i", len(brush.faces)) #num faces
-                for face in brush.faces:
-                    write("i", mat_idx[face.material]) # material index
+                for i, face in enumerate(brush.faces):
+                    write("i", face.materialID) # material index
+                    write("i", face.planeID) # plane index
 
                     # face vert indices
                     write("i", len(face.vert_idx)) # num verts
-                    for vert in face.vert_idx:
-                        write("i", vert)
+                    file.write(np.array(face.vert_idx, dtype=np.int32).tobytes())
                     
                     # face uv indices
                     write("i", len(face.uv_idx)) # num uvs
-                    for uv in face.uv_idx:
-                        write("i", uv)
+                    file.write(np.array(face.uv_idx, dtype=np.int32).tobytes())
+
+                    # triangles, as 3 brush vertex indices each
+                    write("i", triStart[i + 1] - triStart[i]) # num triangles
+                    file.write(triVerts[triStart[i]:triStart[i + 1]].tobytes())
 
                     # lightmap uvs
                     write("i", len(face.lm))
                     for lm in face.lm:
                         write("2f", *lm) # lightmap uvs are kept as vectors, not indices
+
+            for patch in patches:
+                write("i", patch.materialID) # material index
+
+                # tessellated 3x3 patches, as grids of positions and uvs
+                grids = TessellatePatch(patch, tessellationLevel, tolerance)
+                write("i", len(grids))
+                for grid in grids:
+                    write("2i", *grid.shape[0:2]) # rows, columns
+                    file.write(grid.astype(np.float32).tobytes())
@@ -1,23 +1,61 @@
 import bpy
-
-def BuildLightmapUVs(lightmap_size=(1024, 1024)) -> None:
-    # deselect all the objects first
-    bpy.ops.object.select_all(action="DESELECT")
-
-    # select all mesh objects generated from map data
-    for object in bpy.data.objects:
-        if object.type == "MESH" and object.name.startswith("ent_"):
-            object.select_set(True)
-
-    bpy.context.view_layer.objects.active = bpy.context.selected_objects[0]
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.uv.lightmap_pack(PREF_IMG_PX_SIZE=lightmap_size[0], PREF_MARGIN_DIV=1.0, PREF_PACK_IN_ONE=True)
-    bpy.ops.object.mode_set(mode='OBJECT')
-
-def CreateLightmapImage(width, height) -> None:
+import numpy as np
+from mathutils import Vector
+from typing import List, Tuple
+from ..qmap.Map import Map, Patch
+from ..qmap.Geometry import Ranges
+from ..qmap.Lightmap import ProjectCharts, PackCharts
+
+def PackLightmaps(mapData: Map, lightmap_size=(1024, 1024), luxelSize: float = 16.0, padding: int = 1, patches: bool = True) -> float:
+    """
+    Gives every visible brush face, and every patch if `patches` is set, its own chart in the lightmap.
+    Fills `lms` and `faceLm` of the map's `MapGeometry`, which is built first if the map doesn't have one, and `Patch.lmAxes`.
+
+    Faces are projected along their plane and patches are laid out along their control grid, at one texel per `luxelSize` map units,
+    or less if the charts don't fit. Returns the number of map units per texel that was used.
+    """
+
+    geometry = mapData.geometry if mapData.geometry is not None else mapData.BuildGeometry()
+    patchList: List[Patch] = [geo for entity in mapData.entities for geo in entity.geo if isinstance(geo, Patch) and patches]
+
+    hidden = np.array([material.startswith("common/") for material in geometry.materials], dtype=bool)
+    counts = np.diff(geometry.faceVertStart)
+    faces = np.flatnonzero(~hidden[geometry.faceMaterial] & (counts >= 3))
+    corners = Ranges(geometry.faceVertStart[faces], geometry.faceVertStart[faces + 1])
+    chartOf = np.repeat(np.arange(len(faces)), counts[faces])
+    geometry.faceLm[:] = False
+
+    coords, sizes = ProjectCharts(geometry.verts[geometry.faceVerts[corners]].astype(np.float64), chartOf, geometry.planes[faces, 0:3])
+
+    # patches are as wide as their longest row of control points and as tall as their longest column
+    patchSizes = np.zeros((len(patchList), 2))
+    for i, patch in enumerate(patchList):
+        grid = patch.GetGrid()[..., 0:3]
+        patchSizes[i] = (
+            np.linalg.norm(np.diff(grid, axis=1), axis=2).sum(axis=1).max(),
+            np.linalg.norm(np.diff(grid, axis=0), axis=2).sum(axis=0).max()
+        )
+
+    atlas = np.array(lightmap_size, dtype=np.float64)
+    offsets, turned, scale = PackCharts(np.concatenate((sizes, patchSizes)), lightmap_size, 1.0 / luxelSize, padding)
+
+    coords = np.where(turned[chartOf, None], coords[:, ::-1], coords)
+    geometry.lms[corners] = (coords * scale + offsets[chartOf]) / atlas
+    geometry.faceLm[faces] = True
+
+    for i, patch in enumerate(patchList):
+        chart = len(faces) + i
+        across, down = (patchSizes[i] * scale).tolist()
+
+        # the columns of a turned patch run along v and its rows along u
+        cols, rows = ((0.0, across), (down, 0.0)) if turned[chart] else ((across, 0.0), (0.0, down))
+        patch.lmAxes = np.array((offsets[chart], cols, rows)) / atlas
+
+    return 1.0 / scale
+
+def CreateLightmapImage(width, height) -> bpy.types.Image:
     image = bpy.data.images.new(name="LightmapImage", width=width, height=height)
-    pixels = [1.0] * (width * height * 4)
-    image.pixels = pixels
+    image.pixels.foreach_set(np.ones(width * height * 4, dtype=np.float32))
 
     return image
 
@@ -38,7 +76,15 @@ def BakeLightmap():
     bpy.data.scenes["Scene"].cycles.volume_bounces = 0
     bpy.data.scenes["Scene"].cycles.transparent_max_bounces = 0
 
-    bpy.ops.object.bake(type="DIFFUSE")
+    # bake all mesh objects generated from map data
+    bpy.ops.object.select_all(action="DESELECT")
+    objects = [object for object in bpy.data.objects if object.type == "MESH" and object.name.startswith("ent_")]
+    for object in objects:
+        object.select_set(True)
+
+    if len(objects) != 0:
+        bpy.context.view_layer.objects.active = objects[0]
+        bpy.ops.object.bake(type="DIFFUSE")
 
     bpy.ops.object.select_all(action="DESELECT")
 
@@ -66,8 +112,16 @@ def BakeLightmap():
     new_lightmap_image.select = True
     nodes.active = new_lightmap_image
 
-def GetLightmapData():
+def GetLightmapData() -> Tuple[bpy.types.Image, memoryview]:
+    """
+    Returns the lightmap image and its pixels as 8 bit RGB, without alpha, in a buffer that can be written to a file as is.
+    """
+
     image = bpy.data.images["LightmapImage"]
-    pixels = bytearray([int(p * 255) for i, p in enumerate(image.pixels) if (i + 1) % 4 != 0])
-    
-    return image, pixels
+    pixels = np.empty(len(image.pixels), dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+
+    # truncated like int(p * 255) was
+    rgb = (np.clip(pixels.reshape(-1, 4)[:, 0:3], 0.0, 1.0) * 255.0).astype(np.uint8)
+
+    return image, memoryview(rgb).cast("B")
@@ -1,105 +1,179 @@
 import bpy
 import os
+import zlib
+from struct import error as StructError
+from zipfile import BadZipFile
+from mathutils import Vector
+from typing import Dict
 from ..qmap.Map import Map
-from ..func.Helpers import newPath
+from ..qmap.FileSystem import GameFileSystem
+from ..qmap.TextureIndex import TextureIndex
+from ..level.ShaderIndex import ShaderIndex
 from .LmapBuilder import CreateLightmapImage
 
+TEMPLATE_NAME = "mapcompiler_template"
+
+# names of the template nodes that are changed in the copies
+DIFFUSE_NODE = "Diffuse Texture"
+DIFFUSE_SHADER_NODE = "Diffuse"
+
+def CreateTemplateMaterial(lightmapImage) -> bpy.types.Material:
+    """
+    Builds the node tree every map material uses once, so the materials can be copies of it instead of being built node by node.
+
+    The diffuse texture is mixed with the lightmap, which is read with the LightmapUV layer.
+    """
+
+    # Create a new material and set it up
+    material = bpy.data.materials.new(name=TEMPLATE_NAME)
+    material.use_nodes = True
+    nodes = material.node_tree.nodes
+
+    for node in nodes:
+        nodes.remove(node)
+
+    # Create a texture node for the diffuse image. copies of the template set its image
+    tex_node = nodes.new(type="ShaderNodeTexImage")
+    tex_node.name = DIFFUSE_NODE
+
+    # Create a diffuse node and an output node
+    diffuse_node = nodes.new(type="ShaderNodeBsdfDiffuse")
+    diffuse_node.name = DIFFUSE_SHADER_NODE
+    output_node = nodes.new(type="ShaderNodeOutputMaterial")
+    links = material.node_tree.links
+    links.new(tex_node.outputs["Color"], diffuse_node.inputs["Color"])
+    links.new(diffuse_node.outputs["BSDF"], output_node.inputs["Surface"])
+
+    # Create a texture node for the lightmap and set its image to the blank image we created earlier
+    lmap_img_node = nodes.new(type="ShaderNodeTexImage")
+    lmap_img_node.image = lightmapImage
+
+    # create a uv map node and set its uv layer
+    uv_node = nodes.new(type="ShaderNodeUVMap")
+    uv_node.uv_map = "LightmapUV"
+
+    # link the lightmap image and the uv node
+    links.new(uv_node.outputs["UV"], lmap_img_node.inputs["Vector"])
+
+    # set the lightmap image as the active node
+    nodes.active = lmap_img_node
+
+    # create a shader for lightmap
+    lmap_diffuse_node = nodes.new(type="ShaderNodeBsdfDiffuse")
+    lmap_output_node = nodes.new(type="ShaderNodeOutputMaterial")
+    links.new(lmap_img_node.outputs["Color"], lmap_diffuse_node.inputs["Color"])
+    links.new(lmap_diffuse_node.outputs["BSDF"], lmap_output_node.inputs["Surface"])
+
+    # create mix shader to mix diffuse and lightmap
+    mix_node = nodes.new(type="ShaderNodeMixShader")
+    mix_output_node = nodes.new(type="ShaderNodeOutputMaterial")
+
+    links.new(mix_output_node.inputs["Surface"], mix_node.outputs["Shader"])
+    links.new(mix_node.inputs[1], diffuse_node.outputs["BSDF"])
+    links.new(mix_node.inputs[2], lmap_diffuse_node.outputs["BSDF"])
+
+    return material
+
+def CopyTemplateMaterial(template: bpy.types.Material, name: str, image) -> bpy.types.Material:
+    material = template.copy()
+    material.name = name
+    material.node_tree.nodes[DIFFUSE_NODE].image = image
+    return material
+
 # material with checker texture used by objects with no material to be found
-def CreateDefaultMaterial():
-        # Create a new material and set it up
-        material = bpy.data.materials.new(name="404")
-        material.use_nodes = True
-        nodes = material.node_tree.nodes
+def CreateDefaultMaterial(template: bpy.types.Material) -> bpy.types.Material:
+    material = CopyTemplateMaterial(template, "404", None)
+    nodes = material.node_tree.nodes
 
-        for node in nodes:
-            nodes.remove(node)
+    # replace the diffuse image with a checker texture
+    nodes.remove(nodes[DIFFUSE_NODE])
+    tex_node = nodes.new(type="ShaderNodeTexChecker")
+    material.node_tree.links.new(tex_node.outputs["Color"], nodes[DIFFUSE_SHADER_NODE].inputs["Color"])
 
-        # Create a texture node for the diffuse image and set its image to the file we found
-        tex_node = nodes.new(type="ShaderNodeTexChecker")
+    return material
 
-        # Create a diffuse node and an output node
-        diffuse_node = nodes.new(type="ShaderNodeBsdfDiffuse")
-        output_node = nodes.new(type="ShaderNodeOutputMaterial")
-        links = material.node_tree.links
-        links.new(tex_node.outputs["Color"], diffuse_node.inputs["Color"])
-        links.new(diffuse_node.outputs["BSDF"], output_node.inputs["Surface"])
+class ImageCache:
+    """
+    Images loaded during an import, keyed by their path in the game file system, so every file is read once
+    no matter how many materials use it.
 
-        # Create a texture node for the lightmap and set its image to the blank image we created earlier
-        lightmap_node = nodes.new(type="ShaderNodeTexImage")
-        lightmap_node.image = bpy.data.images["LightmapImage"]
+    Loose files are loaded from disk. Files in archives are packed into the image from memory, without extracting them.
+    Errors reading a file are raised, and nothing is kept for it.
+    """
 
-        # create a uv map node and set its uv layer
-        uv_node = nodes.new(type="ShaderNodeUVMap")
-        uv_node.uv_map = "LightmapUV"
+    __slots__ = ("fs", "images")
 
-        # link the lightmap image and the uv node
-        links.new(uv_node.outputs["UV"], lightmap_node.inputs["Vector"])
+    fs: GameFileSystem
+    images: Dict[str, bpy.types.Image]
 
-        # set the lightmap image as the active node
-        nodes.active = lightmap_node
+    def __init__(self, fs: GameFileSystem) -> None:
+        self.fs = fs
+        self.images = {}
 
-def BuildMaterials(mapData: Map, game_path: str, lightmapImageSize=(1024, 1024)):
-    lightmapImage = CreateLightmapImage(*lightmapImageSize)
-    CreateDefaultMaterial()
+    def Load(self, path: str) -> bpy.types.Image:
+        image = self.images.get(path)
 
-    extensions = ["tga", "jpg", "png"]
+        if image is not None:
+            return image
 
-    # Loop through all the materials in mapData.materials
-    for material in mapData.materials:
-        matName = newPath(material)
-        file = None
-        for ext in extensions:
-            if os.path.exists(f"{game_path}/textures/{material}.{ext}"):
-                file = f"{game_path}/textures/{material}.{ext}"
-                break
+        file = self.fs.GetFilePath(path)
 
-        if file is None:
-            print(f"Can't find material {material}")
-            continue
+        if file is not None:
+            image = bpy.data.images.load(file, check_existing=True)
+        else:
+            data = self.fs.ReadFile(path)
+            image = bpy.data.images.new(os.path.basename(path), 1, 1)
+            image.pack(data=data, data_len=len(data))
+            image.source = "FILE"
+
+        self.images[path] = image
+        return image
 
-        # Create a new material and set it up
-        material = bpy.data.materials.new(name=matName)
-        material.use_nodes = True
-        nodes = material.node_tree.nodes
+def FindTexture(material: str, textures: TextureIndex, shaders: ShaderIndex) -> str:
+    """
+    Returns the image file of a material: the image of its shader if there is one, otherwise the image with the same name.
+    """
 
-        for node in nodes:
-            nodes.remove(node)
+    shader = shaders.Find(f"textures/{material}")
+    texture = None if shader is None else shader.GetTexture()
 
-        # Create a texture node for the diffuse image and set its image to the file we found
-        tex_node = nodes.new(type="ShaderNodeTexImage")
-        tex_node.image = bpy.data.images.load(file)
+    if texture is not None:
+        file = textures.FindPath(texture)
+        if file is not None:
+            return file
 
-        # Create a diffuse node and an output node
-        diffuse_node = nodes.new(type="ShaderNodeBsdfDiffuse")
-        output_node = nodes.new(type="ShaderNodeOutputMaterial")
-        links = material.node_tree.links
-        links.new(tex_node.outputs["Color"], diffuse_node.inputs["Color"])
-        links.new(diffuse_node.outputs["BSDF"], output_node.inputs["Surface"])
+    return textures.Find(material)
 
-        # Create a texture node for the lightmap and set its image to the blank image we created earlier
-        lmap_img_node = nodes.new(type="ShaderNodeTexImage")
-        lmap_img_node.image = lightmapImage
+def BuildMaterials(mapData: Map, game_path: str, lightmapImageSize=(1024, 1024)):
+    lightmapImage = CreateLightmapImage(*lightmapImageSize)
+    template = CreateTemplateMaterial(lightmapImage)
+    CreateDefaultMaterial(template)
 
-        # create a uv map node and set its uv layer
-        uv_node = nodes.new(type="ShaderNodeUVMap")
-        uv_node.uv_map = "LightmapUV"
+    textures = TextureIndex.Get(game_path)
+    shaders = ShaderIndex.Get(game_path)
+    images = ImageCache(textures.fs)
+
+    # Loop through all the materials in mapData.materials
+    for matID, material in enumerate(mapData.materials):
+        matName = mapData.materials.GetPath(matID)
+        file = FindTexture(material, textures, shaders)
 
-        # link the lightmap image and the uv node
-        links.new(uv_node.outputs["UV"], lmap_img_node.inputs["Vector"])
+        if file is None:
+            print(f"Can't find material {material}")
+            continue
 
-        # set the lightmap image as the active node
-        nodes.active = lmap_img_node
+        # files that can't be read, like broken archives, fall back to the "404" material too
+        try:
+            image = images.Load(file)
+        except (OSError, zlib.error, StructError, BadZipFile, RuntimeError) as e:
+            print(f"Can't find material {material}: {e}")
+            continue
 
-        # create a shader for lightmap
-        lmap_diffuse_node = nodes.new(type="ShaderNodeBsdfDiffuse")
-        lmap_output_node = nodes.new(type="ShaderNodeOutputMaterial")
-        links.new(lmap_img_node.outputs["Color"], lmap_diffuse_node.inputs["Color"])
-        links.new(lmap_diffuse_node.outputs["BSDF"], lmap_output_node.inputs["Surface"])
+        # copy the template and set its image to the file we found
+        CopyTemplateMaterial(template, matName, image)
 
-        # create mix shader to mix diffuse and lightmap
-        mix_node = nodes.new(type="ShaderNodeMixShader")
-        mix_output_node = nodes.new(type="ShaderNodeOutputMaterial")
+        # the size is read from the file header, so Blender doesn't have to decode the image yet
+        size = textures.fs.GetImageSize(file)
+        mapData.materials.SetSize(matID, Vector(size if size is not None else image.size))
 
-        links.new(mix_output_node.inputs["Surface"], mix_node.outputs["Shader"])
-        links.new(mix_node.inputs[1], diffuse_node.outputs["BSDF"])
-        links.new(mix_node.inputs[2], lmap_diffuse_node.outputs["BSDF"])
+    bpy.data.materials.remove(template)
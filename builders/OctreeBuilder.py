@@ -1,25 +1,47 @@
+import numpy as np
 from mathutils import Vector
-from ..qmap.Map import Map
+from ..qmap.Map import Map, Patch
 from ..octree.Octree import Node, AABB
 from ..func.Helpers import VecMin, VecMax
 from typing import Tuple
 
 def GetMapBoundingBox(map: Map) -> AABB:
-    map_min, map_max = map.entities[0].geo[0].verts[0], map.entities[0].geo[0].verts[0]
+    if map.geometry is not None:
+        return GetGeometryBoundingBox(map)
 
+    map_min, map_max = None, None
+
+    for entity in map.entities:
+        if entity.boundingBox is not None:
+            boxes = [entity.boundingBox]
+        else:
+            # brushes and patches. empty brushes have no bounding box
+            boxes = [box for box in (geo.GetBoundingBox() for geo in entity.geo) if box is not None]
+
+        for geo_min, geo_max in boxes:
+            map_min = geo_min if map_min is None else VecMin(geo_min, map_min)
+            map_max = geo_max if map_max is None else VecMax(geo_max, map_max)
+
+    return map_min, map_max
+
+def GetGeometryBoundingBox(map: Map) -> AABB:
+    """
+    Same as `GetMapBoundingBox`, reduced over the vertex array of the map's `MapGeometry`.
+    """
+
+    points = [map.geometry.verts]
     for entity in map.entities:
         if entity.boundingBox is not None:
-            ent_min, ent_max = entity.boundingBox
-            map_min = VecMin(ent_min, map_min)
-            map_max = VecMax(ent_max, map_max)
+            points.append(np.array([tuple(entity.boundingBox[0]), tuple(entity.boundingBox[1])], dtype=np.float32))
             continue
 
+        # patches aren't in the store
         for geo in entity.geo:
-            geo_min, geo_max = geo.GetBoundingBox()
-            map_min = VecMin(geo_min, map_min)
-            map_max = VecMax(geo_max, map_max)
+            if isinstance(geo, Patch) and len(geo.verts) != 0:
+                points.append(geo.GetGrid()[..., 0:3].reshape(-1, 3).astype(np.float32))
 
-    return map_min, map_max
+    points = np.concatenate(points)
+    return Vector(points.min(axis=0).tolist()), Vector(points.max(axis=0).tolist())
 
 def BuildeOctree(map: Map) -> Node:
     mapBoundingBox = GetMapBoundingBox(map)
@@ -27,8 +49,9 @@ def BuildeOctree(map: Map) -> Node:
 
     for entity in map.entities:
         if len(entity.geo) != 0:
-            for geo in entity.geo:
-                res.InsertMapObject(geo)
+            for i, geo in enumerate(entity.geo):
+                # patches have no id of their own
+                res.InsertMapObject(geo, (entity.id, i))
         else:
             if "origin" in entity:
                 res.InsertMapObject(entity)
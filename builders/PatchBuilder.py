@@ -1,88 +1,83 @@
 import bpy
-from mathutils import Vector
-from ..qmap.Patch import PatchVert, Patch
-from ..func.Helpers import newPath
-
-def binomialCoefficient(n, k):
-    coeff = 1
-    for i in range(k):
-        coeff *= (n - i)
-        coeff //= (i + 1)
-    return coeff
-
-def evaluateQuadraticBezierPatch(controlPoints, u, v):
-    p = PatchVert(Vector((0.0, 0.0, 0.0)), Vector((0.0, 0.0)))
-
-    for i in range(3):
-        q = PatchVert(Vector((0.0, 0.0, 0.0)), Vector((0.0, 0.0)))
-        for j in range(3):
-            q += controlPoints[i][j] * (binomialCoefficient(2, j) * pow(u, j) * pow(1.0 - u, 2 - j))
-        p += q * (binomialCoefficient(2, i) * pow(v, i) * pow(1.0 - v, 2 - i))
-
-    return p
-
-def tesselatePatch(controlPoints, tessellationLevel):
-
-    # create a grid of vertices
-    vertices = []
-    for y in range(tessellationLevel + 1):
-        for x in range(tessellationLevel + 1):
-            u = float(x) / float(tessellationLevel)
-            v = float(y) / float(tessellationLevel)
-
-            p = evaluateQuadraticBezierPatch(controlPoints, u, v)
-            vertices.append(p)
-    
-    return vertices
-
-def create_mesh(patch_data: Patch, entity: int, patchID: int, patchNum: int, tessellationLevel: int, material: str):
-    vertices = []
-    triangles = []
-    # tesselate the patch and create vertices and indices
-    vertices = tesselatePatch(patch_data, tessellationLevel)
-
-    for y in range(tessellationLevel):
-        for x in range(tessellationLevel):
-            i0 = y * (tessellationLevel + 1) + x
-            i1 = i0 + 1
-            i2 = i0 + (tessellationLevel + 1)
-            i3 = i2 + 1
-
-            triangles.append((i0, i2, i1))
-            triangles.append((i1, i2, i3))
-
-    # create mesh object and add geometry
-    mesh = bpy.data.meshes.new(f"ent_{entity}_patch_{patchID}_{patchNum}_data")
-    obj = bpy.data.objects.new(f"ent_{entity}_patch_{patchID}_{patchNum}", mesh)
-
-    # set object location and scene
-    bpy.context.scene.collection.objects.link(obj)
+import numpy as np
+from ..qmap.Patch import Patch
+from ..qmap.MaterialRegistry import MaterialRegistry
+from ..qmap.GeoCache import GeometryCache
+from ..qmap.Bezier import GetGridTriangles, GetPatchLevels, JoinGrids, TessellateGridLevels
+from typing import List
+
+def TessellatePatch(patchData: Patch, tessellationLevel: int, tolerance: float = None) -> List[np.ndarray]:
+    """
+    Tessellates every 3x3 patch of a patch, batching the ones with the same levels.
+
+    Without a `tolerance` every 3x3 patch is tessellated at `tessellationLevel`.
+    With one, the levels are picked so the surface is never further than `tolerance` map units from the tessellation, up to `tessellationLevel`. See `GetPatchLevels`.
+
+    Returns an (H, W, 5) grid of positions and uvs per 3x3 patch, in the order of `Patch.Slice`.
+    """
+
+    grid = patchData.GetGrid()
+    cache = GeometryCache.active
+    key = None
+
+    if cache is not None:
+        key, ref = GeometryCache.PatchKey(grid, tessellationLevel, tolerance)
+        hit = cache.Get(key)
+
+        if hit is not None:
+            return [g + (*ref, 0.0, 0.0) for g in hit]
+
+    res = TessellateGridLevels(grid, *GetPatchLevels(grid, tessellationLevel, tolerance))
+
+    if key is not None:
+        cache.Put(key, tuple(g - (*ref, 0.0, 0.0) for g in res))
+
+    return res
+
+def BuildPatchGeo(patchData: Patch, entity: int, patchID: int, tessellationLevel: int, materials: MaterialRegistry, tolerance: float = None) -> bpy.types.Object:
+    """
+    Puts a patch into a single mesh, with the seams between its 3x3 patches welded.
+
+    Mesh data is written with `foreach_set`, without operators or changing the selection.
+    """
+
+    # tessellate all the 3x3 patches of the patch at once and join them into one grid
+    grids = TessellatePatch(patchData, tessellationLevel, tolerance)
+    grid = JoinGrids(grids, (len(patchData.verts[0]) - 1) // 2)
+
+    triangles = GetGridTriangles(grid.shape[1], grid.shape[0])
+    vertices = grid.reshape(-1, 5)
+    name = f"ent_{entity}_patch_{patchID}"
+
+    mesh = bpy.data.meshes.new(f"{name}_data")
+    mesh.vertices.add(len(vertices))
+    mesh.vertices.foreach_set("co", (vertices[:, 0:3] * 0.0254).astype(np.float32).ravel())
+    mesh.loops.add(triangles.size)
+    mesh.loops.foreach_set("vertex_index", triangles.ravel())
+    mesh.polygons.add(len(triangles))
+    mesh.polygons.foreach_set("loop_start", np.arange(0, triangles.size, 3, dtype=np.int32))
+    if bpy.app.version < (4, 0, 0):
+        mesh.polygons.foreach_set("loop_total", np.full(len(triangles), 3, dtype=np.int32))
+
+    matName = materials.GetPath(patchData.materialID)
+    if matName in bpy.data.materials:
+        mesh.materials.append(bpy.data.materials[matName])
+
+    mesh.update(calc_edges=True)
 
-    # add vertices and faces to mesh
-    mesh.from_pydata([v.pos * 0.0254 for v in vertices], [], triangles)
     uv_layer = mesh.uv_layers.new(name="TextureUV")
+    uv_layer.data.foreach_set("uv", vertices[triangles.ravel(), 3:5].astype(np.float32).ravel())
     lm_layer = mesh.uv_layers.new(name="LightmapUV")
     lm_layer.active = True
-    for loop_index, loop in enumerate(mesh.loops):
-        vertex_index = loop.vertex_index
-        uv_layer.data[loop_index].uv = vertices[vertex_index].uv
-    mesh.update()
-    matName = newPath(material)
-    if matName in bpy.data.materials:
-        material = bpy.data.materials[matName]
-        obj.data.materials.append(material)
-    return obj
 
-def BuildPatchGeo(patchData: Patch, entity: int, patchID: int, tessellationLevel: int):
-    # slice patch into smaller 3x3 patches
-    patches = patchData.Slice()
-    patchObjs = []
-    for i, row in enumerate(patches):
-        for j, patch in enumerate(row):
-            obj = create_mesh(patch, entity, patchID, (i * len(row)) + j, tessellationLevel, patchData.material)
-            obj.select_set(True)
-    
-    bpy.context.view_layer.objects.active = bpy.context.selected_objects[0]
-    bpy.ops.object.join()
-    bpy.context.selected_objects[0].name = f"ent_{entity}_patch_{patchID}"
-    bpy.ops.object.select_all(action="DESELECT")
+    # lightmap uvs follow the rows and columns of the grid, inside the chart PackLightmaps gave the patch
+    if patchData.lmAxes is not None:
+        rows, cols = np.meshgrid(np.linspace(0.0, 1.0, grid.shape[0]), np.linspace(0.0, 1.0, grid.shape[1]), indexing="ij")
+        origin, across, down = patchData.lmAxes
+        lms = origin + cols.reshape(-1, 1) * across + rows.reshape(-1, 1) * down
+        lm_layer.data.foreach_set("uv", lms[triangles.ravel()].astype(np.float32).ravel())
+
+    obj = bpy.data.objects.new(name=name, object_data=mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    patchData.bpy_obj = obj
+    return obj
@@ -9,6 +9,8 @@ def Str2Vec(string: str):
 from pathlib import Path
 from os.path import basename, splitext, dirname
 from hashlib import shake_256
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_all_start_methods, get_context
 
 def shortenName(name: str, length=13):
     name = splitext(basename(name).strip())[0]
@@ -38,3 +40,16 @@ def VecMax(v1: Vector, v2: Vector):
         max(v1.y, v2.y),
         max(v1.z, v2.z),
     ))
+
+def CreatePool(workers: int) -> ProcessPoolExecutor:
+    """
+    Creates a process pool whose workers are forked from the current process,
+    so they already have the modules Blender loaded and don't have to import `bpy` themselves.
+
+    Returns `None` if the platform can't fork processes.
+    """
+
+    if workers <= 1 or "fork" not in get_all_start_methods():
+        return None
+
+    return ProcessPoolExecutor(max_workers=workers, mp_context=get_context("fork"))
@@ -1,6 +1,11 @@
 from typing import Dict
 
 class Material:
+    """
+    A Quake 3 shader. `shader` is the text of its body and `data` holds its global keywords,
+    and the image of its first texture stage under `map`.
+    """
+
     __slots__ = ("name", "shader", "data")
 
     name: str
@@ -11,3 +16,10 @@ class Material:
         self.name = name
         self.shader = shader
         self.data = {}
+
+    def GetTexture(self) -> str:
+        """
+        Returns the path of the image that shows the material best, or `None` if it doesn't have one.
+        """
+
+        return self.data.get("qer_editorimage") or self.data.get("map")
@@ -0,0 +1,277 @@
+import os
+import re
+import zlib
+from struct import pack, unpack, calcsize, error as StructError
+from tempfile import gettempdir
+from typing import Dict, List, Tuple
+from .Material import Material
+from ..qmap.Cache import WriteString, ReadString
+from ..qmap.FileSystem import GameFileSystem
+from ..func.Helpers import shortenPath
+
+MAGIC = b"SHDINDEX"
+VERSION = 1
+HEADER = "<8si" # magic, version
+
+# comments, braces, quoted strings and words
+TOKEN = re.compile(r'//[^\n]*|/\*.*?\*/|[{}]|"[^"]*"|[^\s{}"]+', re.S)
+
+# stage keywords that take an image, and how many arguments come before it
+STAGE_MAPS = {"map": 0, "clampmap": 0, "animmap": 1}
+
+# name, start and end offsets of the body of each shader in a script
+ScriptShaders = List[Tuple[str, int, int]]
+
+def IndexScript(text: str) -> ScriptShaders:
+    """
+    Finds the shaders of a script without parsing their bodies.
+    """
+
+    res: ScriptShaders = []
+    depth = 0
+    name = None
+    start = 0
+
+    for match in TOKEN.finditer(text):
+        token = match.group()
+
+        if token[0] == "/" and token[1:2] in ("/", "*"):
+            continue
+
+        if token == "{":
+            if depth == 0:
+                start = match.end()
+            depth += 1
+        elif token == "}":
+            depth -= 1
+            if depth == 0 and name is not None:
+                res.append((name, start, match.start()))
+                name = None
+            depth = max(depth, 0)
+        elif depth == 0:
+            name = token.strip('"').replace("\\", "/").lower()
+
+    return res
+
+def ParseShader(name: str, body: str) -> Material:
+    """
+    Parses the body of a shader into a `Material`.
+    """
+
+    res = Material(name, body)
+    depth = 1
+
+    for line in body.splitlines():
+        line = line.split("//", 1)[0].strip()
+
+        for part in re.split(r"([{}])", line):
+            part = part.strip()
+
+            if part == "{":
+                depth += 1
+            elif part == "}":
+                depth -= 1
+            elif part != "":
+                words = part.split()
+                key = words[0].lower()
+
+                if depth == 1:
+                    res.data.setdefault(key, " ".join(words[1:]))
+                elif key in STAGE_MAPS and "map" not in res.data:
+                    images = words[1 + STAGE_MAPS[key]:]
+                    # $lightmap, $whiteimage and the like aren't files
+                    if len(images) != 0 and not images[0].startswith("$"):
+                        res.data["map"] = images[0]
+
+    return res
+
+class ShaderIndex:
+    """
+    Index of the shaders in the `scripts/*.shader` files of a game path, loose or in its archives.
+
+    Indexing only finds where the body of each shader is. Bodies are parsed into a `Material` when a map asks for them.
+    The index is saved with the stamp (modification time or crc) of every script, and only the scripts that changed are indexed again.
+    """
+
+    __slots__ = ("fs", "root", "scripts", "stamps", "shaders", "materials", "texts")
+
+    fs: GameFileSystem
+    root: str
+    scripts: Dict[str, ScriptShaders] # script path -> shaders in it
+    stamps: Dict[str, int] # script path -> stamp of its file in `fs`
+    shaders: Dict[str, Tuple[str, int, int]] # shader name -> script path, body offsets
+    materials: Dict[str, Material] # shaders that were parsed so far
+    texts: Dict[str, str] # scripts that were read to parse their shaders
+
+    # indices of the game paths that were used so far
+    loaded: Dict[str, 'ShaderIndex'] = {}
+
+    def __init__(self, fs: GameFileSystem) -> None:
+        self.fs = fs
+        self.root = fs.root
+        self.scripts = {}
+        self.stamps = {}
+        self.shaders = {}
+        self.materials = {}
+        self.texts = {}
+
+    def __len__(self) -> int:
+        return len(self.shaders)
+
+    def __contains__(self, name: str) -> bool:
+        return name.replace("\\", "/").strip().lower() in self.shaders
+
+    def GetScriptStamps(self) -> Dict[str, int]:
+        return {path: self.fs.GetStamp(path) for path in self.fs if path.startswith("scripts/") and path.endswith(".shader")}
+
+    def ReadScript(self, script: str) -> str:
+        # latin-1 maps every byte to one character, so offsets into the text are offsets into the file
+        return self.fs.ReadFile(script).decode("latin-1")
+
+    def Update(self) -> bool:
+        """
+        Indexes the scripts that were added or changed since the index was built, and drops the removed ones.
+
+        Returns `True` if anything changed.
+        """
+
+        stamps = self.GetScriptStamps()
+
+        if stamps == self.stamps:
+            return False
+
+        for script in list(self.scripts):
+            if stamps.get(script) != self.stamps.get(script):
+                del self.scripts[script]
+
+        for script in stamps:
+            if script not in self.scripts:
+                try:
+                    self.scripts[script] = IndexScript(self.ReadScript(script))
+                except (OSError, zlib.error) as e:
+                    print(f"Can't read shader script {script}: {e}")
+                    self.scripts[script] = []
+
+        self.stamps = stamps
+        self.BuildNames()
+        return True
+
+    def BuildNames(self) -> None:
+        self.shaders.clear()
+        self.materials.clear()
+        self.texts.clear()
+
+        # the first script that defines a shader wins, in name order so it doesn't depend on the file system
+        for script in sorted(self.scripts):
+            for name, start, end in self.scripts[script]:
+                self.shaders.setdefault(name, (script, start, end))
+
+    def Find(self, name: str) -> Material:
+        """
+        Returns the parsed shader, or `None` if no script defines it.
+        """
+
+        name = name.replace("\\", "/").strip().lower()
+        res = self.materials.get(name)
+
+        if res is not None:
+            return res
+
+        shader = self.shaders.get(name)
+
+        if shader is None:
+            return None
+
+        script, start, end = shader
+
+        text = self.texts.get(script)
+
+        if text is None:
+            try:
+                text = self.texts[script] = self.ReadScript(script)
+            except (OSError, zlib.error) as e:
+                print(f"Can't read shader script {script}: {e}")
+                return None
+
+        body = text[start:end]
+
+        res = self.materials[name] = ParseShader(name, body)
+        return res
+
+    def Write(self, path: str) -> None:
+        tmpPath = f"{path}.{os.getpid()}.tmp"
+
+        try:
+            with open(tmpPath, "wb") as file:
+                file.write(pack(HEADER, MAGIC, VERSION))
+                WriteString(file, self.root)
+
+                file.write(pack("<i", len(self.scripts)))
+                for script, shaders in self.scripts.items():
+                    WriteString(file, script)
+                    file.write(pack("<qi", self.stamps[script], len(shaders)))
+                    for name, start, end in shaders:
+                        WriteString(file, name)
+                        file.write(pack("<ii", start, end))
+
+            os.replace(tmpPath, path)
+        except OSError as e:
+            print(f"Can't write shader index {path}: {e}")
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+
+    def Read(self, path: str) -> bool:
+        """
+        Fills the script list of the index from a file written by `Write`. `Update` or `BuildNames` has to be called afterwards.
+        """
+
+        if not os.path.exists(path):
+            return False
+
+        try:
+            with open(path, "rb") as file:
+                magic, version = unpack(HEADER, file.read(calcsize(HEADER)))
+
+                if magic != MAGIC or version != VERSION or ReadString(file) != self.root:
+                    return False
+
+                numScripts, = unpack("<i", file.read(4))
+                for _ in range(numScripts):
+                    script = ReadString(file)
+                    stamp, numShaders = unpack("<qi", file.read(12))
+                    self.stamps[script] = stamp
+                    self.scripts[script] = [(ReadString(file), *unpack("<ii", file.read(8))) for _ in range(numShaders)]
+
+        except (OSError, StructError, UnicodeDecodeError) as e:
+            print(f"Can't read shader index {path}: {e}")
+            self.scripts, self.stamps = {}, {}
+            return False
+
+        return True
+
+    @staticmethod
+    def GetCachePath(root: str) -> str:
+        return os.path.join(gettempdir(), f"mapcompiler_{shortenPath(os.path.abspath(root), 8)}.shaderindex")
+
+    @staticmethod
+    def Get(gamePath: str) -> 'ShaderIndex':
+        """
+        Returns the shader index of a game path, reusing the one from an earlier import or from the disk cache if it can.
+        """
+
+        fs = GameFileSystem.Get(gamePath)
+        index = ShaderIndex.loaded.get(gamePath)
+        cachePath = ShaderIndex.GetCachePath(os.path.join(gamePath, "scripts"))
+
+        if index is None or index.fs is not fs:
+            index = ShaderIndex.loaded[gamePath] = ShaderIndex(fs)
+            index.Read(cachePath)
+
+            if index.Update():
+                index.Write(cachePath)
+            else:
+                index.BuildNames()
+        elif index.Update():
+            index.Write(cachePath)
+
+        return index
@@ -3,6 +3,7 @@ from typing import List, Tuple, Union
 from collections import namedtuple
 from ..qmap.Brush import Brush
 from ..qmap.Entity import Entity
+from ..qmap.Patch import Patch
 from ..func.Helpers import Str2Vec
 
 AABB = Tuple[Vector, Vector]
@@ -30,14 +31,14 @@ class Node:
 
         isParent = extents.x <= 128 or extents.y <= 128 or extents.z <= 128
         offsets = [
-            Vector(0, 0, -1),
-            Vector(0, 1, -1),
-            Vector(1, 0, -1),
-            Vector(1, 1, -1),
-            Vector(0, 0, 0),
-            Vector(0, 1, 0),
-            Vector(1, 0, 0),
-            Vector(1, 1, 0)
+            Vector((0, 0, -1)),
+            Vector((0, 1, -1)),
+            Vector((1, 0, -1)),
+            Vector((1, 1, -1)),
+            Vector((0, 0, 0)),
+            Vector((0, 1, 0)),
+            Vector((1, 0, 0)),
+            Vector((1, 1, 0))
         ]
 
         for offset in offsets:
@@ -45,8 +46,12 @@ class Node:
             max_point = min_point + extents
             self.children.append(Node((min_point, max_point), isParent))
 
-    def CollidesWithBrush(self, brush: Brush):
+    def CollidesWithBrush(self, brush: Union[Brush, Patch]):
         brushAABB = brush.GetBoundingBox()
+
+        if brushAABB is None:
+            return False
+
         return (
             (self.boundingBox[0].x <= brushAABB[1].x and self.boundingBox[1].x >= brushAABB[0].x) and
             (self.boundingBox[0].y <= brushAABB[1].y and self.boundingBox[1].y >= brushAABB[0].y) and
@@ -69,16 +74,21 @@ class Node:
             origin.z >= self.boundingBox[0].z and origin.z <= self.boundingBox[1].z
         )
 
-    def AddObject(self, obj: Union[Entity, Brush]):
-        if obj not in self.objects:
-            self.objects.append(obj.id)
+    def AddObject(self, obj: Union[Entity, Brush, Patch], id=None):
+        id = obj.id if id is None else id
+        if id not in self.objects:
+            self.objects.append(id)
+
+    def InsertMapObject(self, obj: Union[Brush, Patch, Entity], id=None):
+        """
+        Adds the object to every leaf it touches. `id` is stored instead of `obj.id` if it's given.
+        """
 
-    def InsertMapObject(self, obj: Union[Brush, Entity]):
-        collidesWith = self.CollidesWithBrush if isinstance(obj, Brush) else self.CollidesWithEntity
+        collidesWith = self.CollidesWithBrush if isinstance(obj, (Brush, Patch)) else self.CollidesWithEntity
 
         if collidesWith(obj):
             if self.objects is not None:
-                self.AddObject(obj)
+                self.AddObject(obj, id)
             else:
                 for child in self.children:
-                    child.InsertMapObject(obj)
+                    child.InsertMapObject(obj, id)
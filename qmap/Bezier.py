@@ -0,0 +1,135 @@
+import numpy as np
+from functools import lru_cache
+from typing import List, Tuple
+
+@lru_cache(maxsize=None)
+def GetBasis(level: int) -> np.ndarray:
+    """
+    Returns the quadratic Bernstein basis sampled at `level + 1` evenly spaced points, as a (level + 1, 3) array.
+    """
+
+    t = np.linspace(0.0, 1.0, level + 1)
+    res = np.stack(((1.0 - t) ** 2, 2.0 * t * (1.0 - t), t ** 2), axis=1)
+    res.setflags(write=False)
+    return res
+
+@lru_cache(maxsize=None)
+def GetGridTriangles(width: int, height: int) -> np.ndarray:
+    """
+    Returns the triangles of a grid of `width` x `height` vertices as a (T, 3) `int32` array, two per grid cell.
+    """
+
+    y, x = np.meshgrid(np.arange(height - 1), np.arange(width - 1), indexing="ij")
+    i0 = (y * width + x).ravel()
+    i1 = i0 + 1
+    i2 = i0 + width
+    i3 = i2 + 1
+
+    res = np.stack((np.stack((i0, i2, i1), axis=1), np.stack((i1, i2, i3), axis=1)), axis=1).reshape(-1, 3).astype(np.int32)
+    res.setflags(write=False)
+    return res
+
+def GetSubPatches(grid: np.ndarray) -> np.ndarray:
+    """
+    Splits an (H, W, 5) control grid into the 3x3 patches `Patch.Slice` makes, as an (S, 3, 3, 5) array in the same order.
+    """
+
+    height, width = grid.shape[0:2]
+    rows = np.arange(0, height - 2, 2)
+    cols = np.arange(0, width - 2, 2)
+    offsets = np.arange(3)
+
+    r = (rows[:, None, None, None] + offsets[None, None, :, None]) # (R, 1, 3, 1)
+    c = (cols[None, :, None, None] + offsets[None, None, None, :]) # (1, C, 1, 3)
+
+    return grid[r, c].reshape(-1, 3, 3, grid.shape[2])
+
+def TessellateSubPatches(patches: np.ndarray, level: int) -> np.ndarray:
+    """
+    Tessellates (S, 3, 3, K) quadratic patches in one pass.
+
+    Returns an (S, level + 1, level + 1, K) array, with rows along the first control point index like `Patch.verts`.
+    """
+
+    basis = GetBasis(level)
+    return np.einsum("ya,xb,sabk->syxk", basis, basis, patches)
+
+def TessellateGrid(grid: np.ndarray, level: int) -> np.ndarray:
+    """
+    Tessellates every 3x3 patch of an (H, W, 5) control grid of positions and uvs.
+    """
+
+    return TessellateSubPatches(GetSubPatches(grid), level)
+
+def GetCurveLevels(curves: np.ndarray, tolerance: float, maxLevel: int) -> np.ndarray:
+    """
+    Returns how many segments each quadratic curve in an (..., 3, 3) array of control positions needs,
+    so no segment is further than `tolerance` from its chord.
+    """
+
+    # the second derivative of a quadratic curve is constant, so a segment of parameter length 1 / n deviates |p0 - 2 p1 + p2| / (4 n^2) from its chord
+    bend = np.linalg.norm(curves[..., 0, :] - 2.0 * curves[..., 1, :] + curves[..., 2, :], axis=-1)
+    levels = np.ceil(np.sqrt(bend / (4.0 * tolerance)))
+
+    return np.clip(levels, 1, maxLevel).astype(np.int32)
+
+def GetPatchLevels(grid: np.ndarray, level: int, tolerance: float = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the tessellation level of each row and each column of 3x3 patches in an (H, W, 5) control grid.
+
+    Without a `tolerance` every patch uses `level`. With one, each row and column gets the level its most bent curve needs, up to `level`.
+    Patches in the same row or column use the same level, so the edges they share are sampled at the same points and don't crack.
+    """
+
+    numRows, numCols = (grid.shape[0] - 1) // 2, (grid.shape[1] - 1) // 2
+
+    if tolerance is None:
+        return np.full(numRows, level, dtype=np.int32), np.full(numCols, level, dtype=np.int32)
+
+    pos = grid[..., 0:3]
+
+    # curves across each row of patches, one per control column: (numRows, W, 3, 3)
+    rows = np.stack([pos[0:-2:2], pos[1:-1:2], pos[2::2]], axis=2)
+    rowLevels = GetCurveLevels(rows, tolerance, level).max(axis=1)
+
+    # curves across each column of patches, one per control row: (H, numCols, 3, 3)
+    cols = np.stack([pos[:, 0:-2:2], pos[:, 1:-1:2], pos[:, 2::2]], axis=2)
+    colLevels = GetCurveLevels(cols, tolerance, level).max(axis=0)
+
+    return rowLevels, colLevels
+
+def TessellateGridLevels(grid: np.ndarray, rowLevels: np.ndarray, colLevels: np.ndarray) -> List[np.ndarray]:
+    """
+    Tessellates every 3x3 patch of an (H, W, 5) control grid with its own row and column level.
+
+    Patches with the same levels are tessellated together.
+    Returns an (rowLevel + 1, colLevel + 1, 5) array per patch, in the order of `Patch.Slice`.
+    """
+
+    patches = GetSubPatches(grid)
+    numCols = len(colLevels)
+    rowOf = np.repeat(np.arange(len(rowLevels)), numCols)
+    colOf = np.tile(np.arange(numCols), len(rowLevels))
+    pairs = np.stack((rowLevels[rowOf], colLevels[colOf]), axis=1)
+
+    res: List[np.ndarray] = [None] * len(patches)
+
+    for rowLevel, colLevel in np.unique(pairs, axis=0).tolist():
+        idx = np.flatnonzero((pairs[:, 0] == rowLevel) & (pairs[:, 1] == colLevel))
+        grids = np.einsum("ya,xb,sabk->syxk", GetBasis(rowLevel), GetBasis(colLevel), patches[idx])
+
+        for i, g in zip(idx.tolist(), grids):
+            res[i] = g
+
+    return res
+
+def JoinGrids(grids: List[np.ndarray], numCols: int) -> np.ndarray:
+    """
+    Joins the tessellated grids of the 3x3 patches of a patch, in the order of `Patch.Slice`, into a single (H, W, K) grid.
+
+    Neighbouring patches are sampled at the same points along the edge they share, so the first row or column of every patch
+    but the first in each direction is dropped instead of welded.
+    """
+
+    rows = [np.concatenate([grids[r]] + [g[:, 1:] for g in grids[r + 1:r + numCols]], axis=1) for r in range(0, len(grids), numCols)]
+    return np.concatenate([rows[0]] + [row[1:] for row in rows[1:]], axis=0)
@@ -1,7 +1,12 @@
+import numpy as np
 from mathutils import Vector, geometry
 from typing import List, Tuple
 from math import isnan
-from ..func.Helpers import VecMin, VecMax
+from .CSG import GetPlanes, IntersectPlanes, ClipPlanes, WeldWindings, CornersPerFace
+from .Triangles import SortWindings, FanTriangles
+from .UVs import ProjectUVs
+from .Weld import WeldBuffer
+from .GeoCache import GeometryCache
 def GetPlaneIntersectionPoint(face1: 'Face', face2: 'Face', face3: 'Face') -> Vector:
     """
     Calculates the intersecion points of three planes in 3D space.
@@ -16,24 +21,44 @@ def GetPlaneIntersectionPoint(face1: 'Face', face2: 'Face', face3: 'Face') -> Ve
     if line is not None and line[0] is not None:
         return geometry.intersect_line_plane(line[0], line[0] + line[1], face3.p1, face3.GetNormal())
 
+# vertices, uvs, the number of vertex indices and the vertex indices of each face, the number of uv indices and the uv indices of each face,
+# and the texture size of each face
+PackedBrush = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
 class Brush:
     """ Base class that holds all the necessary properties and methods used by a brush. """
-    __slots__ = ("id", "faces", "verts", "uvs", "__boundingBox__")
+    __slots__ = ("id", "__verts__", "__uvs__", "__faces__", "__batch__", "__packed__", "__boundingBox__", "__vertWeld__", "__uvWeld__")
 
     id: Tuple[int, int]
-    faces: List['Face']
-    verts: List[Vector]
-    uvs: List[Vector]
 
+    __verts__: List[Vector]
+    __uvs__: List[Vector]
+    __faces__: List['Face']
+    __batch__: Tuple['FaceBatch', int, int]
+    __packed__: PackedBrush
     __boundingBox__: Tuple[Vector, Vector]
+    __vertWeld__: WeldBuffer
+    __uvWeld__: WeldBuffer
+
+    # engine used by CalculateVerts when none is given. "PYTHON" is the original triple loop, "NUMPY" the batched one,
+    # "CLIP" clips a winding per face against the other planes
+    engine = "NUMPY"
+
+    # vertices and uvs closer than these to each other are merged
+    vertEpsilon = 1e-3
+    uvEpsilon = 1e-5
 
     def __init__(self, brushID: int, entityID: int) -> None:
         self.id = (entityID, brushID)
-        self.faces = []
-        self.verts = []
-        self.uvs = []
 
+        self.__verts__ = []
+        self.__uvs__ = []
+        self.__faces__ = []
+        self.__batch__ = None
+        self.__packed__ = None
         self.__boundingBox__ = None
+        self.__vertWeld__ = None
+        self.__uvWeld__ = None
 
     def __str__(self) -> str:
         res = "{\n"
@@ -45,23 +70,214 @@ class Brush:
 
         return res
 
+    @property
+    def faces(self) -> List['Face']:
+        """
+        The faces of the brush. Faces read into a `FaceBatch` are only created on first access.
+        """
+
+        if self.__faces__ is None:
+            batch, start, end = self.__batch__
+            self.__faces__ = batch.GetFaces(start, end)
+
+            for face in self.__faces__:
+                face.parent = self
+
+            if self.__packed__ is not None:
+                self.Unpack()
+
+        return self.__faces__
+
+    @property
+    def verts(self) -> List[Vector]:
+        if self.__packed__ is not None:
+            self.Unpack()
+
+        return self.__verts__
+
+    @verts.setter
+    def verts(self, value: List[Vector]) -> None:
+        if self.__packed__ is not None:
+            self.Unpack()
+
+        self.__verts__ = value
+
+    @property
+    def uvs(self) -> List[Vector]:
+        if self.__packed__ is not None:
+            self.Unpack()
+
+        return self.__uvs__
+
+    @uvs.setter
+    def uvs(self, value: List[Vector]) -> None:
+        if self.__packed__ is not None:
+            self.Unpack()
+
+        self.__uvs__ = value
+
+    def GetCounts(self) -> Tuple[int, int]:
+        """
+        Returns the number of vertices and uvs of the brush without unpacking them.
+        """
+
+        if self.__packed__ is not None:
+            return len(self.__packed__[0]), len(self.__packed__[1])
+
+        return len(self.__verts__), len(self.__uvs__)
+
+    def IsPacked(self) -> bool:
+        """
+        Checks if the geometry of the brush is only held in the arrays given to `SetPacked`.
+        """
+
+        return self.__packed__ is not None
+
+    def Pack(self) -> PackedBrush:
+        """
+        Returns the calculated geometry of the brush as arrays, see `PackedBrush`.
+        """
+
+        if self.__packed__ is not None:
+            return self.__packed__
+
+        faces = self.faces
+
+        return (
+            np.array([tuple(vert) for vert in self.__verts__], dtype=np.float64).reshape(-1, 3),
+            np.array([tuple(uv) for uv in self.__uvs__], dtype=np.float64).reshape(-1, 2),
+            np.array([len(face.vert_idx) for face in faces], dtype=np.int32),
+            np.array([i for face in faces for i in face.vert_idx], dtype=np.int32),
+            np.array([len(face.uv_idx) for face in faces], dtype=np.int32),
+            np.array([i for face in faces for i in face.uv_idx], dtype=np.int32),
+            np.array([tuple(face.texSize) for face in faces], dtype=np.float64).reshape(-1, 2)
+        )
+
+    def SetPacked(self, packed: PackedBrush) -> None:
+        """
+        Sets the calculated geometry of the brush from the output of `Pack`.
+        The `Vector` lists and face indices are only made from the arrays when they are accessed, see `Unpack`.
+        """
+
+        self.__packed__ = packed
+
+    def Unpack(self) -> None:
+        """
+        Fills `verts`, `uvs` and the `vert_idx`, `uv_idx` and `texSize` of the faces from the arrays given to `SetPacked`.
+        """
+
+        verts, uvs, vertCounts, vertIdx, uvCounts, uvIdx, texSizes = self.__packed__
+        self.__packed__ = None
+        self.__verts__ = [Vector(vert) for vert in verts.tolist()]
+        self.__uvs__ = [Vector(uv) for uv in uvs.tolist()]
+
+        vertIdx, uvIdx = vertIdx.tolist(), uvIdx.tolist()
+        vi, ui = 0, 0
+
+        for face, vertCount, uvCount, size in zip(self.faces, vertCounts.tolist(), uvCounts.tolist(), texSizes.tolist()):
+            face.vert_idx = vertIdx[vi:vi + vertCount]
+            face.uv_idx = uvIdx[ui:ui + uvCount]
+            face.texSize = Vector(size)
+            vi += vertCount
+            ui += uvCount
+
+    def AddFaces(self, batch: 'FaceBatch', start: int, end: int) -> None:
+        """
+        Uses the faces in the range `start:end` of `batch` as the faces of the brush.
+        """
+
+        self.__batch__ = batch, start, end
+        self.__faces__ = None
+
+    def GetFaceBatch(self) -> Tuple['FaceBatch', int, int]:
+        """
+        Returns the batch holding the faces of the brush and their range in it.
+        A new batch is made if the faces were already created.
+        """
+
+        if self.__faces__ is None:
+            return self.__batch__
+
+        return FaceBatch.FromFaces(self.__faces__), 0, len(self.__faces__)
+
+    def GetMaterials(self) -> List[str]:
+        """
+        Returns the material of each face without creating the `Face` objects.
+        """
+
+        if self.__faces__ is None:
+            batch, start, end = self.__batch__
+            return batch.materials[start:end]
+
+        return [face.material for face in self.__faces__]
+
+    def SetMaterialIDs(self, ids: List[int]) -> None:
+        """
+        Sets the material id of each face, in the same order as `GetMaterials`.
+        """
+
+        if self.__faces__ is None:
+            batch, start, end = self.__batch__
+            batch.materialIDs[start:end] = ids
+            return
+
+        for face, id in zip(self.__faces__, ids):
+            face.materialID = id
+
+    def SetPlaneIDs(self, ids: List[int]) -> None:
+        """
+        Sets the plane id of each face.
+        """
+
+        if self.__faces__ is None:
+            batch, start, end = self.__batch__
+            batch.planeIDs[start:end] = ids
+            return
+
+        for face, id in zip(self.__faces__, ids):
+            face.planeID = id
+
     def AddFace(self, face: 'Face') -> None:
         self.faces.append(face)
         face.parent = self
     
-    def AddVert(self, vert: Vector) -> None:
-        for v in self.verts:
-            if v == vert:
-                return
+    def GetVertWeld(self) -> WeldBuffer:
+        """
+        Returns the `WeldBuffer` over `verts`, creating a new one if `verts` was replaced.
+        """
 
-        self.verts.append(vert)
+        weld = self.__vertWeld__
 
-    def AddUV(self, uv: Vector) -> None:
-        for _uv in self.uvs:
-            if uv == _uv:
-                return
+        if weld is None or weld.items is not self.verts:
+            weld = self.__vertWeld__ = WeldBuffer(Brush.vertEpsilon, self.verts)
+
+        return weld
+
+    def GetUVWeld(self) -> WeldBuffer:
+        """
+        Returns the `WeldBuffer` over `uvs`, creating a new one if `uvs` was replaced.
+        """
+
+        weld = self.__uvWeld__
+
+        if weld is None or weld.items is not self.uvs:
+            weld = self.__uvWeld__ = WeldBuffer(Brush.uvEpsilon, self.uvs, 2)
 
-        self.uvs.append(uv)
+        return weld
+
+    def AddVert(self, vert: Vector) -> int:
+        """
+        Adds a vertex to the brush unless there is already one within `vertEpsilon` of it, and returns its index.
+        """
+
+        return self.GetVertWeld().Add(vert)
+
+    def AddUV(self, uv: Vector) -> int:
+        """
+        Adds a uv to the brush unless there is already one within `uvEpsilon` of it, and returns its index.
+        """
+
+        return self.GetUVWeld().Add(uv)
 
     def IsVertLegal(self, vert: Vector) -> bool:
         """
@@ -78,13 +294,189 @@ class Brush:
         return True
 
 
-    def CalculateVerts(self) -> None:
+    def GetPlanePoints(self) -> np.ndarray:
+        """
+        Returns the plane points of the faces as an (N, 9) array.
+        """
+
+        if self.__faces__ is None:
+            batch, start, end = self.__batch__
+            return batch.points[start:end]
+
+        return np.array([(*face.p1, *face.p2, *face.p3) for face in self.__faces__], dtype=np.float64).reshape(-1, 9)
+
+    def CalculateVerts(self, engine: str = None) -> None:
         """
         Compares each brush face with others and calculates their intersection points.
 
         The results of the calculations are stored in a list of vertices in the `Brush` object,
 
         and their indices are referenced by the faces of the brush.
+
+        Brushes that already have vertices, for example ones read from a map cache, are skipped.
+        If a `GeometryCache` is active, a brush with the same planes up to translation is looked up in it first.
+        """
+
+        if self.GetCounts()[0] != 0:
+            return
+
+        engine = engine or Brush.engine
+        cache = GeometryCache.active
+        key = None
+
+        if cache is not None:
+            key, ref = GeometryCache.BrushKey(self.GetPlanePoints(), engine)
+            windings = cache.Get(key)
+
+            if windings is not None:
+                self.SetWindings(windings, ref)
+                return
+
+        if engine == "CLIP":
+            # the windings are already in order
+            self.CalculateVertsClipped()
+        elif engine == "NUMPY":
+            self.CalculateVertsBatched()
+            self.SortWindings()
+        else:
+            self.CalculateVertsLoop()
+
+            for face in self.faces:
+                face.SortVertices()
+
+        if key is not None:
+            cache.Put(key, self.GetWindings(ref))
+
+    def GetWindings(self, ref: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the vertices of the brush relative to `ref`, and the number of vertex indices and the vertex indices of each face.
+        """
+
+        faces = self.faces
+
+        return (
+            np.array([tuple(vert) for vert in self.verts], dtype=np.float64).reshape(-1, 3) - ref,
+            np.array([len(face.vert_idx) for face in faces], dtype=np.int32),
+            np.array([i for face in faces for i in face.vert_idx], dtype=np.int32)
+        )
+
+    def SetWindings(self, windings: Tuple[np.ndarray, np.ndarray, np.ndarray], ref: np.ndarray) -> None:
+        """
+        Sets the vertices of the brush and the vertex indices of its faces from the output of `GetWindings`.
+        """
+
+        verts, counts, indices = windings
+        indices = indices.tolist()
+        start = 0
+
+        self.verts = [Vector(vert) for vert in (verts + ref).tolist()]
+
+        for face, count in zip(self.faces, counts.tolist()):
+            face.vert_idx = indices[start:start + count]
+            start += count
+
+    def GetFaceStart(self) -> np.ndarray:
+        """
+        Returns the offsets of each face's vertex indices in the flat array of all of them.
+        """
+
+        res = np.zeros(len(self.faces) + 1, dtype=np.int32)
+        np.cumsum([len(face.vert_idx) for face in self.faces], out=res[1:])
+        return res
+
+    def SortWindings(self) -> None:
+        """
+        Sorts the vertices of every face at once. See `Triangles.SortWindings`.
+        """
+
+        faces = self.faces
+        normals, _, _ = GetPlanes(self.GetPlanePoints())
+        verts = np.array([tuple(vert) for vert in self.verts], dtype=np.float64).reshape(-1, 3)
+        faceVerts = np.array([i for face in faces for i in face.vert_idx], dtype=np.int32)
+        faceStart = self.GetFaceStart()
+
+        indices = SortWindings(verts, normals, faceStart, faceVerts).tolist()
+        for face, start, end in zip(faces, faceStart[:-1].tolist(), faceStart[1:].tolist()):
+            face.vert_idx = indices[start:end]
+
+    def GetTriangles(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Triangulates the faces of the brush into `int32` index buffers.
+
+        Returns the offsets of each face's triangles, a (T, 3) array of vertex indices and a (T, 3) array of uv indices.
+        The uv indices are `None` if the uvs aren't calculated yet.
+        """
+
+        faces = self.faces
+        faceStart = self.GetFaceStart()
+        triStart, corners = FanTriangles(faceStart)
+
+        faceVerts = np.array([i for face in faces for i in face.vert_idx], dtype=np.int32)
+        faceUVs = np.array([i for face in faces for i in face.uv_idx], dtype=np.int32)
+
+        return triStart, faceVerts[corners], faceUVs[corners] if len(faceUVs) == len(faceVerts) else None
+
+    def CalculateVertsClipped(self) -> None:
+        """
+        `CalculateVerts` with a winding per face, clipped by the planes of the other faces. See `ClipPlanes`.
+
+        The vertex indices of the faces come out in the same order `Face.SortVertices` would put them in.
+        """
+
+        verts, indices = WeldWindings(ClipPlanes(self.GetPlanePoints()))
+
+        self.verts = [Vector(v) for v in verts.tolist()]
+
+        for face, idx in zip(self.faces, indices):
+            face.vert_idx = idx
+
+    def CrossCheck(self, epsilon: float = 0.01) -> List[int]:
+        """
+        Compares the corners the "CLIP" engine finds for each face with the ones the "NUMPY" engine finds.
+
+        Returns the indices of the faces that don't have the same corners within `epsilon`.
+        """
+
+        points = self.GetPlanePoints()
+        verts, indices = WeldWindings(ClipPlanes(points))
+        triples, corners = IntersectPlanes(points)
+        res: List[int] = []
+
+        for i, (idx, expected) in enumerate(zip(indices, CornersPerFace(len(points), triples, corners))):
+            clipped = verts[idx]
+
+            if len(expected) < 3:
+                expected = expected[:0]
+
+            # every corner of each engine must be close to a corner of the other one
+            dists = np.abs(clipped[:, None, :] - expected[None, :, :]).max(axis=2) if len(clipped) and len(expected) else None
+
+            if dists is None:
+                if len(clipped) != len(expected):
+                    res.append(i)
+            elif dists.min(axis=1).max() > epsilon or dists.min(axis=0).max() > epsilon:
+                res.append(i)
+
+        return res
+
+    def CalculateVertsBatched(self) -> None:
+        """
+        `CalculateVerts` with every plane triple solved at once in NumPy. See `IntersectPlanes`.
+        """
+
+        faces = self.faces
+        triples, corners = IntersectPlanes(self.GetPlanePoints())
+
+        for (a, b, c), corner in zip(triples.tolist(), corners.tolist()):
+            vert = Vector(corner)
+            self.AddVert(vert)
+            faces[a].AddVert(vert)
+            faces[b].AddVert(vert)
+            faces[c].AddVert(vert)
+
+    def CalculateVertsLoop(self) -> None:
+        """
+        `CalculateVerts` with a Python loop over every plane triple.
         """
 
         for i, face1 in enumerate(self.faces[:-2]):
@@ -103,32 +495,51 @@ class Brush:
                     face1.AddVert(intersection)
                     face2.AddVert(intersection)
                     face3.AddVert(intersection)
-
-        for face in self.faces:
-            face.SortVertices()
     
     def CalculateUVs(self) -> None:
         """
         Calculates the UV coordinates of each vertex of every face of the brush.
 
         The results are stored in a list of `Vector` objects and referenced by the faces that use them by their indices.
+        All the faces are projected in one pass, see `ProjectUVs`. Uvs calculated before are dropped.
         """
 
-        for face in self.faces:
-            face.CalculateUVs()
+        self.uvs = []
+        faces = self.faces
+        faceStart = self.GetFaceStart()
+        verts = np.array([tuple(vert) for vert in self.verts], dtype=np.float64).reshape(-1, 3)
+        indices = np.array([i for face in faces for i in face.vert_idx], dtype=np.int32)
+
+        uvs = ProjectUVs(
+            verts[indices], np.repeat(np.arange(len(faces)), np.diff(faceStart)),
+            np.array([tuple(face.GetNormal()) for face in faces]).reshape(-1, 3),
+            np.array([isinstance(face.uvData, ValveUV) for face in faces], dtype=bool),
+            np.array([face.uvData.GetParams() for face in faces], dtype=np.float64).reshape(-1, 10),
+            np.array([tuple(face.texSize) for face in faces], dtype=np.float64).reshape(-1, 2)
+        ).tolist()
+
+        for face, start, end in zip(faces, faceStart[:-1].tolist(), faceStart[1:].tolist()):
+            face.uv_idx = [self.AddUV(Vector(uv)) for uv in uvs[start:end]]
 
     def GetBoundingBox(self) -> Tuple[Vector, Vector]:
         if self.__boundingBox__ is not None:
             return self.__boundingBox__
 
-        brush_min, brush_max = self.verts[0], self.verts[0]
-        
-        for vert in self.verts[1:]:
-            brush_min = VecMin(vert, brush_min)
-            brush_max = VecMax(vert, brush_max)
+        # brushes without a volume have no vertices
+        if self.GetCounts()[0] == 0:
+            return None
+
+        if self.__packed__ is not None:
+            verts = self.__packed__[0]
+            brush_min, brush_max = Vector(verts.min(axis=0).tolist()), Vector(verts.max(axis=0).tolist())
+        else:
+            xs, ys, zs = zip(*self.__verts__)
+            brush_min = Vector((min(xs), min(ys), min(zs)))
+            brush_max = Vector((max(xs), max(ys), max(zs)))
 
         self.__boundingBox__ = brush_min, brush_max
         return brush_min, brush_max
 
-from .Face import Face
+from .Face import Face, ValveUV
+from .FaceBatch import FaceBatch
 
@@ -0,0 +1,200 @@
+import numpy as np
+from functools import lru_cache
+from typing import List, Tuple
+from .Weld import WeldBuffer
+
+@lru_cache(maxsize=None)
+def GetPlaneTriples(numFaces: int) -> np.ndarray:
+    """
+    Returns every combination of three faces of a brush with `numFaces` faces, as an (M, 3) array.
+
+    The combinations are ordered by their first appearance in the triple loop of `Brush.CalculateVerts`,
+    so vertices found from them end up in the same order as that loop would add them.
+    """
+
+    n = numFaces
+    if n < 3:
+        return np.zeros((0, 3), dtype=np.int64)
+
+    i, k, j = np.meshgrid(np.arange(n - 2), np.arange(n - 1), np.arange(n), indexing="ij")
+    i, k, j = i.ravel(), k.ravel(), j.ravel()
+    distinct = (i != k) & (i != j) & (k != j)
+    ordered = np.sort(np.stack((i[distinct], k[distinct], j[distinct]), axis=1), axis=1)
+
+    keys = (ordered[:, 0] * n + ordered[:, 1]) * n + ordered[:, 2]
+    _, first = np.unique(keys, return_index=True)
+
+    res = ordered[np.sort(first)]
+    res.setflags(write=False)
+    return res
+
+def GetPlanes(points: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Calculates the normal, distance and center of each face from an (N, 9) array of plane points.
+    """
+
+    p1, p2, p3 = points[:, 0:3], points[:, 3:6], points[:, 6:9]
+    normals = np.cross(p2 - p1, p3 - p1)
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths != 0)
+    dists = np.einsum("ij,ij->i", normals, p1)
+    centers = (p1 + p2 + p3) / 3
+
+    return normals, dists, centers
+
+def IntersectPlanes(points: np.ndarray, epsilon: float = 1e-6) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the corners of a brush from an (N, 9) array of its plane points.
+
+    Every plane triple is solved in one batched `np.linalg.solve`, skipping triples whose determinant is close to 0,
+    and every intersection point is tested against every face in a single pass.
+
+    Returns the triples that produced a corner and the corners themselves, in the order `Brush.CalculateVerts` would find them.
+    """
+
+    triples = GetPlaneTriples(len(points))
+    if len(triples) == 0:
+        return triples, np.zeros((0, 3))
+
+    normals, dists, centers = GetPlanes(points)
+
+    A = normals[triples] # (M, 3, 3)
+    b = dists[triples] # (M, 3)
+
+    solvable = np.abs(np.linalg.det(A)) > epsilon
+    triples, A, b = triples[solvable], A[solvable], b[solvable]
+
+    if len(triples) == 0:
+        return triples, np.zeros((0, 3))
+
+    corners = np.linalg.solve(A, b[:, :, None])[:, :, 0]
+
+    # same test as Brush.IsVertLegal, without normalizing the direction to each face center
+    facing = corners[:, None, :] - centers[None, :, :] # (M, N, 3)
+    dots = np.einsum("mnk,nk->mn", facing, normals)
+    lengths = np.linalg.norm(facing, axis=2)
+    legal = np.all(dots >= -0.001 * lengths, axis=1)
+
+    return triples[legal], corners[legal]
+
+MAX_WORLD = 131072.0
+
+def BaseWinding(normal: np.ndarray, dist: float) -> np.ndarray:
+    """
+    Returns a square on the plane that is larger than any map, wound clockwise around `normal`.
+    """
+
+    axis = np.argmax(np.abs(normal))
+    up = np.array((1.0, 0.0, 0.0)) if axis == 2 else np.array((0.0, 0.0, 1.0))
+
+    up -= normal * up.dot(normal)
+    up /= np.linalg.norm(up)
+    right = np.cross(up, normal)
+
+    origin = normal * dist
+    up *= MAX_WORLD
+    right *= MAX_WORLD
+
+    return np.array((origin - right + up, origin + right + up, origin + right - up, origin - right - up))
+
+def ClipWinding(winding: np.ndarray, normal: np.ndarray, dist: float, epsilon: float = 0.01) -> np.ndarray:
+    """
+    Clips a winding to the side of the plane `normal` points to. Points within `epsilon` of the plane are kept.
+    """
+
+    dists = winding @ normal - dist
+
+    if np.all(dists >= -epsilon):
+        return winding
+
+    if np.all(dists <= epsilon):
+        return winding[:0]
+
+    res: List[np.ndarray] = []
+    count = len(winding)
+
+    for i in range(count):
+        p1, d1 = winding[i], dists[i]
+        p2, d2 = winding[(i + 1) % count], dists[(i + 1) % count]
+
+        if d1 >= -epsilon:
+            res.append(p1)
+
+        # the edge crosses the plane
+        if (d1 > epsilon and d2 < -epsilon) or (d1 < -epsilon and d2 > epsilon):
+            res.append(p1 + (p2 - p1) * (d1 / (d1 - d2)))
+
+    return np.array(res).reshape(-1, 3)
+
+def ClipPlanes(points: np.ndarray, epsilon: float = 0.01) -> List[np.ndarray]:
+    """
+    Builds the winding of every face of a brush from an (N, 9) array of its plane points,
+    by clipping a base winding on each plane against all the other planes.
+    Faces that are clipped away or left open get an empty winding.
+
+    The windings are wound the same way `Face.SortVertices` sorts vertices.
+    """
+
+    normals, dists, _ = GetPlanes(points)
+    res: List[np.ndarray] = []
+
+    for i in range(len(points)):
+        winding = BaseWinding(normals[i], dists[i])
+
+        for j in range(len(points)):
+            if i == j:
+                continue
+
+            winding = ClipWinding(winding, normals[j], dists[j], epsilon)
+
+            if len(winding) == 0:
+                break
+
+        # parts of the base winding that weren't clipped away mean the brush isn't closed on that side
+        if len(winding) != 0 and np.abs(winding).max() >= MAX_WORLD * 0.5:
+            winding = winding[:0]
+
+        if len(winding) >= 3:
+            center = winding.mean(axis=0)
+            rel = winding - center
+            area = np.cross(rel, np.roll(rel, -1, axis=0)).sum(axis=0)
+
+            if area.dot(normals[i]) > 0:
+                winding = winding[::-1]
+
+        res.append(winding)
+
+    return res
+
+def WeldWindings(windings: List[np.ndarray], epsilon: float = 1e-3) -> Tuple[np.ndarray, List[List[int]]]:
+    """
+    Merges the points of the windings of a brush that are within `epsilon` of each other.
+
+    Returns the vertices of the brush and the vertex indices of each winding. Windings left with less than 3 vertices get no indices.
+    """
+
+    buffer = WeldBuffer(epsilon)
+    res: List[List[int]] = []
+
+    for winding in windings:
+        idx: List[int] = []
+
+        for point in winding.tolist():
+            found = buffer.Add(point)
+
+            if len(idx) == 0 or idx[-1] != found:
+                idx.append(found)
+
+        while len(idx) > 1 and idx[0] == idx[-1]:
+            idx.pop()
+
+        res.append(idx if len(idx) >= 3 else [])
+
+    return np.array(buffer.items).reshape(-1, 3), res
+
+def CornersPerFace(numFaces: int, triples: np.ndarray, corners: np.ndarray) -> List[np.ndarray]:
+    """
+    Groups the output of `IntersectPlanes` by face.
+    """
+
+    return [corners[np.any(triples == i, axis=1)] for i in range(numFaces)]
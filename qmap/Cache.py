@@ -0,0 +1,217 @@
+import os
+import numpy as np
+from hashlib import blake2b
+from struct import pack, unpack, calcsize, error as StructError
+from typing import BinaryIO, List
+from mathutils import Vector
+from .Entity import Entity
+from .Brush import Brush
+from .FaceBatch import FaceBatch
+from .Patch import Patch, PatchVert
+
+MAGIC = b"MAPCACHE"
+VERSION = 2
+HEADER = "<8siqq32s" # magic, version, map file size, map file mtime, map file hash
+
+BRUSH = 0
+PATCH = 1
+
+def GetCachePath(path: str) -> str:
+    return os.path.splitext(path)[0] + ".mapcache"
+
+def HashFile(path: str) -> bytes:
+    digest = blake2b(digest_size=32)
+
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+
+    return digest.digest()
+
+def WriteString(file: BinaryIO, string: str) -> None:
+    data = string.encode("utf-8")
+    file.write(pack("<i", len(data)))
+    file.write(data)
+
+def ReadString(file: BinaryIO) -> str:
+    size, = unpack("<i", file.read(4))
+    return file.read(size).decode("utf-8")
+
+def WriteArray(file: BinaryIO, array, dtype) -> None:
+    data = np.ascontiguousarray(array, dtype=dtype).tobytes()
+    file.write(pack("<q", len(data)))
+    file.write(data)
+
+def ReadArray(file: BinaryIO, dtype) -> np.ndarray:
+    size, = unpack("<q", file.read(8))
+    data = file.read(size)
+
+    if len(data) != size:
+        raise ValueError("Truncated map cache")
+
+    return np.frombuffer(data, dtype=dtype)
+
+def Concatenate(arrays: List[np.ndarray]):
+    return np.concatenate(arrays) if len(arrays) != 0 else []
+
+def WriteEntity(file: BinaryIO, entity: Entity) -> None:
+    file.write(pack("<i", len(entity.properties)))
+    for key, value in entity.properties.items():
+        WriteString(file, key)
+        WriteString(file, value)
+
+    brushes: List[Brush] = [geo for geo in entity.geo if isinstance(geo, Brush)]
+    patches: List[Patch] = [geo for geo in entity.geo if isinstance(geo, Patch)]
+
+    # brushes calculated in a process pool are written from their arrays, without making their faces
+    batches = [brush.GetFaceBatch() for brush in brushes]
+    packed = [brush.Pack() for brush in brushes]
+
+    WriteArray(file, [BRUSH if isinstance(geo, Brush) else PATCH for geo in entity.geo], np.uint8)
+
+    # faces of all the brushes, in the layout of a FaceBatch
+    WriteArray(file, [end - start for _, start, end in batches], np.int32)
+    WriteArray(file, [i for batch, start, end in batches for i in batch.materialIDs[start:end]], np.int32)
+    WriteArray(file, Concatenate([batch.points[start:end] for batch, start, end in batches]), np.float64)
+    WriteArray(file, Concatenate([batch.valve[start:end] for batch, start, end in batches]), np.bool_)
+    WriteArray(file, Concatenate([batch.uvParams[start:end] for batch, start, end in batches]), np.float64)
+
+    # computed vertices and windings. uvs depend on the texture sizes, which are only known once the materials are loaded
+    WriteArray(file, [len(verts) for verts, *_ in packed], np.int32)
+    WriteArray(file, Concatenate([verts for verts, *_ in packed]), np.float64)
+    WriteArray(file, Concatenate([p[2] for p in packed]), np.int32)
+    WriteArray(file, Concatenate([p[3] for p in packed]), np.int32)
+
+    for patch in patches:
+        WriteString(file, patch.material)
+        WriteArray(file, patch.size, np.int32)
+        WriteArray(file, [len(row) for row in patch.verts], np.int32)
+        WriteArray(file, [c for row in patch.verts for vert in row for c in (*vert.pos, *vert.uv)], np.float64)
+
+def ReadEntity(file: BinaryIO, entityID: int, materials: List[str]) -> Entity:
+    entity = Entity(entityID)
+
+    numProps, = unpack("<i", file.read(4))
+    for _ in range(numProps):
+        key = ReadString(file)
+        entity[key] = ReadString(file)
+
+    geoTypes = ReadArray(file, np.uint8).tolist()
+
+    faceCounts = ReadArray(file, np.int32).tolist()
+    batch = FaceBatch()
+    batch.materialIDs = ReadArray(file, np.int32).tolist()
+    batch.materials = [materials[i] for i in batch.materialIDs]
+    batch.planeIDs = [-1] * len(batch.materialIDs)
+    batch.points = ReadArray(file, np.float64).reshape(-1, 9)
+    batch.valve = ReadArray(file, np.bool_)
+    batch.uvParams = ReadArray(file, np.float64).reshape(-1, 10)
+
+    vertCounts = ReadArray(file, np.int32).tolist()
+    verts = ReadArray(file, np.float64).reshape(-1, 3).tolist()
+    vertIdxCounts = ReadArray(file, np.int32).tolist()
+    vertIdx = ReadArray(file, np.int32).tolist()
+
+    brushID, face, vert, vi = 0, 0, 0, 0
+
+    for geoID, geoType in enumerate(geoTypes):
+        if geoType == PATCH:
+            material = ReadString(file)
+            size = tuple(ReadArray(file, np.int32).tolist())
+            rows = ReadArray(file, np.int32).tolist()
+            data = ReadArray(file, np.float64).reshape(-1, 5).tolist()
+            patch = Patch(size, material)
+
+            start = 0
+            for row in rows:
+                patch.verts.append([PatchVert(Vector(v[0:3]), Vector(v[3:5])) for v in data[start:start + row]])
+                start += row
+
+            entity.geo.append(patch)
+            continue
+
+        brush = Brush(geoID, entityID)
+        numFaces = faceCounts[brushID]
+        brush.AddFaces(batch, face, face + numFaces)
+
+        brush.verts = [Vector(v) for v in verts[vert:vert + vertCounts[brushID]]]
+        vert += vertCounts[brushID]
+
+        if len(brush.verts) != 0:
+            for i, f in enumerate(brush.faces):
+                f.vert_idx = vertIdx[vi:vi + vertIdxCounts[face + i]]
+                vi += vertIdxCounts[face + i]
+
+        face += numFaces
+        brushID += 1
+        entity.geo.append(brush)
+
+    return entity
+
+def SaveCache(mapData: 'Map', path: str) -> None:
+    """
+    Writes the parsed map and the vertices of its brushes next to the map file.
+    Uvs aren't written, `Map.ProcessGeo` calculates them once the texture sizes are known.
+
+    The cache is written to a temporary file first and then moved over the old one,
+    so a failed write never leaves a broken cache behind.
+    """
+
+    cachePath = GetCachePath(path)
+    tmpPath = f"{cachePath}.{os.getpid()}.tmp"
+    stat = os.stat(path)
+
+    try:
+        with open(tmpPath, "wb") as file:
+            file.write(pack(HEADER, MAGIC, VERSION, stat.st_size, stat.st_mtime_ns, HashFile(path)))
+
+            file.write(pack("<i", len(mapData.materials)))
+            for mat in mapData.materials:
+                WriteString(file, mat)
+
+            file.write(pack("<i", len(mapData.entities)))
+            for entity in mapData.entities:
+                WriteEntity(file, entity)
+
+        os.replace(tmpPath, cachePath)
+    except OSError as e:
+        print(f"Can't write map cache {cachePath}: {e}")
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+def LoadCache(mapData: 'Map', path: str) -> bool:
+    """
+    Fills `mapData` from the cache of the map file.
+
+    Returns `False` if there is no cache, or if it belongs to a different version of the file or of the cache format.
+    """
+
+    cachePath = GetCachePath(path)
+
+    if not os.path.exists(cachePath):
+        return False
+
+    stat = os.stat(path)
+
+    try:
+        with open(cachePath, "rb") as file:
+            magic, version, size, mtime, digest = unpack(HEADER, file.read(calcsize(HEADER)))
+
+            if magic != MAGIC or version != VERSION or size != stat.st_size or mtime != stat.st_mtime_ns:
+                return False
+
+            if digest != HashFile(path):
+                return False
+
+            numMaterials, = unpack("<i", file.read(4))
+            materials = [ReadString(file) for _ in range(numMaterials)]
+
+            numEntities, = unpack("<i", file.read(4))
+            for i in range(numEntities):
+                mapData.AddEntity(ReadEntity(file, i, materials))
+
+    except (OSError, ValueError, StructError, IndexError, UnicodeDecodeError) as e:
+        print(f"Can't read map cache {cachePath}: {e}")
+        return False
+
+    return True
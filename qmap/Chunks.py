@@ -0,0 +1,166 @@
+import io
+import mmap
+import re
+from itertools import repeat
+from os.path import getsize
+from typing import Iterator, List, Tuple
+from .Entity import Entity
+from .Brush import Brush
+from .Parser import Tokenizer, ParseEntity, ParseEntities
+from ..func.Helpers import CreatePool
+
+BRACES = re.compile(rb'"[^"\n]*"|//[^\n]*|[{}]')
+
+Chunk = Tuple[int, int, int] # start, end, start of the entity that is split or -1
+
+def ScanEntities(data) -> List[Tuple[int, int, List[int]]]:
+    """
+    Finds the byte range of each top level entity, along with the byte offsets where its brushes and patches start.
+
+    Braces inside quoted strings and comments are ignored.
+    """
+
+    res: List[Tuple[int, int, List[int]]] = []
+    depth = 0
+    start = 0
+    geo: List[int] = []
+
+    for match in BRACES.finditer(data):
+        char = match.group()[0]
+
+        if char == 123: # {
+            if depth == 0:
+                start = match.start()
+                geo = []
+            elif depth == 1:
+                geo.append(match.start())
+            depth += 1
+
+        elif char == 125: # }
+            depth -= 1
+            if depth == 0:
+                res.append((start, match.end(), geo))
+
+    return res
+
+def SplitChunks(entities: List[Tuple[int, int, List[int]]], chunkSize: int) -> List[Chunk]:
+    """
+    Groups whole entities into chunks of about `chunkSize` bytes.
+
+    Entities larger than `chunkSize` are split into several chunks by their brush boundaries.
+    The first chunk of a split entity starts after its `{` and the last one ends before its `}`.
+    """
+
+    res: List[Chunk] = []
+    start, end = None, None
+
+    for entStart, entEnd, geo in entities:
+        if entEnd - entStart > chunkSize and len(geo) > 1:
+            if start is not None:
+                res.append((start, end, -1))
+                start = None
+
+            pieceStart = entStart + 1
+            for pos in geo:
+                if pos - pieceStart >= chunkSize:
+                    res.append((pieceStart, pos, entStart))
+                    pieceStart = pos
+
+            res.append((pieceStart, entEnd - 1, entStart))
+            continue
+
+        if start is None:
+            start = entStart
+
+        end = entEnd
+
+        if end - start >= chunkSize:
+            res.append((start, end, -1))
+            start = None
+
+    if start is not None:
+        res.append((start, end, -1))
+
+    return res
+
+def ParseChunk(path: str, start: int, end: int, split: int, line: int) -> List[Entity]:
+    """
+    Parses a chunk of the map file in a worker process.
+
+    Chunks of a split entity return a single partial entity holding the key/values and geometry found in the chunk.
+    """
+
+    with open(path, "rb") as file:
+        file.seek(start)
+        text = io.TextIOWrapper(io.BytesIO(file.read(end - start)))
+
+    tokens = Tokenizer(text, line)
+
+    if split != -1:
+        return [ParseEntity(tokens, 0, True)]
+
+    return list(ParseEntities(tokens))
+
+def Renumber(entity: Entity, entityID: int) -> Entity:
+    """
+    Gives the entity and its brushes the ids a serial load would have given them.
+    """
+
+    entity.id = entityID
+
+    for i, geo in enumerate(entity.geo):
+        if isinstance(geo, Brush):
+            geo.id = (entityID, i)
+
+    return entity
+
+def IterEntitiesParallel(path: str, workers: int, chunkSize: int = 1 << 20) -> Iterator[Entity]:
+    """
+    Parses the map file in chunks across a process pool and yields its entities in file order.
+    """
+
+    # an empty file can't be mapped, so it's parsed here without starting a pool
+    pool = CreatePool(workers) if getsize(path) != 0 else None
+
+    if pool is None:
+        with open(path, "r") as file:
+            yield from ParseEntities(Tokenizer(file))
+        return
+
+    with pool:
+        with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            chunks = SplitChunks(ScanEntities(data), chunkSize)
+
+            # line number at the start of each chunk, for error messages
+            lines: List[int] = []
+            line, pos = 0, 0
+            for start, _, _ in chunks:
+                line += data[pos:start].count(b"\n")
+                pos = start
+                lines.append(line)
+
+        results = pool.map(ParseChunk, repeat(path), *zip(*chunks), lines) if len(chunks) != 0 else []
+
+        entityID = 0
+        current, currentSplit = None, -1
+
+        for (_, _, split), entities in zip(chunks, results):
+            if split != currentSplit and current is not None:
+                yield Renumber(current, entityID)
+                entityID += 1
+                current, currentSplit = None, -1
+
+            if split != -1:
+                if current is None:
+                    current, currentSplit = Entity(entityID), split
+
+                current.properties.update(entities[0].properties)
+                current.geo.extend(entities[0].geo)
+                continue
+
+            for entity in entities:
+                yield Renumber(entity, entityID)
+                entityID += 1
+
+        if current is not None:
+            yield Renumber(current, entityID)
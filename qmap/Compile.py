@@ -0,0 +1,241 @@
+import numpy as np
+from mathutils import Vector
+from typing import Dict, Iterator, List, Tuple
+from .Brush import Brush
+from .FaceBatch import FaceBatch
+from .GeoCache import GeometryCache
+from .Geometry import Offsets
+from ..func.Helpers import CreatePool
+
+# plane points, Valve flags, uv parameters and texture sizes of every face, and the number of faces of each brush
+BrushArrays = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+# vertex/uv counts and data of each brush, vertex/uv index counts and data of each face
+GeometryArrays = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+# vertices relative to a reference point, and the number of vertex indices and the vertex indices of each face, see `Brush.GetWindings`
+Windings = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+def PackBrushes(brushes: List[Brush], sizes: List[Vector]) -> BrushArrays:
+    """
+    Collects the planes and texture alignment of the brushes into arrays that can be sent to another process.
+
+    `sizes` holds the texture size of each material id, or `None` for the ones that aren't known yet.
+    """
+
+    points, valve, params, ids, faceCounts = [], [], [], [], []
+
+    for brush in brushes:
+        batch, start, end = brush.GetFaceBatch()
+        points.append(batch.points[start:end])
+        valve.append(batch.valve[start:end])
+        params.append(batch.uvParams[start:end])
+        ids += batch.materialIDs[start:end]
+        faceCounts.append(end - start)
+
+    texSizes = np.array([(512.0, 512.0) if id < 0 or sizes[id] is None else tuple(sizes[id]) for id in ids], dtype=np.float64).reshape(-1, 2)
+
+    return (
+        np.concatenate(points).reshape(-1, 9), np.concatenate(valve).astype(bool), np.concatenate(params).reshape(-1, 10),
+        texSizes, np.array(faceCounts, dtype=np.int32)
+    )
+
+def PackGeometry(brushes: List[Brush]) -> GeometryArrays:
+    """
+    Collects the calculated vertices and uvs of the brushes into arrays. See `Brush.Pack`.
+    """
+
+    packed = [brush.Pack() for brush in brushes]
+
+    return (
+        np.array([len(verts) for verts, *_ in packed], dtype=np.int32),
+        np.concatenate([verts for verts, *_ in packed]).reshape(-1, 3),
+        np.array([len(uvs) for _, uvs, *_ in packed], dtype=np.int32),
+        np.concatenate([uvs for _, uvs, *_ in packed]).reshape(-1, 2),
+        np.concatenate([p[2] for p in packed]).astype(np.int32),
+        np.concatenate([p[3] for p in packed]).astype(np.int32),
+        np.concatenate([p[4] for p in packed]).astype(np.int32),
+        np.concatenate([p[5] for p in packed]).astype(np.int32)
+    )
+
+def UnpackGeometry(brushes: List[Brush], geometry: GeometryArrays, texSizes: np.ndarray, faceCounts: np.ndarray) -> None:
+    """
+    Gives each brush its slices of the output of `PackGeometry`, and its faces the texture sizes the uvs were calculated with.
+
+    Only the arrays are handed over, see `Brush.SetPacked`. `Vector` objects are made when a brush is accessed,
+    and `MapGeometry.FromMap` copies the arrays without making any.
+    """
+
+    vertCounts, verts, uvCounts, uvs, vertIdxCounts, vertIdx, uvIdxCounts, uvIdx = geometry
+    vertStart = Offsets(vertCounts).tolist()
+    uvStart = Offsets(uvCounts).tolist()
+    faceStart = Offsets(faceCounts)
+    vertIdxStart = Offsets(vertIdxCounts)[faceStart].tolist()
+    uvIdxStart = Offsets(uvIdxCounts)[faceStart].tolist()
+    faceStart = faceStart.tolist()
+
+    for i, brush in enumerate(brushes):
+        faces = slice(faceStart[i], faceStart[i + 1])
+
+        brush.SetPacked((
+            verts[vertStart[i]:vertStart[i + 1]], uvs[uvStart[i]:uvStart[i + 1]],
+            vertIdxCounts[faces], vertIdx[vertIdxStart[i]:vertIdxStart[i + 1]],
+            uvIdxCounts[faces], uvIdx[uvIdxStart[i]:uvIdxStart[i + 1]],
+            texSizes[faces]
+        ))
+
+def CompileBrushes(arrays: BrushArrays, engine: str, uvs: bool = True, windings: List[Windings] = None) -> Tuple[GeometryArrays, List[Windings]]:
+    """
+    Calculates the vertices and, if `uvs` is set, the uvs of the brushes in the output of `PackBrushes`. Runs in the worker processes.
+
+    `windings` holds the cached windings of each brush, or `None` for the ones to calculate. See `GetCachedWindings`.
+    If it is given, the windings of the brushes that were calculated are returned too, and `None` for the others,
+    so the main process can add them to its `GeometryCache`. The workers' copies of the cache are not used.
+    """
+
+    points, valve, params, texSizes, faceCounts = arrays
+
+    batch = FaceBatch()
+    batch.points, batch.valve, batch.uvParams = points, valve, params
+    batch.materials = [""] * len(points)
+    batch.materialIDs = [-1] * len(points)
+    batch.planeIDs = [-1] * len(points)
+
+    sizes = [Vector(size) for size in texSizes.tolist()]
+    brushes: List[Brush] = []
+    calculated: List[Windings] = []
+    start = 0
+
+    cache = GeometryCache.active
+    GeometryCache.active = None
+
+    try:
+        for i, count in enumerate(faceCounts.tolist()):
+            brush = Brush(len(brushes), 0)
+            brush.AddFaces(batch, start, start + count)
+
+            for face, size in zip(brush.faces, sizes[start:start + count]):
+                face.texSize = size
+
+            # the same reference point GeometryCache.BrushKey uses
+            ref = points[start, 0:3]
+            cached = windings[i] if windings is not None else None
+
+            if cached is not None:
+                brush.SetWindings(cached, ref)
+            else:
+                brush.CalculateVerts(engine)
+
+            if windings is not None:
+                calculated.append(brush.GetWindings(ref) if cached is None else None)
+
+            if uvs:
+                brush.CalculateUVs()
+            brushes.append(brush)
+            start += count
+    finally:
+        GeometryCache.active = cache
+
+    return PackGeometry(brushes), calculated if windings is not None else None
+
+def SplitBrushes(brushes: List[Brush], chunkSize: int) -> Iterator[List[Brush]]:
+    for i in range(0, len(brushes), chunkSize):
+        yield brushes[i:i + chunkSize]
+
+def TakeBrushes(arrays: List[BrushArrays], picks: List[Tuple[int, int]]) -> BrushArrays:
+    """
+    Collects brushes from several outputs of `PackBrushes` into one, picked as (output, brush) index pairs.
+    """
+
+    faceStarts = [Offsets(chunkArrays[4]).tolist() for chunkArrays in arrays]
+    ranges = [(arrays[c], faceStarts[c][i], faceStarts[c][i + 1]) for c, i in picks]
+
+    return (
+        np.concatenate([a[0][start:end] for a, start, end in ranges]).reshape(-1, 9),
+        np.concatenate([a[1][start:end] for a, start, end in ranges]).astype(bool),
+        np.concatenate([a[2][start:end] for a, start, end in ranges]).reshape(-1, 10),
+        np.concatenate([a[3][start:end] for a, start, end in ranges]).reshape(-1, 2),
+        np.array([end - start for _, start, end in ranges], dtype=np.int32)
+    )
+
+def GetCachedWindings(pool, arrays: List[BrushArrays], engine: str, chunkSize: int, cache: GeometryCache) -> List[List[Windings]]:
+    """
+    Returns the windings of each brush in the outputs of `PackBrushes`, looked up in the cache by the main process.
+
+    Brushes missing from the cache are calculated in the pool first, once per key, and added to the cache.
+    Copies of the same brush then hit the cache, like they do when the brushes are calculated one by one.
+    """
+
+    res: List[List[Windings]] = []
+    missing: Dict[str, Tuple[int, int]] = {}
+    copies: List[Tuple[int, int, str]] = []
+
+    for c, (points, _, _, _, faceCounts) in enumerate(arrays):
+        res.append([])
+        start = 0
+
+        for i, count in enumerate(faceCounts.tolist()):
+            key, _ = GeometryCache.BrushKey(points[start:start + count], engine)
+            start += count
+
+            if key in missing:
+                copies.append((c, i, key))
+                res[c].append(None)
+                continue
+
+            windings = cache.Get(key)
+            if windings is None:
+                missing[key] = (c, i)
+            res[c].append(windings)
+
+    keys = list(missing)
+    picks = list(missing.values())
+    futures = [
+        pool.submit(CompileBrushes, TakeBrushes(arrays, picks[i:i + chunkSize]), engine, False, [None] * len(picks[i:i + chunkSize]))
+        for i in range(0, len(picks), chunkSize)
+    ]
+
+    for i, future in enumerate(futures):
+        _, calculated = future.result()
+
+        for key, (c, b), windings in zip(keys[i * chunkSize:], picks[i * chunkSize:], calculated):
+            cache.Put(key, windings)
+            res[c][b] = windings
+
+    # a copy whose entry was evicted already gets None, and its task calculates it again
+    for c, i, key in copies:
+        res[c][i] = cache.Get(key)
+
+    return res
+
+def CompileBrushesParallel(brushes: List[Brush], sizes: List[Vector], workers: int, chunkSize: int = 256, engine: str = None, uvs: bool = True) -> bool:
+    """
+    Calculates the vertices and, if `uvs` is set, the uvs of the brushes in a process pool, `chunkSize` brushes per task.
+
+    Brushes are sent to the workers as plane arrays and the results are applied in the order the brushes were given,
+    so the output is the same as calculating them one by one.
+    The active `GeometryCache` is only used by the main process, and each task is sent the cached windings of its own brushes.
+    See `GetCachedWindings`.
+
+    Returns `False` without doing anything if a process pool can't be created.
+    """
+
+    pool = CreatePool(workers)
+
+    if pool is None:
+        return False
+
+    engine = engine or Brush.engine
+    cache = GeometryCache.active
+
+    with pool:
+        chunks = list(SplitBrushes(brushes, chunkSize))
+        arrays = [PackBrushes(chunk, sizes) for chunk in chunks]
+        windings = GetCachedWindings(pool, arrays, engine, chunkSize, cache) if cache is not None else [None] * len(chunks)
+        futures = [pool.submit(CompileBrushes, chunkArrays, engine, uvs, chunkWindings) for chunkArrays, chunkWindings in zip(arrays, windings)]
+
+        for chunk, chunkArrays, future in zip(chunks, arrays, futures):
+            geometry, _ = future.result()
+            UnpackGeometry(chunk, geometry, chunkArrays[3], chunkArrays[4])
+
+    return True
@@ -5,18 +5,45 @@ from .Patch import Patch
 
 class Entity:
     """ Base class that has all the properties and methods used by a map entity. """
-    __slots__ = ("id", "properties", "geo", "boundingBox")
+    __slots__ = ("id", "properties", "boundingBox", "__geo__", "__source__")
     properties: Dict[str, str]
-    geo: List[Union[Brush, Patch]]
     boundingBox: Tuple[Vector, Vector]
 
+    __geo__: List[Union[Brush, Patch]]
+    __source__: 'LazyGeo'
+
     def __init__(self, id: int) -> None:
         id: int
         self.id = id
         self.properties = {}
-        self.geo = []
         self.boundingBox = None
 
+        self.__geo__ = []
+        self.__source__ = None
+
+    @property
+    def geo(self) -> List[Union[Brush, Patch]]:
+        """
+        The brushes and patches of the entity. Entities from `Map.Index` parse them on first access.
+        """
+
+        if self.__geo__ is None:
+            self.__geo__ = self.__source__.Load(self)
+            self.__source__ = None
+
+        return self.__geo__
+
+    def SetSource(self, source: 'LazyGeo') -> None:
+        """
+        Defers parsing the geometry of the entity until `geo` is accessed.
+        """
+
+        self.__geo__ = None
+        self.__source__ = source
+
+    def IsLoaded(self) -> bool:
+        return self.__geo__ is not None
+
     def __str__(self) -> str:
         res = "{\n"
 
@@ -1,7 +1,7 @@
 import bpy
 from mathutils import Vector
 from copy import copy
-from math import atan2, cos, fabs, radians, sin, sqrt, pow
+from math import atan2, cos, fabs, radians, sin
 from typing import List, Tuple, Union
 from functools import cmp_to_key
 from numpy.linalg import solve
@@ -58,6 +58,13 @@ class StandardUV(BaseUV):
     def __str__(self) -> str:
         return f"{self.xOffset:.6g} {self.yOffset:.6g} {self.rotation:.6g} {self.xScale:.6g} {self.yScale:.6g}"
 
+    def GetParams(self) -> Tuple[float, ...]:
+        """
+        Returns the alignment in the layout of `FaceBatch.uvParams`.
+        """
+
+        return (self.xOffset, self.yOffset, self.rotation, self.xScale, self.yScale, 0.0, 0.0, 0.0, 0.0, 0.0)
+
 class ValveUV(BaseUV):
     """
     A relatively newer texture alignment format used by Valve.
@@ -82,13 +89,20 @@ class ValveUV(BaseUV):
     def __str__(self) -> str:
         return f"[ {Vec2Str(self.uAxis)} {self.uOffset:.6g} ] [ {Vec2Str(self.vAxis)} {self.vOffset:.6g} ] 0 {self.uScale:.6g} {self.vScale:.6g} 0 0 0"
 
+    def GetParams(self) -> Tuple[float, ...]:
+        """
+        Returns the alignment in the layout of `FaceBatch.uvParams`.
+        """
+
+        return (*self.uAxis, self.uOffset, *self.vAxis, self.vOffset, self.uScale, self.vScale)
+
 class Face:
     """
     The class that has all the properties and methods used by a brush face.
     """
 
     __slots__ = (
-        "p1", "p2", "p3", "material", "uvData", "texSize", "vert_idx", "uv_idx", "lm", "parent", "bpy_mesh",
+        "p1", "p2", "p3", "material", "materialID", "planeID", "uvData", "texSize", "vert_idx", "uv_idx", "lm", "parent", "bpy_mesh",
         "__center__", "__normal__", "__distance__"
     )
 
@@ -96,6 +110,8 @@ class Face:
     p2: Vector
     p3: Vector
     material: str
+    materialID: int
+    planeID: int # index in the map's PlaneTable, -1 until the brush is added to a map
     uvData: Union[StandardUV, ValveUV]
     texSize: Vector
     vert_idx: List[int]
@@ -114,6 +130,8 @@ class Face:
         self.texSize = Vector((512.0, 512.0))
         self.p1, self.p2, self.p3 = plane
         self.material = material
+        self.materialID = -1
+        self.planeID = -1
         self.uvData = uvData
         self.parent = None
 
@@ -126,7 +144,10 @@ class Face:
 
     @staticmethod
     def FromStr(face: str) -> 'Face':
-        tok = face.strip().split()
+        return Face.FromTokens(face.strip().split())
+
+    @staticmethod
+    def FromTokens(tok: List[str]) -> 'Face':
         p1, p2, p3 = Vector([float(i) for i in tok[1:4]]), Vector([float(i) for i in tok[6:9]]), Vector([float(i) for i in tok[11:14]])
         material = tok[15].lower()
 
@@ -147,10 +168,10 @@ class Face:
 
     def AddVert(self, vert: Vector) -> None:
         """
-        Adds a vertex to `vert_idx`. The value will be added to the list if it is not a duplicate.
+        Adds a vertex to `vert_idx`, and to the parent brush if it doesn't have it yet. The index will be added to the list if it is not a duplicate.
         """
 
-        idx = self.parent.verts.index(vert)
+        idx = self.parent.AddVert(vert)
         
         if idx not in self.vert_idx:
             self.vert_idx.append(idx)
@@ -160,10 +181,7 @@ class Face:
         Adds a vertex to `uv_idx`. The value will be added to the list if it is not a duplicate.
         """
 
-        self.parent.AddUV(uv)
-        idx = self.parent.uvs.index(uv)
-        
-        self.uv_idx.append(idx)
+        self.uv_idx.append(self.parent.AddUV(uv))
 
     def GetVerts(self) -> List[Vector]:
         """
@@ -211,8 +229,24 @@ class Face:
         return res
     
     def GetDistance(self) -> float:
-        normal: Vector = self.GetNormal()
-        return ((self.p1.x * normal.x) + (self.p1.y * normal.y) + (self.p1.z * normal.z)) / sqrt(pow(normal.x, 2) + pow(normal.y, 2) + pow(normal.z, 2))
+        if self.__distance__ is None:
+            self.__distance__ = self.p1.dot(self.GetNormal())
+
+        return self.__distance__
+
+    def IsCoplanar(self, other: 'Face') -> bool:
+        """
+        Checks if two faces of the same map lie on the same plane and face the same way.
+        """
+
+        return self.planeID != -1 and self.planeID == other.planeID
+
+    def IsOpposite(self, other: 'Face') -> bool:
+        """
+        Checks if two faces of the same map lie on the same plane and face each other.
+        """
+
+        return self.planeID != -1 and self.planeID ^ 1 == other.planeID
     
     def SortVertices(self) -> None:
         """
@@ -239,10 +273,15 @@ class Face:
         self.vert_idx.sort(key=cmp_to_key(compare))
 
     def CalculateUVs(self) -> None:
-        normal = self.GetNormal()
+        """
+        Calculates the uvs of the vertices of the face.
+
+        The uvs of the whole brush are calculated again in one pass by `Brush.CalculateUVs`,
+        so the `uv_idx` of the other faces of the brush can change.
+        When the texture sizes of several faces change, set all of them first and call `Brush.CalculateUVs` once.
+        """
 
-        for idx in self.vert_idx:
-            self.AddUV(self.uvData.GetUV(self.parent.verts[idx], normal, self.texSize))
+        self.parent.CalculateUVs()
 
     def Triangulate(self, return_idx=False) -> List[Tuple[Vector, Vector]]:
         verts = self.vert_idx if return_idx else self.GetVerts()
@@ -0,0 +1,115 @@
+import numpy as np
+from mathutils import Vector
+from typing import List
+from .Face import Face, StandardUV, ValveUV
+
+class FaceBatch:
+    """
+    Plane points, materials and texture alignment of many brush faces, stored in NumPy arrays.
+
+    All the numbers are converted in a single call instead of one `float()` per token,
+    and `Face` objects are only created when a brush asks for them.
+    """
+
+    __slots__ = ("points", "materials", "materialIDs", "planeIDs", "valve", "uvParams")
+
+    points: np.ndarray # (N, 9) three plane points per face
+    materials: List[str]
+    materialIDs: List[int] # ids in the map's MaterialRegistry, -1 until the brush is added to a map
+    planeIDs: List[int] # ids in the map's PlaneTable, -1 until the brush is added to a map
+    valve: np.ndarray # (N,) True for faces using the Valve UV format
+    uvParams: np.ndarray # (N, 10) x/y offset, rotation, x/y scale for standard faces. u axis, u offset, v axis, v offset, u/v scale for Valve faces
+
+    def __init__(self) -> None:
+        self.points = np.zeros((0, 9))
+        self.materials = []
+        self.materialIDs = []
+        self.planeIDs = []
+        self.valve = np.zeros(0, dtype=bool)
+        self.uvParams = np.zeros((0, 10))
+
+    def __len__(self) -> int:
+        return len(self.materials)
+
+    @staticmethod
+    def FromTokens(faces: List[List[str]]) -> 'FaceBatch':
+        """
+        Converts the tokens of a list of face lines, in the same layout `Face.FromTokens` uses.
+        """
+
+        res = FaceBatch()
+        points: List[str] = []
+        standard: List[str] = []
+        valve: List[str] = []
+        isValve: List[bool] = []
+
+        for tok in faces:
+            points += tok[1:4]
+            points += tok[6:9]
+            points += tok[11:14]
+            res.materials.append(tok[15].lower())
+
+            if tok[16] == "[": # Valve UV format
+                valve += tok[17:21]
+                valve += tok[23:27]
+                valve += tok[29:31]
+                isValve.append(True)
+            else:
+                standard += tok[16:21]
+                isValve.append(False)
+
+        res.materialIDs = [-1] * len(faces)
+        res.planeIDs = [-1] * len(faces)
+        res.points = np.array(points, dtype=np.float64).reshape(-1, 9)
+        res.valve = np.array(isValve, dtype=bool)
+        res.uvParams = np.zeros((len(faces), 10))
+        res.uvParams[~res.valve, :5] = np.array(standard, dtype=np.float64).reshape(-1, 5)
+        res.uvParams[res.valve] = np.array(valve, dtype=np.float64).reshape(-1, 10)
+
+        return res
+
+    @staticmethod
+    def FromFaces(faces: List[Face]) -> 'FaceBatch':
+        """
+        Collects existing `Face` objects into a batch.
+        """
+
+        res = FaceBatch()
+        res.materials = [face.material for face in faces]
+        res.materialIDs = [face.materialID for face in faces]
+        res.planeIDs = [face.planeID for face in faces]
+        res.points = np.array([(*face.p1, *face.p2, *face.p3) for face in faces], dtype=np.float64).reshape(-1, 9)
+        res.valve = np.array([isinstance(face.uvData, ValveUV) for face in faces], dtype=bool)
+        res.uvParams = np.array([face.uvData.GetParams() for face in faces], dtype=np.float64).reshape(-1, 10)
+
+        return res
+
+    def GetFaces(self, start: int = 0, end: int = None) -> List[Face]:
+        """
+        Creates `Face` objects for the faces in the given range.
+        """
+
+        end = len(self) if end is None else end
+        res: List[Face] = []
+
+        for p, material, materialID, planeID, valve, params in zip(
+            self.points[start:end].tolist(), self.materials[start:end], self.materialIDs[start:end], self.planeIDs[start:end],
+            self.valve[start:end].tolist(), self.uvParams[start:end].tolist()
+        ):
+            if valve:
+                uvData = ValveUV()
+                uvData.uAxis, uvData.uOffset = Vector(params[0:3]), params[3]
+                uvData.vAxis, uvData.vOffset = Vector(params[4:7]), params[7]
+                uvData.uScale, uvData.vScale = params[8], params[9]
+            else:
+                uvData = StandardUV()
+                uvData.xOffset, uvData.yOffset = params[0], params[1]
+                uvData.rotation = params[2]
+                uvData.xScale, uvData.yScale = params[3], params[4]
+
+            face = Face((Vector(p[0:3]), Vector(p[3:6]), Vector(p[6:9])), material, uvData)
+            face.materialID = materialID
+            face.planeID = planeID
+            res.append(face)
+
+        return res
@@ -0,0 +1,380 @@
+import os
+import zlib
+from struct import pack, unpack, calcsize, error as StructError
+from tempfile import gettempdir
+from typing import Dict, Iterator, List, Tuple
+from zipfile import ZipFile, BadZipFile, ZIP_STORED, ZIP_DEFLATED
+from .Cache import WriteString, ReadString
+from ..func.Helpers import shortenPath
+
+MAGIC = b"GAMEFSIX"
+VERSION = 1
+HEADER = "<8si" # magic, version
+
+LOCAL_HEADER = "<4s5H3I2H" # signature, version, flags, method, time, date, crc, sizes, name and extra field lengths
+
+def ProbeImageSize(data: bytes) -> Tuple[int, int]:
+    """
+    Returns the size of a tga, jpg or png image from the first bytes of its file, or `None` if they don't hold it.
+    """
+
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return unpack(">II", data[16:24])
+
+    if data[:2] == b"\xff\xd8":
+        # walk the markers up to the start of frame
+        i = 2
+        while i + 9 <= len(data):
+            if data[i] != 0xFF:
+                return None
+
+            marker = data[i + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                i += 2
+                continue
+
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = unpack(">HH", data[i + 5:i + 9])
+                return width, height
+
+            i += 2 + unpack(">H", data[i + 2:i + 4])[0]
+
+        return None
+
+    # tga files don't have a signature, so the header is only checked for an image type that makes sense
+    if len(data) >= 18 and data[2] in (1, 2, 3, 9, 10, 11):
+        return unpack("<HH", data[12:16])
+
+    return None
+
+# archive name ("" for loose files), file name in the archive or under the game path, local header offset,
+# compression method, compressed size and a stamp that changes with the contents (crc or modification time)
+FileEntry = Tuple[str, str, int, int, int, int]
+
+class GameFileSystem:
+    """
+    The files of a game path as the engine sees them: loose files and the contents of its `.pk3` archives, by lowercase path.
+
+    Archives are applied in name order over the loose files, so a file in a later archive overrides the same file anywhere before it.
+    Only the central directory of the archives is read to index them, and files are read straight out of them without extracting anything.
+
+    The index is saved with the modification time of every folder and archive it read, and only what changed is read again.
+    """
+
+    __slots__ = ("root", "dirs", "loose", "archives", "files", "version")
+
+    root: str
+    dirs: Dict[str, int] # loose folder path relative to root -> modification time in nanoseconds
+    loose: Dict[str, FileEntry] # path -> loose file
+    archives: Dict[str, Tuple[int, int, Dict[str, FileEntry]]] # archive name -> size, modification time, files in it
+    files: Dict[str, FileEntry] # path -> file the engine would use
+    version: int # increased every time `files` changes
+
+    # top level folders that are indexed. the rest of the game path isn't needed for materials
+    folders: Tuple[str, ...] = ("textures", "scripts", "models", "gfx", "env")
+
+    # file systems of the game paths that were used so far, shared by everything that reads game files
+    loaded: Dict[str, 'GameFileSystem'] = {}
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self.dirs = {}
+        self.loose = {}
+        self.archives = {}
+        self.files = {}
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def __contains__(self, path: str) -> bool:
+        return self.GetName(path) in self.files
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.files)
+
+    @staticmethod
+    def GetName(path: str) -> str:
+        return path.replace("\\", "/").strip().lower()
+
+    def IsIndexed(self, name: str) -> bool:
+        return name.split("/", 1)[0] in self.folders and not name.endswith("/")
+
+    @staticmethod
+    def IsScript(name: str) -> bool:
+        return name.startswith("scripts/")
+
+    def GetStamp(self, path: str) -> int:
+        return self.files[self.GetName(path)][5]
+
+    def GetFilePath(self, path: str) -> str:
+        """
+        Returns where a loose file is on disk, or `None` if the file is in an archive or doesn't exist.
+        """
+
+        entry = self.files.get(self.GetName(path))
+        return None if entry is None or entry[0] != "" else os.path.join(self.root, entry[1])
+
+    def ReadFile(self, path: str, size: int = -1) -> bytes:
+        """
+        Returns the contents of a file, or its first `size` bytes.
+        """
+
+        archive, name, offset, method, compressedSize, _ = self.files[self.GetName(path)]
+
+        if archive == "":
+            with open(os.path.join(self.root, name), "rb") as file:
+                return file.read(size)
+
+        with open(os.path.join(self.root, archive), "rb") as file:
+            file.seek(offset)
+            header = unpack(LOCAL_HEADER, file.read(calcsize(LOCAL_HEADER)))
+            flags, nameLength, extraLength = header[2], header[9], header[10]
+
+            # encrypted files and other compression methods are left to zipfile
+            if flags & 1 or method not in (ZIP_STORED, ZIP_DEFLATED):
+                with ZipFile(file) as zip:
+                    data = zip.read(name)
+                    return data if size < 0 else data[:size]
+
+            file.seek(nameLength + extraLength, os.SEEK_CUR)
+
+            if method == ZIP_STORED:
+                return file.read(compressedSize if size < 0 else min(size, compressedSize))
+
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+
+            if size < 0:
+                return decompressor.decompress(file.read(compressedSize))
+
+            # only as much is decompressed as is needed for the first bytes
+            res = b""
+            left = compressedSize
+            while len(res) < size and left > 0:
+                chunk = file.read(min(left, 1 << 16))
+                left -= len(chunk)
+                res += decompressor.decompress(chunk, size - len(res))
+                if decompressor.unconsumed_tail:
+                    break
+
+            return res[:size]
+
+    def GetImageSize(self, path: str) -> Tuple[int, int]:
+        """
+        Returns the size of an image without decoding it, or `None` if it can't be found from the start of the file.
+        """
+
+        try:
+            size = ProbeImageSize(self.ReadFile(path, 1 << 12))
+            # jpg files can have large metadata before the size
+            if size is None and path.lower().endswith((".jpg", ".jpeg")):
+                size = ProbeImageSize(self.ReadFile(path))
+        except (OSError, StructError, zlib.error):
+            return None
+
+        return size
+
+    def ScanLoose(self) -> None:
+        self.dirs.clear()
+        self.loose.clear()
+
+        stack: List[str] = [folder for folder in os.listdir(self.root) if folder.lower() in self.folders and os.path.isdir(os.path.join(self.root, folder))]
+
+        while len(stack) != 0:
+            dir = stack.pop()
+            path = os.path.join(self.root, dir)
+            self.dirs[dir] = os.stat(path).st_mtime_ns
+
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    rel = f"{dir}/{entry.name}"
+
+                    if entry.is_dir():
+                        stack.append(rel)
+                        continue
+
+                    # only scripts are read by what they contain, so other files aren't stat'ed
+                    name = self.GetName(rel)
+                    self.loose[name] = ("", rel, 0, 0, 0, entry.stat().st_mtime_ns if self.IsScript(name) else 0)
+
+    def IsLooseValid(self) -> bool:
+        """
+        Returns `True` if no loose folder was changed since the loose files were indexed.
+
+        Adding, removing or renaming a file or a folder changes the modification time of the folder that holds it.
+        Editing a file doesn't, so scripts are checked one by one.
+        """
+
+        try:
+            folders = sorted(folder for folder in os.listdir(self.root) if folder.lower() in self.folders and os.path.isdir(os.path.join(self.root, folder)))
+            return folders == sorted(dir for dir in self.dirs if "/" not in dir) and \
+                all(os.stat(os.path.join(self.root, dir)).st_mtime_ns == mtime for dir, mtime in self.dirs.items()) and \
+                all(os.stat(os.path.join(self.root, rel)).st_mtime_ns == stamp for name, (_, rel, _, _, _, stamp) in self.loose.items() if self.IsScript(name))
+        except OSError:
+            return False
+
+    def ReadArchive(self, archive: str) -> Dict[str, FileEntry]:
+        res: Dict[str, FileEntry] = {}
+
+        try:
+            with ZipFile(os.path.join(self.root, archive)) as zip:
+                for info in zip.infolist():
+                    name = self.GetName(info.filename)
+
+                    if self.IsIndexed(name):
+                        res[name] = (archive, info.filename, info.header_offset, info.compress_type, info.compress_size, info.CRC)
+
+        except (OSError, BadZipFile) as e:
+            print(f"Can't read archive {archive}: {e}")
+
+        return res
+
+    def Update(self) -> bool:
+        """
+        Indexes the loose folders and archives that were changed since the file system was indexed.
+
+        Returns `True` if anything changed.
+        """
+
+        changed = False
+
+        if not os.path.isdir(self.root):
+            if len(self.files) != 0 or len(self.dirs) != 0 or len(self.archives) != 0:
+                self.dirs.clear()
+                self.loose.clear()
+                self.archives.clear()
+                self.files.clear()
+                self.version += 1
+                return True
+            return False
+
+        if not self.IsLooseValid():
+            self.ScanLoose()
+            changed = True
+
+        with os.scandir(self.root) as entries:
+            stats = {entry.name: entry.stat() for entry in entries if entry.name.lower().endswith(".pk3") and entry.is_file()}
+
+        for archive in list(self.archives):
+            if archive not in stats:
+                del self.archives[archive]
+                changed = True
+
+        for archive, stat in stats.items():
+            old = self.archives.get(archive)
+
+            if old is None or old[0] != stat.st_size or old[1] != stat.st_mtime_ns:
+                self.archives[archive] = (stat.st_size, stat.st_mtime_ns, self.ReadArchive(archive))
+                changed = True
+
+        if changed:
+            self.BuildFiles()
+
+        return changed
+
+    def BuildFiles(self) -> None:
+        self.files = dict(self.loose)
+
+        # like the engine, later archives override earlier ones and all of them override loose files
+        for archive in sorted(self.archives, key=str.lower):
+            self.files.update(self.archives[archive][2])
+
+        self.version += 1
+
+    def Write(self, path: str) -> None:
+        tmpPath = f"{path}.{os.getpid()}.tmp"
+
+        def WriteEntries(file, entries: Dict[str, FileEntry]):
+            file.write(pack("<i", len(entries)))
+            for _, name, offset, method, compressedSize, stamp in entries.values():
+                WriteString(file, name)
+                file.write(pack("<qiqq", offset, method, compressedSize, stamp))
+
+        try:
+            with open(tmpPath, "wb") as file:
+                file.write(pack(HEADER, MAGIC, VERSION))
+                WriteString(file, self.root)
+
+                file.write(pack("<i", len(self.dirs)))
+                for dir, mtime in self.dirs.items():
+                    WriteString(file, dir)
+                    file.write(pack("<q", mtime))
+                WriteEntries(file, self.loose)
+
+                file.write(pack("<i", len(self.archives)))
+                for archive, (size, mtime, entries) in self.archives.items():
+                    WriteString(file, archive)
+                    file.write(pack("<qq", size, mtime))
+                    WriteEntries(file, entries)
+
+            os.replace(tmpPath, path)
+        except OSError as e:
+            print(f"Can't write file system index {path}: {e}")
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+
+    def Read(self, path: str) -> bool:
+        """
+        Fills the index from a file written by `Write`. `Update` or `BuildFiles` has to be called afterwards.
+        """
+
+        if not os.path.exists(path):
+            return False
+
+        def ReadEntries(file, archive: str) -> Dict[str, FileEntry]:
+            res: Dict[str, FileEntry] = {}
+            count, = unpack("<i", file.read(4))
+            for _ in range(count):
+                name = ReadString(file)
+                res[self.GetName(name)] = (archive, name, *unpack("<qiqq", file.read(28)))
+            return res
+
+        try:
+            with open(path, "rb") as file:
+                magic, version = unpack(HEADER, file.read(calcsize(HEADER)))
+
+                if magic != MAGIC or version != VERSION or ReadString(file) != self.root:
+                    return False
+
+                numDirs, = unpack("<i", file.read(4))
+                self.dirs = {ReadString(file): unpack("<q", file.read(8))[0] for _ in range(numDirs)}
+                self.loose = ReadEntries(file, "")
+
+                numArchives, = unpack("<i", file.read(4))
+                for _ in range(numArchives):
+                    archive = ReadString(file)
+                    size, mtime = unpack("<qq", file.read(16))
+                    self.archives[archive] = (size, mtime, ReadEntries(file, archive))
+
+        except (OSError, StructError, UnicodeDecodeError) as e:
+            print(f"Can't read file system index {path}: {e}")
+            self.dirs, self.loose, self.archives = {}, {}, {}
+            return False
+
+        return True
+
+    @staticmethod
+    def GetCachePath(root: str) -> str:
+        return os.path.join(gettempdir(), f"mapcompiler_{shortenPath(os.path.abspath(root), 8)}.fsindex")
+
+    @staticmethod
+    def Get(gamePath: str) -> 'GameFileSystem':
+        """
+        Returns the file system of a game path, reusing the index from an earlier import or from the disk cache if it can.
+        """
+
+        fs = GameFileSystem.loaded.get(gamePath)
+
+        if fs is None:
+            fs = GameFileSystem.loaded[gamePath] = GameFileSystem(gamePath)
+            cachePath = GameFileSystem.GetCachePath(gamePath)
+            fs.Read(cachePath)
+
+            if fs.Update():
+                fs.Write(cachePath)
+            else:
+                fs.BuildFiles()
+        elif fs.Update():
+            fs.Write(GameFileSystem.GetCachePath(gamePath))
+
+        return fs
@@ -0,0 +1,151 @@
+import os
+import zipfile
+import numpy as np
+from collections import OrderedDict
+from hashlib import blake2b
+from typing import Tuple
+
+class GeometryCache:
+    """
+    Computed brush windings and tessellated patch vertices, keyed by a hash of the brush planes or the patch control grid.
+
+    Positions are hashed and stored relative to a reference point, so translated copies of the same brush or patch share an entry.
+    Entries are kept in memory with least recently used eviction and, if `path` is given, in a directory that is shared across imports.
+    """
+
+    __slots__ = ("maxSize", "path", "entries", "hits", "misses", "diskHits")
+
+    maxSize: int
+    path: str
+    entries: 'OrderedDict[str, Tuple[np.ndarray, ...]]'
+    hits: int
+    misses: int
+    diskHits: int # hits that were read from the disk store, counted in hits too
+
+    # cache used by Brush.CalculateVerts and the patch tessellator, None to disable it
+    active: 'GeometryCache' = None
+
+    def __init__(self, maxSize: int = 4096, path: str = None) -> None:
+        self.maxSize = maxSize
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.diskHits = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __str__(self) -> str:
+        return f"{self.hits} hits ({self.diskHits} from disk), {self.misses} misses, {len(self.entries)} entries"
+
+    @staticmethod
+    def Hash(kind: str, values: np.ndarray) -> str:
+        digest = blake2b(digest_size=16)
+        digest.update(f"{kind} {values.shape}".encode())
+        # rounded to hide float noise, and + 0.0 turns -0.0 into 0.0
+        digest.update(np.ascontiguousarray(np.round(values, 5) + 0.0, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def BrushKey(points: np.ndarray, engine: str) -> Tuple[str, np.ndarray]:
+        """
+        Returns the key of a brush from the (N, 9) array of its plane points and the engine that calculates it,
+        and the reference point its vertices are stored relative to.
+        """
+
+        ref = points[0, 0:3].copy()
+        return GeometryCache.Hash(f"brush {engine}", points.reshape(-1, 3) - ref), ref
+
+    @staticmethod
+    def PatchKey(grid: np.ndarray, level: int, tolerance: float = None) -> Tuple[str, np.ndarray]:
+        """
+        Returns the key of a patch from its (H, W, 5) control grid of positions and uvs and its tessellation level and tolerance,
+        and the reference point its vertices are stored relative to.
+        """
+
+        ref = grid[0, 0, 0:3].copy()
+        rel = grid.copy()
+        rel[..., 0:3] -= ref
+        return GeometryCache.Hash(f"patch {level} {tolerance}", rel), ref
+
+    def GetFilePath(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], f"{key}.npz")
+
+    def Get(self, key: str) -> Tuple[np.ndarray, ...]:
+        """
+        Returns the arrays stored for the key, or `None` if there aren't any.
+        """
+
+        res = self.entries.get(key)
+
+        if res is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return res
+
+        if self.path is not None:
+            res = self.Read(key)
+
+            if res is not None:
+                self.hits += 1
+                self.diskHits += 1
+                self.Store(key, res)
+                return res
+
+        self.misses += 1
+        return None
+
+    def Put(self, key: str, arrays: Tuple[np.ndarray, ...]) -> None:
+        self.Store(key, arrays)
+
+        if self.path is not None:
+            self.Write(key, arrays)
+
+    def Store(self, key: str, arrays: Tuple[np.ndarray, ...]) -> None:
+        self.entries[key] = arrays
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def Read(self, key: str) -> Tuple[np.ndarray, ...]:
+        filePath = self.GetFilePath(key)
+
+        if not os.path.exists(filePath):
+            return None
+
+        try:
+            with np.load(filePath, allow_pickle=False) as data:
+                return tuple(data[f"arr_{i}"] for i in range(len(data.files)))
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile) as e:
+            print(f"Can't read geometry cache entry {filePath}: {e}")
+
+        # a broken entry is removed, so it's written again instead of failing on every import
+        try:
+            os.remove(filePath)
+        except OSError:
+            pass
+
+        return None
+
+    def Write(self, key: str, arrays: Tuple[np.ndarray, ...]) -> None:
+        filePath = self.GetFilePath(key)
+        tmpPath = f"{filePath}.{os.getpid()}.tmp"
+
+        # written to a temporary file first, so other imports never read a half written entry
+        try:
+            os.makedirs(os.path.dirname(filePath), exist_ok=True)
+
+            with open(tmpPath, "wb") as file:
+                np.savez(file, *arrays)
+
+            os.replace(tmpPath, filePath)
+        except OSError as e:
+            print(f"Can't write geometry cache entry {filePath}: {e}")
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+
+    def Clear(self) -> None:
+        self.entries.clear()
+        self.hits = self.misses = self.diskHits = 0
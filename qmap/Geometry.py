@@ -0,0 +1,535 @@
+import numpy as np
+from mathutils import Vector
+from typing import List, Tuple
+from .Brush import Brush, PackedBrush
+from .Face import Face, StandardUV, ValveUV
+from .FaceBatch import FaceBatch
+from .Weld import WeldArray
+from .Triangles import FanTriangles
+from .UVs import ProjectUVs
+from .CSG import GetPlanes
+
+class MapGeometry:
+    """
+    Struct-of-arrays store for the brush geometry of a whole map.
+
+    Planes, vertices, uvs, face/brush/entity relations and material ids are kept in contiguous NumPy arrays.
+    `BrushView` and `FaceView` give the usual `Brush` and `Face` interface on top of them.
+    """
+
+    __slots__ = (
+        "materials", "planes", "points", "valve", "uvParams", "texSizes", "faceMaterial", "facePlane", "faceBrush",
+        "faceVertStart", "faceVerts", "faceUVStart", "faceUVs", "faceLm", "lms",
+        "verts", "uvs", "brushFaceStart", "brushVertStart", "brushUVStart", "brushEntity", "brushGeo",
+        "__brushBounds__", "__triangles__"
+    )
+
+    materials: List[str]
+    planes: np.ndarray # (F, 4) normal and distance
+    points: np.ndarray # (F, 9) plane points
+    valve: np.ndarray # (F,)
+    uvParams: np.ndarray # (F, 10) same layout as FaceBatch.uvParams
+    texSizes: np.ndarray # (F, 2)
+    faceMaterial: np.ndarray # (F,) index into materials
+    facePlane: np.ndarray # (F,) index into the map's PlaneTable
+    faceBrush: np.ndarray # (F,)
+    faceVertStart: np.ndarray # (F + 1,) offsets into faceVerts
+    faceVerts: np.ndarray # indices into verts
+    faceUVStart: np.ndarray # (F + 1,) offsets into faceUVs
+    faceUVs: np.ndarray # indices into uvs
+    faceLm: np.ndarray # (F,) True for faces with lightmap uvs in lms
+    lms: np.ndarray # (len(faceVerts), 2) lightmap uv of each face corner
+    verts: np.ndarray # (V, 3)
+    uvs: np.ndarray # (U, 2)
+    brushFaceStart: np.ndarray # (B + 1,) offsets into the face arrays
+    brushVertStart: np.ndarray # (B + 1,) offsets into verts
+    brushUVStart: np.ndarray # (B + 1,) offsets into uvs
+    brushEntity: np.ndarray # (B,) entity id
+    brushGeo: np.ndarray # (B,) index of the brush in its entity's geo
+
+    __brushBounds__: np.ndarray
+    __triangles__: Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+    @staticmethod
+    def FromMap(mapData: 'Map') -> 'MapGeometry':
+        """
+        Copies the brushes of the map into a new store. Vertices and uvs are copied as they are, so calculate them first.
+
+        Brushes are read through `Brush.Pack` and `Brush.GetFaceBatch`, so the ones calculated in a process pool
+        are copied without making `Face` or `Vector` objects.
+        """
+
+        res = MapGeometry()
+        res.materials = list(mapData.materials)
+
+        brushes: List[Brush] = [geo for entity in mapData.entities for geo in entity.geo if isinstance(geo, Brush)]
+        packed = [brush.Pack() for brush in brushes]
+        batches = [brush.GetFaceBatch() for brush in brushes]
+
+        res.brushEntity = np.array([brush.id[0] for brush in brushes], dtype=np.int32)
+        res.brushGeo = np.array([brush.id[1] for brush in brushes], dtype=np.int32)
+        res.brushFaceStart = Offsets([end - start for _, start, end in batches])
+        res.brushVertStart = Offsets([len(verts) for verts, *_ in packed])
+        res.brushUVStart = Offsets([len(uvs) for _, uvs, *_ in packed])
+
+        res.verts = Concatenate([verts for verts, *_ in packed], (0, 3), np.float32)
+        res.uvs = Concatenate([uvs for _, uvs, *_ in packed], (0, 2), np.float32)
+
+        res.points = Concatenate([batch.points[start:end] for batch, start, end in batches], (0, 9), np.float64)
+        normals, dists, _ = GetPlanes(res.points)
+        res.planes = np.concatenate((normals, dists[:, None]), axis=1)
+        res.valve = Concatenate([batch.valve[start:end] for batch, start, end in batches], (0,), bool)
+        res.uvParams = Concatenate([batch.uvParams[start:end] for batch, start, end in batches], (0, 10), np.float64)
+        res.texSizes = Concatenate([p[6] for p in packed], (0, 2), np.float32)
+        res.faceMaterial = np.array([i for batch, start, end in batches for i in batch.materialIDs[start:end]], dtype=np.int32)
+        res.facePlane = np.array([i for batch, start, end in batches for i in batch.planeIDs[start:end]], dtype=np.int32)
+        res.faceBrush = np.repeat(np.arange(len(brushes), dtype=np.int32), np.diff(res.brushFaceStart))
+
+        # face indices are stored map-wide, so the brush offset is added to them
+        numFaces = np.diff(res.brushFaceStart)
+        res.faceVertStart = Offsets(Concatenate([p[2] for p in packed], (0,), np.int32))
+        res.faceVerts = Concatenate([p[3] for p in packed], (0,), np.int32) + np.repeat(np.repeat(res.brushVertStart[:-1], numFaces), np.diff(res.faceVertStart))
+        res.faceUVStart = Offsets(Concatenate([p[4] for p in packed], (0,), np.int32))
+        res.faceUVs = Concatenate([p[5] for p in packed], (0,), np.int32) + np.repeat(np.repeat(res.brushUVStart[:-1], numFaces), np.diff(res.faceUVStart))
+
+        res.faceLm = np.zeros(len(res.faceBrush), dtype=bool)
+        res.lms = np.zeros((len(res.faceVerts), 2), dtype=np.float32)
+
+        for brush, start in zip(brushes, res.brushFaceStart[:-1].tolist()):
+            # packed brushes never had their faces made, so they have no lightmap uvs
+            if brush.IsPacked():
+                continue
+
+            for i, face in enumerate(brush.faces, start):
+                if len(face.lm) != 0 and len(face.lm) == len(face.vert_idx):
+                    res.faceLm[i] = True
+                    res.lms[res.faceVertStart[i]:res.faceVertStart[i + 1]] = [tuple(lm) for lm in face.lm]
+
+        res.__brushBounds__ = None
+        res.__triangles__ = None
+
+        return res
+
+    def GetBrushBounds(self) -> np.ndarray:
+        """
+        Returns a (B, 2, 3) array with the minimum and maximum point of every brush.
+        Brushes without vertices get NaN bounds.
+        """
+
+        if self.__brushBounds__ is not None:
+            return self.__brushBounds__
+
+        numBrushes = len(self.brushEntity)
+        res = np.full((numBrushes, 2, 3), np.nan, dtype=np.float32)
+        counts = np.diff(self.brushVertStart)
+        filled = counts > 0
+
+        if filled.any():
+            starts = self.brushVertStart[:-1][filled]
+            res[filled, 0] = np.minimum.reduceat(self.verts, starts, axis=0)
+            res[filled, 1] = np.maximum.reduceat(self.verts, starts, axis=0)
+
+        self.__brushBounds__ = res
+        return res
+
+    def GetBoundingBox(self) -> Tuple[Vector, Vector]:
+        if len(self.verts) == 0:
+            return None
+
+        return Vector(self.verts.min(axis=0).tolist()), Vector(self.verts.max(axis=0).tolist())
+
+    def GetTriangles(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Triangulates every face of the map into `int32` index buffers.
+
+        Returns the (F + 1,) offsets of each face's triangles, and (T, 3) arrays of indices into `verts` and `uvs`.
+        """
+
+        if self.__triangles__ is not None:
+            return self.__triangles__
+
+        triStart, corners = FanTriangles(self.faceVertStart)
+        triUVs = self.faceUVs[corners] if len(self.faceUVs) == len(self.faceVerts) else None
+
+        self.__triangles__ = triStart, self.faceVerts[corners], triUVs
+        return self.__triangles__
+
+    def CalculateUVs(self, brushes: List[int]) -> None:
+        """
+        Calculates the uvs of the given brushes again, for the current `texSizes` of their faces, with one `ProjectUVs` call.
+
+        The uvs of each brush are welded like `Brush.CalculateUVs` welds them. If every brush ends up with as many uvs as it had,
+        they are written over its slice of `uvs`. Otherwise `uvs` and `faceUVs` are rebuilt once for the whole map,
+        so pass every brush that needs new uvs in the same call.
+        """
+
+        brushes = np.unique(np.asarray(brushes, dtype=np.int32))
+        faces = Ranges(self.brushFaceStart[brushes], self.brushFaceStart[brushes + 1])
+        counts = self.faceVertStart[faces + 1] - self.faceVertStart[faces]
+        corners = Ranges(self.faceVertStart[faces], self.faceVertStart[faces + 1])
+
+        uvs = ProjectUVs(
+            self.verts[self.faceVerts[corners]].astype(np.float64), np.repeat(np.arange(len(faces)), counts),
+            self.planes[faces, 0:3], self.valve[faces], self.uvParams[faces], self.texSizes[faces].astype(np.float64)
+        )
+
+        # the brush is welded along with the uvs, so uvs of different brushes are never merged
+        cornerBrush = np.repeat(self.faceBrush[faces], counts)
+        welded, inverse = WeldArray(np.column_stack((uvs, cornerBrush)), Brush.uvEpsilon)
+        weldedBrush = welded[:, 2].astype(np.int32)
+
+        uvStart, uvEnd = self.brushUVStart[brushes], self.brushUVStart[brushes + 1]
+        sameFaces = np.array_equal(self.faceUVStart[faces + 1] - self.faceUVStart[faces], counts)
+        sameBrushes = np.array_equal(np.bincount(np.searchsorted(brushes, weldedBrush), minlength=len(brushes)), uvEnd - uvStart)
+
+        if sameFaces and sameBrushes:
+            rows = Ranges(uvStart, uvEnd)
+            self.uvs[rows] = welded[:, 0:2]
+            self.faceUVs[Ranges(self.faceUVStart[faces], self.faceUVStart[faces + 1])] = rows[inverse]
+            self.__triangles__ = None
+            return
+
+        numBrushes, numFaces = len(self.brushEntity), len(self.faceBrush)
+        brushMask = np.zeros(numBrushes, dtype=bool)
+        brushMask[brushes] = True
+        faceMask = np.zeros(numFaces, dtype=bool)
+        faceMask[faces] = True
+
+        # the uvs of the other brushes are kept, and every uv is sorted by brush again
+        uvBrush = np.repeat(np.arange(numBrushes, dtype=np.int32), np.diff(self.brushUVStart))
+        keep = ~brushMask[uvBrush]
+        allBrush = np.concatenate((uvBrush[keep], weldedBrush))
+        order = np.argsort(allBrush, kind="stable")
+        position = np.empty(len(order), dtype=np.int32)
+        position[order] = np.arange(len(order), dtype=np.int32)
+
+        oldToNew = np.full(len(self.uvs), -1, dtype=np.int32)
+        oldToNew[keep] = position[:int(keep.sum())]
+        weldedToNew = position[int(keep.sum()):]
+
+        oldCounts = np.diff(self.faceUVStart)
+        newCounts = np.where(faceMask, np.diff(self.faceVertStart), oldCounts)
+        oldEntries = faceMask[np.repeat(np.arange(numFaces), oldCounts)]
+        newEntries = faceMask[np.repeat(np.arange(numFaces), newCounts)]
+
+        faceUVs = np.empty(int(newCounts.sum()), dtype=np.int32)
+        faceUVs[~newEntries] = oldToNew[self.faceUVs[~oldEntries]]
+        faceUVs[newEntries] = weldedToNew[inverse]
+
+        self.uvs = np.concatenate((self.uvs[keep], welded[:, 0:2].astype(self.uvs.dtype)))[order]
+        self.faceUVs = faceUVs
+        self.faceUVStart = Offsets(newCounts)
+        self.brushUVStart = Offsets(np.bincount(allBrush, minlength=numBrushes))
+        self.__triangles__ = None
+
+    def GetWeldedVerts(self, epsilon: float = 1e-3) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Welds the vertices of every brush into one map-wide buffer.
+
+        Returns the welded vertices and `faceVerts` pointing into them.
+        """
+
+        verts, inverse = WeldArray(self.verts, epsilon)
+        return verts, inverse[self.faceVerts]
+
+    def GetBrush(self, index: int) -> 'BrushView':
+        return BrushView(self, index)
+
+def Offsets(counts: List[int]) -> np.ndarray:
+    res = np.zeros(len(counts) + 1, dtype=np.int32)
+    np.cumsum(counts, out=res[1:])
+    return res
+
+def Concatenate(arrays: List[np.ndarray], empty: Tuple[int, ...], dtype) -> np.ndarray:
+    return np.concatenate(arrays).astype(dtype) if len(arrays) != 0 else np.zeros(empty, dtype=dtype)
+
+def Ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    Returns the indices of every `start:end` range, one range after the other.
+    """
+
+    counts = ends - starts
+    return (np.repeat(starts - Offsets(counts)[:-1], counts) + np.arange(counts.sum())).astype(np.int32)
+
+def GetUVParams(uvData) -> Tuple[float, ...]:
+    return uvData.GetParams()
+
+class BrushView(Brush):
+    """
+    A brush stored in a `MapGeometry`. Its vertices are already calculated, so `CalculateVerts` does nothing,
+    and `CalculateUVs` calculates the uvs of the brush again in the store.
+
+    The store has a fixed layout, so faces, vertices and uvs can't be added to a view.
+    """
+
+    __slots__ = ("geometry", "index")
+
+    geometry: MapGeometry
+    index: int
+
+    def __init__(self, geometry: MapGeometry, index: int) -> None:
+        self.geometry = geometry
+        self.index = index
+
+        # the members `Brush` keeps its geometry in are unused, the store holds it
+        self.__verts__ = None
+        self.__uvs__ = None
+        self.__faces__ = None
+        self.__batch__ = None
+        self.__packed__ = None
+        self.__boundingBox__ = None
+        self.__vertWeld__ = None
+        self.__uvWeld__ = None
+
+    def __str__(self) -> str:
+        res = "{\n"
+
+        for face in self.faces:
+            res += str(face) + "\n"
+
+        res += "}\n"
+
+        return res
+
+    @property
+    def id(self) -> Tuple[int, int]:
+        return int(self.geometry.brushEntity[self.index]), int(self.geometry.brushGeo[self.index])
+
+    @property
+    def faces(self) -> List['FaceView']:
+        start, end = self.geometry.brushFaceStart[self.index:self.index + 2].tolist()
+        return [FaceView(self, i) for i in range(start, end)]
+
+    @property
+    def verts(self) -> List[Vector]:
+        start, end = self.geometry.brushVertStart[self.index:self.index + 2].tolist()
+        return [Vector(v) for v in self.geometry.verts[start:end].tolist()]
+
+    @property
+    def uvs(self) -> List[Vector]:
+        start, end = self.geometry.brushUVStart[self.index:self.index + 2].tolist()
+        return [Vector(uv) for uv in self.geometry.uvs[start:end].tolist()]
+
+    def GetCounts(self) -> Tuple[int, int]:
+        geometry, index = self.geometry, self.index
+        return (
+            int(geometry.brushVertStart[index + 1] - geometry.brushVertStart[index]),
+            int(geometry.brushUVStart[index + 1] - geometry.brushUVStart[index])
+        )
+
+    def Pack(self) -> PackedBrush:
+        geometry, index = self.geometry, self.index
+        start, end = self.GetFaceRange()
+        vertStart, vertEnd = geometry.brushVertStart[index:index + 2].tolist()
+        uvStart, uvEnd = geometry.brushUVStart[index:index + 2].tolist()
+        faceVerts = geometry.faceVerts[geometry.faceVertStart[start]:geometry.faceVertStart[end]]
+        faceUVs = geometry.faceUVs[geometry.faceUVStart[start]:geometry.faceUVStart[end]]
+
+        return (
+            geometry.verts[vertStart:vertEnd].astype(np.float64), geometry.uvs[uvStart:uvEnd].astype(np.float64),
+            np.diff(geometry.faceVertStart[start:end + 1]), faceVerts - vertStart,
+            np.diff(geometry.faceUVStart[start:end + 1]), faceUVs - uvStart,
+            geometry.texSizes[start:end].astype(np.float64)
+        )
+
+    def GetFaceRange(self) -> Tuple[int, int]:
+        return tuple(self.geometry.brushFaceStart[self.index:self.index + 2].tolist())
+
+    def GetFaceBatch(self) -> Tuple['FaceBatch', int, int]:
+        geometry = self.geometry
+        start, end = self.GetFaceRange()
+
+        batch = FaceBatch()
+        batch.points = geometry.points[start:end]
+        batch.materialIDs = geometry.faceMaterial[start:end].tolist()
+        batch.materials = [geometry.materials[i] for i in batch.materialIDs]
+        batch.planeIDs = geometry.facePlane[start:end].tolist()
+        batch.valve = geometry.valve[start:end]
+        batch.uvParams = geometry.uvParams[start:end]
+
+        return batch, 0, end - start
+
+    def GetMaterials(self) -> List[str]:
+        start, end = self.GetFaceRange()
+        return [self.geometry.materials[i] for i in self.geometry.faceMaterial[start:end].tolist()]
+
+    def SetMaterialIDs(self, ids: List[int]) -> None:
+        start, end = self.GetFaceRange()
+        self.geometry.faceMaterial[start:end] = ids
+
+    def SetPlaneIDs(self, ids: List[int]) -> None:
+        start, end = self.GetFaceRange()
+        self.geometry.facePlane[start:end] = ids
+
+    def GetPlanePoints(self) -> np.ndarray:
+        start, end = self.GetFaceRange()
+        return self.geometry.points[start:end]
+
+    def AddFaces(self, batch: 'FaceBatch', start: int, end: int) -> None:
+        raise NotImplementedError("Faces can't be added to a brush in a MapGeometry")
+
+    def AddFace(self, face: Face) -> None:
+        raise NotImplementedError("Faces can't be added to a brush in a MapGeometry")
+
+    def AddVert(self, vert: Vector) -> int:
+        raise NotImplementedError("Vertices can't be added to a brush in a MapGeometry")
+
+    def AddUV(self, uv: Vector) -> int:
+        raise NotImplementedError("Uvs can't be added to a brush in a MapGeometry")
+
+    def SetWindings(self, windings: Tuple[np.ndarray, np.ndarray, np.ndarray], ref: np.ndarray) -> None:
+        raise NotImplementedError("The vertices of a brush in a MapGeometry can't be replaced")
+
+    def SortWindings(self) -> None:
+        raise NotImplementedError("The vertices of a brush in a MapGeometry can't be replaced")
+
+    def CalculateVerts(self, engine: str = None) -> None:
+        pass
+
+    def CalculateUVs(self) -> None:
+        """
+        Calculates the uvs of the brush again. See `MapGeometry.CalculateUVs`, which does many brushes at once.
+        """
+
+        self.geometry.CalculateUVs([self.index])
+
+    def GetTriangles(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        geometry = self.geometry
+        triStart, triVerts, triUVs = geometry.GetTriangles()
+        faceStart, faceEnd = geometry.brushFaceStart[self.index:self.index + 2].tolist()
+        start, end = triStart[[faceStart, faceEnd]].tolist()
+
+        return (
+            triStart[faceStart:faceEnd + 1] - start,
+            triVerts[start:end] - geometry.brushVertStart[self.index],
+            triUVs[start:end] - geometry.brushUVStart[self.index] if triUVs is not None else None
+        )
+
+    def GetBoundingBox(self) -> Tuple[Vector, Vector]:
+        # brushes without a volume have no vertices
+        if self.geometry.brushVertStart[self.index] == self.geometry.brushVertStart[self.index + 1]:
+            return None
+
+        bounds = self.geometry.GetBrushBounds()[self.index].tolist()
+        return Vector(bounds[0]), Vector(bounds[1])
+
+class FaceView(Face):
+    """
+    A brush face stored in a `MapGeometry`. `vert_idx` and `uv_idx` are relative to the brush, like they are in `Face`.
+    """
+
+    __slots__ = ("geometry", "index")
+
+    geometry: MapGeometry
+    index: int
+
+    def __init__(self, parent: BrushView, index: int) -> None:
+        self.geometry = parent.geometry
+        self.index = index
+        self.parent = parent
+
+    @property
+    def p1(self) -> Vector:
+        return Vector(self.geometry.points[self.index, 0:3].tolist())
+
+    @property
+    def p2(self) -> Vector:
+        return Vector(self.geometry.points[self.index, 3:6].tolist())
+
+    @property
+    def p3(self) -> Vector:
+        return Vector(self.geometry.points[self.index, 6:9].tolist())
+
+    @property
+    def material(self) -> str:
+        return self.geometry.materials[self.geometry.faceMaterial[self.index]]
+
+    @property
+    def materialID(self) -> int:
+        return int(self.geometry.faceMaterial[self.index])
+
+    @property
+    def planeID(self) -> int:
+        return int(self.geometry.facePlane[self.index])
+
+    @property
+    def uvData(self):
+        params = self.geometry.uvParams[self.index].tolist()
+
+        if self.geometry.valve[self.index]:
+            res = ValveUV()
+            res.uAxis, res.uOffset = Vector(params[0:3]), params[3]
+            res.vAxis, res.vOffset = Vector(params[4:7]), params[7]
+            res.uScale, res.vScale = params[8], params[9]
+        else:
+            res = StandardUV()
+            res.xOffset, res.yOffset = params[0], params[1]
+            res.rotation = params[2]
+            res.xScale, res.yScale = params[3], params[4]
+
+        return res
+
+    @property
+    def texSize(self) -> Vector:
+        return Vector(self.geometry.texSizes[self.index].tolist())
+
+    @texSize.setter
+    def texSize(self, value: Vector) -> None:
+        self.geometry.texSizes[self.index] = tuple(value)
+
+    @property
+    def vert_idx(self) -> List[int]:
+        start, end = self.geometry.faceVertStart[self.index:self.index + 2].tolist()
+        return (self.geometry.faceVerts[start:end] - self.geometry.brushVertStart[self.parent.index]).tolist()
+
+    @property
+    def uv_idx(self) -> List[int]:
+        start, end = self.geometry.faceUVStart[self.index:self.index + 2].tolist()
+        return (self.geometry.faceUVs[start:end] - self.geometry.brushUVStart[self.parent.index]).tolist()
+
+    @property
+    def lm(self) -> List[Vector]:
+        if not self.geometry.faceLm[self.index]:
+            return []
+
+        start, end = self.geometry.faceVertStart[self.index:self.index + 2].tolist()
+        return [Vector(lm) for lm in self.geometry.lms[start:end].tolist()]
+
+    @lm.setter
+    def lm(self, value: List[Vector]) -> None:
+        start, end = self.geometry.faceVertStart[self.index:self.index + 2].tolist()
+
+        if len(value) != 0:
+            self.geometry.lms[start:end] = [tuple(lm) for lm in value]
+
+        self.geometry.faceLm[self.index] = len(value) != 0
+
+    def GetNormal(self) -> Vector:
+        return Vector(self.geometry.planes[self.index, 0:3].tolist())
+
+    def GetDistance(self) -> float:
+        return float(self.geometry.planes[self.index, 3])
+
+    def GetVerts(self) -> List[Vector]:
+        start, end = self.geometry.faceVertStart[self.index:self.index + 2].tolist()
+        return [Vector(v) for v in self.geometry.verts[self.geometry.faceVerts[start:end]].tolist()]
+
+    def GetUVs(self) -> List[Vector]:
+        start, end = self.geometry.faceUVStart[self.index:self.index + 2].tolist()
+        return [Vector(uv) for uv in self.geometry.uvs[self.geometry.faceUVs[start:end]].tolist()]
+
+    def GetCenter(self) -> Vector:
+        start, end = self.geometry.faceVertStart[self.index:self.index + 2].tolist()
+
+        if start == end:
+            return None
+
+        return Vector(self.geometry.verts[self.geometry.faceVerts[start:end]].mean(axis=0).tolist())
+
+    def CalculateUVs(self) -> None:
+        """
+        Calculates the uvs of the face again, for its current `texSize`, along with the rest of its brush.
+        See `MapGeometry.CalculateUVs`.
+        """
+
+        self.geometry.CalculateUVs([self.parent.index])
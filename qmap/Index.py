@@ -0,0 +1,85 @@
+import mmap
+import os
+import re
+from locale import getpreferredencoding
+from typing import Iterator, List, Union
+from .Entity import Entity
+from .Brush import Brush
+from .Patch import Patch
+from .Chunks import ParseChunk, Renumber
+
+# key/value lines, other quoted strings, comments and braces
+TOKENS = re.compile(rb'^[ \t]*"([^"\n]*)"[ \t]+"([^\n]*)"[ \t]*\r?$|"[^"\n]*"|//[^\n]*|[{}]', re.M)
+
+class LazyGeo:
+    """
+    Location of an indexed entity in the map file. Its brushes and patches are parsed from there when they are first needed.
+    """
+
+    __slots__ = ("mapData", "path", "mtime", "start", "end", "line")
+
+    mapData: 'Map'
+    path: str
+    mtime: int
+    start: int
+    end: int
+    line: int
+
+    def __init__(self, mapData: 'Map', path: str, mtime: int, start: int, end: int, line: int) -> None:
+        self.mapData = mapData
+        self.path = path
+        self.mtime = mtime
+        self.start, self.end = start, end
+        self.line = line
+
+    def Load(self, entity: Entity) -> List[Union[Brush, Patch]]:
+        if os.stat(self.path).st_mtime_ns != self.mtime:
+            raise Exception(f"{self.path} has changed since it was indexed. Stopping...")
+
+        parsed = Renumber(ParseChunk(self.path, self.start, self.end, -1, self.line)[0], entity.id)
+        self.mapData.AddGeo(parsed.geo)
+
+        return parsed.geo
+
+def IndexEntities(path: str, mapData: 'Map') -> Iterator[Entity]:
+    """
+    Yields the entities of a map file with their key/values, without parsing their brushes and patches.
+
+    The file is scanned through `mmap` and the geometry of each entity is parsed when its `geo` is first accessed.
+    """
+
+    stat = os.stat(path)
+
+    if stat.st_size == 0:
+        return
+
+    encoding = getpreferredencoding(False)
+
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        depth, line, pos, start, entityID = 0, 0, 0, 0, 0
+        entity: Entity = None
+
+        for match in TOKENS.finditer(data):
+            key = match.group(1)
+
+            if key is not None:
+                if depth == 1:
+                    entity[key.decode(encoding)] = match.group(2).decode(encoding)
+                continue
+
+            char = match.group()[0]
+
+            if char == 123: # {
+                if depth == 0:
+                    start = match.start()
+                    line += data[pos:start].count(b"\n")
+                    pos = start
+                    entity = Entity(entityID)
+                    entityID += 1
+                depth += 1
+
+            elif char == 125: # }
+                depth -= 1
+                if depth == 0:
+                    entity.SetSource(LazyGeo(mapData, path, stat.st_mtime_ns, start, match.end(), line))
+                    yield entity
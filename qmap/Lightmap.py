@@ -0,0 +1,98 @@
+import numpy as np
+from typing import Tuple
+
+def GetChartAxes(normals: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns two axes on the plane of each of the (C, 3) normals that the charts are projected on.
+    """
+
+    # the axis the normal is the furthest from is used as a reference, so the cross product never vanishes
+    ref = np.zeros_like(normals)
+    ref[np.arange(len(normals)), np.argmin(np.abs(normals), axis=1)] = 1.0
+
+    u = np.cross(ref, normals)
+    u /= np.linalg.norm(u, axis=1, keepdims=True)
+    v = np.cross(normals, u)
+    return u, v
+
+def ProjectCharts(verts: np.ndarray, chartOf: np.ndarray, normals: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Projects the (N, 3) vertices on the plane of the chart they belong to.
+
+    Returns the (N, 2) projected vertices relative to the corner of their chart and the (C, 2) size of each chart, in map units.
+    """
+
+    u, v = GetChartAxes(normals)
+    coords = np.stack((np.einsum("ij,ij->i", verts, u[chartOf]), np.einsum("ij,ij->i", verts, v[chartOf])), axis=1)
+
+    numCharts = len(normals)
+    mins = np.full((numCharts, 2), np.inf)
+    maxs = np.full((numCharts, 2), -np.inf)
+    np.minimum.at(mins, chartOf, coords)
+    np.maximum.at(maxs, chartOf, coords)
+
+    sizes = np.where(np.isfinite(maxs - mins), maxs - mins, 0.0)
+    return coords - mins[chartOf], sizes
+
+def PackRects(sizes: np.ndarray, width: int) -> Tuple[np.ndarray, int]:
+    """
+    Packs (C, 2) integer rectangles into an atlas `width` wide with a next-fit decreasing-height shelf packer.
+
+    Rectangles are sorted tallest first and placed left to right on the current shelf. When one doesn't fit,
+    a new shelf is opened above, as tall as its first rectangle, and earlier shelves are never revisited.
+    Returns the (C, 2) corner of each rectangle and the height that was used.
+    The result only depends on the sizes and their order, so packing the same charts always gives the same atlas.
+    """
+
+    offsets = np.zeros((len(sizes), 2), dtype=np.int64)
+
+    if len(sizes) == 0:
+        return offsets, 0
+
+    # tallest first, then widest, then in the order they were given
+    order = np.lexsort((np.arange(len(sizes)), -sizes[:, 0], -sizes[:, 1]))
+    widths = sizes[order, 0]
+    heights = sizes[order, 1]
+    ends = np.concatenate(([0], np.cumsum(widths)))
+
+    i, y = 0, 0
+    while i < len(order):
+        # every rectangle that still fits on the shelf, and at least one
+        j = max(int(np.searchsorted(ends, ends[i] + width, side="right")) - 1, i + 1)
+        offsets[order[i:j], 0] = ends[i:j] - ends[i]
+        offsets[order[i:j], 1] = y
+        y += int(heights[i])
+        i = j
+
+    return offsets, y
+
+def PackCharts(sizes: np.ndarray, atlasSize: Tuple[int, int], scale: float, padding: int = 1, maxTries: int = 16) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    Packs charts of (C, 2) sizes in map units into an atlas, at `scale` texels per map unit or less if they don't fit.
+
+    Charts are turned so they are at least as wide as they are tall, and get `padding` texels on every side.
+    Returns the (C, 2) texel corner of each chart's contents, whether each chart was turned and the scale that was used.
+    """
+
+    width, height = atlasSize
+    turned = sizes[:, 1] > sizes[:, 0]
+    sizes = np.where(turned[:, None], sizes[:, ::-1], sizes)
+
+    for _ in range(maxTries):
+        rects = np.maximum(np.ceil(sizes * scale), 1).astype(np.int64) + 2 * padding
+        widest = int(rects[:, 0].max()) if len(rects) != 0 else 0
+
+        if widest <= width:
+            offsets, used = PackRects(rects, width)
+
+            if used <= height:
+                return offsets + padding, turned, scale
+
+            factor = np.sqrt(height / used)
+        else:
+            factor = width / widest
+
+        # padding doesn't shrink with the charts, so the scale can need a few more steps
+        scale *= min(factor, 0.98) * 0.99
+
+    raise ValueError(f"Can't fit {len(sizes)} lightmap charts into a {width}x{height} atlas")
@@ -1,25 +1,25 @@
-from enum import Enum
+import numpy as np
 from mathutils import Vector
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, Tuple, Union
 from .Entity import Entity
 from .Brush import Brush
 from .Face import Face
 from .Patch import Patch, PatchVert
-
-def Error(char, line):
-    raise Exception(f"Unexpected '{char}' on line {line}. Stopping...")
-
-class Mode(Enum):
-    NONE = 0
-    Entity = 1
-    Brush = 2
-    Curve = 3
+from .Parser import Tokenizer, ParseEntities
+from .Chunks import IterEntitiesParallel
+from .Compile import CompileBrushesParallel
+from .Cache import LoadCache, SaveCache
+from .Index import IndexEntities
+from .Geometry import MapGeometry
+from .MaterialRegistry import MaterialRegistry
+from .Planes import PlaneTable
+from .CSG import GetPlanes
 
 class Map:
-    __slots__ = ("settings", "entities", "materials", "matSizes", "models", "modelMaterials", "modelData", "modelMaterialData", "targets", "targetnames")
+    __slots__ = ("settings", "entities", "materials", "matSizes", "models", "modelMaterials", "modelData", "modelMaterialData", "targets", "targetnames", "geometry", "planes")
     settings: dict
     entities: List[Entity]
-    materials: List[str]
+    materials: MaterialRegistry
     matSizes: Dict[str, Vector]
     models: List[str]
     modelMaterials: List[str]
@@ -27,11 +27,13 @@ class Map:
     modelMaterialData: Dict[str, Any]
     targets: Dict[str, List[Entity]]
     targetnames: Dict[str, List[Entity]]
+    geometry: MapGeometry
+    planes: PlaneTable
 
     def __init__(self) -> None:
         self.settings = {}
         self.entities = []
-        self.materials = []
+        self.materials = MaterialRegistry()
         self.matSizes = {}
         self.models = []
         self.modelMaterials = []
@@ -39,6 +41,8 @@ class Map:
         self.modelMaterialData = {}
         self.targets = {}
         self.targetnames = {}
+        self.geometry = None
+        self.planes = PlaneTable()
 
     def __str__(self) -> str:
         res = ""
@@ -48,10 +52,8 @@ class Map:
     
         return res
     
-    def AddMaterial(self, material: str):
-        material = material.lower().strip()
-        if material not in self.materials:
-            self.materials.append(material)
+    def AddMaterial(self, material: str) -> int:
+        return self.materials.Add(material)
 
     def AddModel(self, model: str):
         model = model.lower()
@@ -61,12 +63,74 @@ class Map:
     def Save(self):
         raise NotImplementedError()
 
-    def ProcessGeo(self) -> None:
+    def ProcessGeo(self, workers: int = 1, chunkSize: int = 256, uvs: bool = True) -> None:
+        """
+        Calculates the vertices and uvs of every brush that doesn't have them yet.
+        Faces use the texture sizes known to `materials`, so uvs are best calculated after the materials are loaded.
+        If `uvs` isn't set, only the vertices are calculated.
+
+        If `workers` is more than 1, brushes without vertices are calculated in a process pool, `chunkSize` brushes per task.
+        """
+
+        brushes: List[Brush] = [geo for entity in self.entities for geo in entity.geo if isinstance(geo, Brush)]
+        counts = [brush.GetCounts() for brush in brushes]
+        noVerts = [brush for brush, (numVerts, _) in zip(brushes, counts) if numVerts == 0]
+
+        # brushes read from a map cache have vertices but no uvs
+        noUVs = [brush for brush, (numVerts, numUVs) in zip(brushes, counts) if numVerts != 0 and numUVs == 0] if uvs else []
+
+        if workers <= 1 or not CompileBrushesParallel(noVerts, self.materials.sizes, workers, chunkSize, uvs=uvs):
+            noUVs += noVerts if uvs else []
+
+            for brush in noVerts:
+                brush.CalculateVerts()
+
+        for brush in noUVs:
+            for face in brush.faces:
+                size = self.materials.GetSize(face.materialID) if face.materialID >= 0 else None
+                if size is not None:
+                    face.texSize = size
+
+            brush.CalculateUVs()
+
+    def CrossCheckEngines(self, epsilon: float = 0.01) -> List[Tuple[Tuple[int, int], List[int]]]:
+        """
+        Runs `Brush.CrossCheck` on every brush of the map and prints the brushes where the "CLIP" and "NUMPY" engines disagree.
+
+        Returns the id of each of those brushes with the indices of the faces that differ.
+        """
+
+        res = []
+
         for entity in self.entities:
             for geo in entity.geo:
                 if isinstance(geo, Brush):
-                    geo.CalculateVerts()
-                    geo.CalculateUVs()
+                    faces = geo.CrossCheck(epsilon)
+                    if len(faces) != 0:
+                        print(f"Brush engines disagree on entity {geo.id[0]} brush {geo.id[1]}, faces {faces}")
+                        res.append((geo.id, faces))
+
+        return res
+
+    def BuildGeometry(self, release: bool = False) -> MapGeometry:
+        """
+        Copies the calculated brush geometry of the map into a `MapGeometry` store.
+
+        If `release` is set, the brushes of every entity are replaced by `BrushView`s over the store,
+        so the `Brush`, `Face` and `Vector` objects can be freed.
+        """
+
+        self.geometry = MapGeometry.FromMap(self)
+
+        if release:
+            index = 0
+            for entity in self.entities:
+                for i, geo in enumerate(entity.geo):
+                    if isinstance(geo, Brush):
+                        entity.geo[i] = self.geometry.GetBrush(index)
+                        index += 1
+
+        return self.geometry
 
     def AddTarget(self, target, entity):
         if target not in self.targets:
@@ -81,114 +145,105 @@ class Map:
         
         self.targetnames[targetname].append(entity)
 
+    def AddEntity(self, entity: Entity) -> None:
+        """
+        Adds a parsed entity to the map and registers its materials, planes and targets.
+        """
+
+        self.entities.append(entity)
+        self.AddTargets(entity)
+        self.AddGeo(entity.geo)
+
+    def AddTargets(self, entity: Entity) -> None:
+        if "targetname" in entity:
+            self.AddTargetName(entity["targetname"], entity)
+        if "target" in entity:
+            self.AddTarget(entity["target"], entity)
+
+    def AddGeo(self, geos: List[Union[Brush, Patch]]) -> None:
+        self.AddGeoMaterials(geos)
+        self.AddGeoPlanes(geos)
+
+    def AddGeoPlanes(self, geos: List[Union[Brush, Patch]]) -> None:
+        """
+        Adds the face planes of the brushes to `planes` and points the faces at them.
+        """
+
+        brushes: List[Brush] = [geo for geo in geos if isinstance(geo, Brush)]
+
+        if len(brushes) == 0:
+            return
+
+        points = [brush.GetPlanePoints() for brush in brushes]
+        normals, dists, _ = GetPlanes(np.concatenate(points).reshape(-1, 9))
+        ids = self.planes.AddArray(normals, dists).tolist()
+        start = 0
+
+        for brush, p in zip(brushes, points):
+            brush.SetPlaneIDs(ids[start:start + len(p)])
+            start += len(p)
+
+    def AddGeoMaterials(self, geos: List[Union[Brush, Patch]]) -> None:
+        for geo in geos:
+            if isinstance(geo, Brush):
+                geo.SetMaterialIDs([self.materials.Add(material) for material in geo.GetMaterials()])
+            else:
+                geo.materialID = self.materials.Add(geo.material)
+
     @staticmethod
-    def Load(path: str) -> 'Map':
-        res = Map()
+    def IterEntities(path: str) -> Iterator[Entity]:
+        """
+        Yields the entities of the map file one at a time, as soon as each of them is parsed.
+
+        The file is read as a buffered stream, so the whole map never has to be in memory as text.
+        """
 
         with open(path, "r") as file:
-            mode = Mode.NONE
-            lines = file.readlines()
-
-            for i, line in enumerate(lines):
-                line = line.strip()
-                
-                if line.startswith("//") or line == "":
-                    continue # skip comments
-
-                elif line == "{":
-                    if mode == Mode.NONE:
-                        mode = Mode.Entity
-                        res.entities.append(Entity(len(res.entities)))
-                        continue
-
-                    elif mode == Mode.Entity:
-                        if lines[i + 1].startswith("("):
-                            mode = Mode.Brush
-                            res.entities[-1].geo.append(Brush(len(res.entities[-1].geo), res.entities[-1].id))
-                            continue
-
-                        elif lines[i + 1].strip() == "patchDef2":
-                            mode = Mode.Curve
-                            material = lines[i + 3].strip()
-                            size = tuple([int(i) for i in lines[i + 4].split()[1:3]])
-                            res.entities[-1].geo.append(Patch(size, material))
-                            res.AddMaterial(material)
-                            continue
-
-                    elif mode == Mode.Curve and lines[i - 1].strip() == "patchDef2":
-                        continue
-                    
-                    else:
-                        Error("{", i + 1)
-                
-                elif line == "}":
-                    if mode == Mode.Brush:
-                        mode = Mode.Entity
-                        continue
-                    if mode == Mode.Curve:
-                        prev = lines[i - 1].strip()
-                        if prev == "}":
-                            mode = Mode.Entity
-                            continue
-                        elif prev == ")":
-                            continue
-                    elif mode == Mode.Entity:
-                        mode = Mode.NONE
-                        continue
-                    else:
-                        Error("}", i + 1)
-
-                elif line[0] == '"':
-                    if mode == Mode.Entity:
-                        key, value = Entity.ParseKVP(line)
-                        res.entities[-1][key] = value
-
-                        if key == "targetname":
-                            res.AddTargetName(value, res.entities[-1])
-                        if key == "target":
-                            res.AddTarget(value, res.entities[-1])
-                    else:
-                        Error('"', i + 1)
-
-                elif line == "(":
-                    if mode == Mode.Curve:
-                        continue
-                    else:
-                        Error("(", i + 1)
-
-                elif line == ")":
-                    if mode == Mode.Curve:
-                        continue
-                    else:
-                        Error(")", i + 1)
-
-                elif line.startswith("( ("):
-                    if mode == Mode.Curve:
-                        res.entities[-1].geo[-1].verts.append(PatchVert.FromStr(line))
-                        continue
-                    else:
-                        Error("(", i + 1)
-
-                elif line.startswith("("):
-                    if mode == Mode.Brush:
-                        face = Face.FromStr(line)
-                        res.entities[-1].geo[-1].AddFace(face)
-                        res.AddMaterial(face.material)
-                        continue
-
-                    elif mode == Mode.Curve:
-                        continue
-
-                    else:
-                        Error("(", i + 1)
-
-                elif line == "patchDef2":
-                    if mode == Mode.Curve:
-                        continue
-                    else:
-                        Error("patchDef2", i + 1)
-                else:
-                    if lines[i - 2].strip() != "patchDef2":
-                        Error(line.strip(), i + 1)
+            yield from ParseEntities(Tokenizer(file))
+
+    @staticmethod
+    def Index(path: str) -> 'Map':
+        """
+        Indexes the entities of a map file and their key/values without parsing any brushes or patches.
+
+        The geometry of an entity is parsed the first time its `geo` is accessed,
+        and its materials and planes are added to `materials` and `planes` at that point.
+        Targets and target names are available right away.
+        """
+
+        res = Map()
+
+        for entity in IndexEntities(path, res):
+            res.entities.append(entity)
+            res.AddTargets(entity)
+
+        return res
+
+    @staticmethod
+    def Load(path: str, workers: int = 1, chunkSize: int = 1 << 20, cache: bool = False) -> 'Map':
+        """
+        Loads a map file.
+
+        If `workers` is more than 1, the file is split into chunks of about `chunkSize` bytes that are parsed in a process pool.
+
+        If `cache` is set, the map and its brush vertices are read from a `.mapcache` file next to the map when it is up to date.
+        Otherwise the map is loaded, its vertices are calculated with the same number of `workers` and the cache is rewritten.
+        Either way the uvs are left to `ProcessGeo`.
+        """
+
+        if cache:
+            res = Map()
+            if LoadCache(res, path):
+                return res
+
+        res = Map()
+        entities = Map.IterEntities(path) if workers <= 1 else IterEntitiesParallel(path, workers, chunkSize)
+
+        for entity in entities:
+            res.AddEntity(entity)
+
+        if cache:
+            res.ProcessGeo(workers, uvs=False)
+            SaveCache(res, path)
 
         return res
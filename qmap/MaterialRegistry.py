@@ -0,0 +1,87 @@
+from sys import intern
+from mathutils import Vector
+from typing import Dict, Iterator, List
+from ..func.Helpers import newPath
+
+class MaterialRegistry:
+    """
+    Interns the materials used by a map and hands out integer ids for them.
+
+    The Blender material name (`newPath`) and the texture size of each material are calculated once and cached here.
+    """
+
+    __slots__ = ("names", "ids", "paths", "sizes")
+
+    names: List[str]
+    ids: Dict[str, int]
+    paths: List[str]
+    sizes: List[Vector]
+
+    def __init__(self) -> None:
+        self.names = []
+        self.ids = {}
+        self.paths = []
+        self.sizes = []
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __getitem__(self, id: int) -> str:
+        return self.names[id]
+
+    def __contains__(self, name: str) -> bool:
+        return self.Id(name) is not None
+
+    def Add(self, name: str) -> int:
+        """
+        Returns the id of the material, adding it to the registry if it's new.
+        """
+
+        id = self.ids.get(name)
+
+        if id is not None:
+            return id
+
+        key = intern(name.lower().strip())
+        id = self.ids.get(key)
+
+        if id is None:
+            id = len(self.names)
+            self.names.append(key)
+            self.paths.append(None)
+            self.sizes.append(None)
+            self.ids[key] = id
+
+        # the name exactly as it was given is cached too, so the next lookup doesn't have to normalize it
+        self.ids[name] = id
+
+        return id
+
+    def Id(self, name: str) -> int:
+        id = self.ids.get(name)
+        return id if id is not None else self.ids.get(name.lower().strip())
+
+    def GetPath(self, id: int) -> str:
+        """
+        Returns the name of the Blender material created for the material.
+        """
+
+        path = self.paths[id]
+
+        if path is None:
+            path = self.paths[id] = newPath(self.names[id])
+
+        return path
+
+    def GetSize(self, id: int) -> Vector:
+        """
+        Returns the size of the material's texture, or `None` if it isn't known yet.
+        """
+
+        return self.sizes[id]
+
+    def SetSize(self, id: int, size: Vector) -> None:
+        self.sizes[id] = size
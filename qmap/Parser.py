@@ -0,0 +1,267 @@
+import re
+from typing import Iterable, Iterator, List, Tuple, Union
+from .Entity import Entity
+from .Brush import Brush
+from .FaceBatch import FaceBatch
+from .Patch import Patch, PatchVert
+
+TOKEN = re.compile(r'"[^"]*"|[^\s"]+')
+
+def Error(char, line):
+    raise Exception(f"Unexpected '{char}' on line {line}. Stopping...")
+
+class Tokenizer:
+    """
+    Splits the text of a map file into tokens.
+
+    Lines are pulled from the stream one at a time, so only the line being tokenized is kept in memory.
+
+    Quoted strings keep their quotes so they can't be mistaken for braces or parentheses.
+    """
+
+    __slots__ = ("lines", "line", "tokens", "pos")
+
+    lines: Iterator[str]
+    line: int
+    tokens: List[str]
+    pos: int
+
+    def __init__(self, lines: Iterable[str], line: int = 0) -> None:
+        self.lines = iter(lines)
+        self.line = line
+        self.tokens = []
+        self.pos = 0
+
+    def Fill(self) -> bool:
+        """
+        Reads lines until there is a token to return. Returns `False` at the end of the stream.
+        """
+
+        while self.pos >= len(self.tokens):
+            line = next(self.lines, None)
+
+            if line is None:
+                return False
+
+            self.line += 1
+            line = line.strip()
+
+            if line == "" or line.startswith("//"):
+                continue # skip comments
+
+            if line[0] == '"':
+                kvp = Entity.ParseKVP(line)
+
+                if kvp is None:
+                    Error(line, self.line)
+
+                self.tokens = [f'"{kvp[0]}"', f'"{kvp[1]}"']
+            else:
+                self.tokens = TOKEN.findall(line)
+
+                if "//" in line:
+                    for i, tok in enumerate(self.tokens):
+                        if tok.startswith("//"):
+                            del self.tokens[i:]
+                            break
+
+            self.pos = 0
+
+        return True
+
+    def Peek(self) -> str:
+        """
+        Returns the next token without consuming it, or `None` at the end of the stream.
+        """
+
+        if not self.Fill():
+            return None
+
+        return self.tokens[self.pos]
+
+    def Next(self) -> str:
+        """
+        Returns the next token, or `None` at the end of the stream.
+        """
+
+        if not self.Fill():
+            return None
+
+        tok = self.tokens[self.pos]
+        self.pos += 1
+        return tok
+
+    def Take(self, count: int) -> List[str]:
+        """
+        Returns the next `count` tokens. The tokens don't have to be on the same line.
+        """
+
+        res: List[str] = []
+
+        while len(res) < count:
+            if not self.Fill():
+                Error("end of file", self.line)
+
+            end = min(len(self.tokens), self.pos + count - len(res))
+            res.extend(self.tokens[self.pos:end])
+            self.pos = end
+
+        return res
+
+    def Expect(self, expected: str) -> None:
+        tok = self.Next()
+
+        if tok != expected:
+            Error(tok if tok is not None else "end of file", self.line)
+
+def ReadFace(tokens: Tokenizer) -> List[str]:
+    """
+    Reads the tokens of a brush face starting at its first `(`.
+    """
+
+    tok = tokens.Take(17) # three plane points, the material and the first uv token
+
+    if tok[16] == "[": # Valve UV format
+        tok += tokens.Take(14)
+    else:
+        tok += tokens.Take(4)
+
+    # skip content flags, surface flags and value
+    while tokens.Peek() not in ("(", "}", None):
+        tokens.Next()
+
+    return tok
+
+def ParseBrush(tokens: Tokenizer, brushID: int, entityID: int, faces: List[List[str]]) -> Brush:
+    """
+    Parses a brush. The tokens of its faces are appended to `faces`, to be converted in bulk later.
+    """
+
+    brush = Brush(brushID, entityID)
+
+    while True:
+        tok = tokens.Peek()
+
+        if tok == "(":
+            faces.append(ReadFace(tokens))
+        elif tok == "}":
+            tokens.Next()
+            return brush
+        else:
+            Error(tok if tok is not None else "end of file", tokens.line)
+
+def ParsePatch(tokens: Tokenizer) -> Patch:
+    tokens.Expect("{")
+    material = tokens.Next()
+
+    tokens.Expect("(")
+    info: List[str] = []
+    while tokens.Peek() != ")":
+        info.append(tokens.Next())
+    tokens.Next()
+
+    patch = Patch(tuple([int(i) for i in info[0:2]]), material)
+
+    tokens.Expect("(")
+    while True:
+        tok = tokens.Next()
+
+        if tok == ")":
+            break
+        elif tok != "(":
+            Error(tok if tok is not None else "end of file", tokens.line)
+
+        row: List[PatchVert] = []
+        while tokens.Peek() == "(":
+            tok = tokens.Take(7)
+
+            if tok[6] != ")":
+                Error(tok[6], tokens.line)
+
+            row.append(PatchVert.FromTokens(tok))
+
+        tokens.Expect(")")
+        patch.verts.append(row)
+
+    tokens.Expect("}")
+    tokens.Expect("}")
+
+    return patch
+
+def ParseGeo(tokens: Tokenizer, geoID: int, entityID: int, faces: List[List[str]]) -> Union[Brush, Patch]:
+    """
+    Parses a brush or a patch. The opening `{` should already be consumed.
+    """
+
+    tok = tokens.Peek()
+
+    if tok == "(":
+        return ParseBrush(tokens, geoID, entityID, faces)
+
+    elif tok == "patchDef2":
+        tokens.Next()
+        return ParsePatch(tokens)
+
+    Error(tok if tok is not None else "end of file", tokens.line)
+
+def ParseEntity(tokens: Tokenizer, entityID: int, partial: bool = False) -> Entity:
+    """
+    Parses the key/value pairs and the geometry of an entity. The opening `{` should already be consumed.
+
+    If `partial` is set, the end of the stream ends the entity instead of its closing `}`.
+    """
+
+    entity = Entity(entityID)
+    faces: List[List[str]] = []
+    brushes: List[Tuple[Brush, int, int]] = []
+
+    while True:
+        tok = tokens.Next()
+
+        if tok == "}" or (tok is None and partial):
+            break
+
+        elif tok == "{":
+            start = len(faces)
+            geo = ParseGeo(tokens, len(entity.geo), entityID, faces)
+            entity.geo.append(geo)
+
+            if isinstance(geo, Brush):
+                brushes.append((geo, start, len(faces)))
+
+        elif tok is not None and tok[0] == '"':
+            value = tokens.Next()
+
+            if value is None or value[0] != '"':
+                Error(value if value is not None else "end of file", tokens.line)
+
+            entity[tok[1:-1]] = value[1:-1]
+
+        else:
+            Error(tok if tok is not None else "end of file", tokens.line)
+
+    # convert the faces of all the brushes of the entity in one go
+    batch = FaceBatch.FromTokens(faces)
+    for brush, start, end in brushes:
+        brush.AddFaces(batch, start, end)
+
+    return entity
+
+def ParseEntities(tokens: Tokenizer, firstID: int = 0) -> Iterator[Entity]:
+    """
+    Yields the entities in the token stream one at a time.
+    """
+
+    entityID = firstID
+
+    while True:
+        tok = tokens.Next()
+
+        if tok is None:
+            return
+
+        if tok != "{":
+            Error(tok, tokens.line)
+
+        yield ParseEntity(tokens, entityID)
+        entityID += 1
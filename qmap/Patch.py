@@ -35,6 +35,13 @@ class PatchVert:
     def __str__(self) -> str:
         return f"( {Vec2Str(self.pos)} {Vec2Str(self.uv)} )"
 
+    def __getstate__(self):
+        # plain tuples, so patches can be sent between processes
+        return tuple(self.pos), tuple(self.uv)
+
+    def __setstate__(self, state) -> None:
+        self.pos, self.uv, self.lm = Vector(state[0]), Vector(state[1]), None
+
     @staticmethod
     def FromStr(row: str) -> List['PatchVert']:
         tok = row.strip()[2:-2].split()
@@ -49,20 +56,35 @@ class PatchVert:
 
         return res
 
+    @staticmethod
+    def FromTokens(tok: List[str]) -> 'PatchVert':
+        """
+        Creates a vertex from the tokens of a single `( x y z u v )` group.
+        """
+
+        return PatchVert(
+            Vector([float(i) for i in tok[1:4]]),
+            Vector((float(tok[4]), float(tok[5])))
+        )
+
 class Patch:
-    __slots__ = ("size", "material", "verts", "calculatedVerts", "bpy_obj")
+    __slots__ = ("size", "material", "materialID", "verts", "calculatedVerts", "bpy_obj", "lmAxes")
     size: Tuple[int, int]
     material: str
+    materialID: int
     verts: List[List[PatchVert]]
     calculatedVerts: List[List[PatchVert]]
     bpy_obj: bpy.types.Object
+    lmAxes: np.ndarray # lightmap uv of the first control point, and the lightmap uv offsets across all columns and all rows
 
     def __init__(self, size: Tuple[int, int], material: str) -> None:
         self.size = size
         self.material = material
+        self.materialID = -1
         self.verts = []
         self.calculatedVerts = None
         self.bpy_obj = None
+        self.lmAxes = None
 
     def __str__(self) -> str:
         res = "{\n"
@@ -81,6 +103,25 @@ class Patch:
 
         return res
 
+    def GetGrid(self) -> np.ndarray:
+        """
+        Returns the control points as an (H, W, 5) array of positions and uvs.
+        """
+
+        return np.array([[(*vert.pos, *vert.uv) for vert in row] for row in self.verts], dtype=np.float64).reshape(len(self.verts), -1, 5)
+
+    def GetBoundingBox(self) -> Tuple[Vector, Vector]:
+        """
+        Returns the bounds of the control points. The curved surface never leaves them, so they bound the patch too.
+        """
+
+        positions = self.GetGrid()[..., 0:3].reshape(-1, 3)
+
+        if len(positions) == 0:
+            return None
+
+        return Vector(positions.min(axis=0).tolist()), Vector(positions.max(axis=0).tolist())
+
     def Slice(self) -> List[List[List[List[PatchVert]]]]:
         """
         Slice the patch into a 2d list of 3x3 patches to tessellate them later
@@ -0,0 +1,111 @@
+import numpy as np
+from mathutils import Vector
+from typing import Dict, List, Tuple
+
+class PlaneTable:
+    """
+    Map-wide table of unique planes that brush faces point into by index.
+
+    Two planes are the same if their normals are within `normalEpsilon` and their distances within `distEpsilon` of each other.
+    Planes are hashed on their distance, and a lookup also searches the buckets on either side, like q3map's `FindFloatPlane`,
+    so planes close to a bucket boundary still match.
+    Every plane is added together with its opposite, so plane `i` and plane `i ^ 1` always face each other.
+    """
+
+    __slots__ = ("normals", "dists", "planes", "buckets", "normalEpsilon", "distEpsilon")
+
+    normals: np.ndarray # (P, 3), grown as planes are added
+    dists: np.ndarray # (P,)
+    planes: List[Tuple[Tuple[float, float, float], float]] # normal and distance of each plane, for lookups
+    buckets: Dict[int, List[int]] # plane ids by distance bucket, see `GetBucket`
+    normalEpsilon: float
+    distEpsilon: float
+
+    def __init__(self, normalEpsilon: float = 1e-5, distEpsilon: float = 0.01) -> None:
+        self.normals = np.zeros((0, 3))
+        self.dists = np.zeros(0)
+        self.planes = []
+        self.buckets = {}
+        self.normalEpsilon = normalEpsilon
+        self.distEpsilon = distEpsilon
+
+    def __len__(self) -> int:
+        return len(self.dists)
+
+    @staticmethod
+    def Opposite(id: int) -> int:
+        return id ^ 1
+
+    def GetBucket(self, dist: float) -> int:
+        # opposite planes have the same absolute distance, so they share a bucket
+        return int(abs(dist) // self.distEpsilon)
+
+    def Search(self, normal: Tuple[float, float, float], dist: float) -> int:
+        """
+        Returns the id of the first plane within the epsilons of the given one, or -1 if there isn't one.
+
+        Buckets are `distEpsilon` wide, so every match is in the bucket of `dist` or in one next to it.
+        """
+
+        bucket = self.GetBucket(dist)
+        nx, ny, nz = normal
+        normalEpsilon, distEpsilon = self.normalEpsilon, self.distEpsilon
+
+        for b in (bucket, bucket - 1, bucket + 1):
+            for id in self.buckets.get(b, ()):
+                (x, y, z), d = self.planes[id]
+
+                if abs(d - dist) <= distEpsilon and abs(x - nx) <= normalEpsilon and abs(y - ny) <= normalEpsilon and abs(z - nz) <= normalEpsilon:
+                    return id
+
+        return -1
+
+    def Find(self, normal: Vector, dist: float) -> int:
+        """
+        Returns the id of the plane, or -1 if it isn't in the table.
+        """
+
+        return self.Search(tuple(normal), float(dist))
+
+    def Add(self, normal: Vector, dist: float) -> int:
+        return int(self.AddArray(np.array([tuple(normal)]), np.array([dist]))[0])
+
+    def AddArray(self, normals: np.ndarray, dists: np.ndarray) -> np.ndarray:
+        """
+        Returns the ids of many planes, adding the ones that aren't in the table yet.
+        """
+
+        res = np.empty(len(normals), dtype=np.int32)
+        numPlanes = len(self.planes)
+
+        for i, (normal, dist) in enumerate(zip(normals.tolist(), dists.tolist())):
+            id = self.Search(normal, dist)
+
+            if id == -1:
+                id = len(self.planes)
+                opposite = (-normal[0], -normal[1], -normal[2]), -dist
+
+                # the plane of a pair whose first non zero normal component, or else distance, is positive comes first
+                values = [(c, self.normalEpsilon) for c in normal] + [(dist, self.distEpsilon)]
+                positive = next((c > 0 for c, epsilon in values if abs(c) > epsilon), True)
+
+                # a degenerate plane is its own opposite, and the first id of the pair is found first
+                self.planes += [(tuple(normal), dist), opposite] if positive else [opposite, (tuple(normal), dist)]
+                self.buckets.setdefault(self.GetBucket(dist), []).extend((id, id + 1))
+
+                id = id if positive else id + 1
+
+            res[i] = id
+
+        if len(self.planes) != numPlanes:
+            added = self.planes[numPlanes:]
+            self.normals = np.concatenate((self.normals, np.array([normal for normal, _ in added]).reshape(-1, 3)))
+            self.dists = np.concatenate((self.dists, np.array([dist for _, dist in added])))
+
+        return res
+
+    def GetNormal(self, id: int) -> Vector:
+        return Vector(self.normals[id].tolist())
+
+    def GetDistance(self, id: int) -> float:
+        return float(self.dists[id])
@@ -0,0 +1,77 @@
+import os
+from typing import Dict, Tuple
+from .FileSystem import GameFileSystem
+
+class TextureIndex:
+    """
+    Index of the images of a game path, built in one pass over the files of its `GameFileSystem`.
+
+    Maps lowercase paths without extensions (`textures/base_wall/concrete`) to files, preferring extensions in the order of `extensions`.
+    The file system keeps its index on disk, so building this one doesn't touch the game path.
+    """
+
+    __slots__ = ("fs", "files", "version")
+
+    fs: GameFileSystem
+    files: Dict[str, str] # image path without extension -> path of the file in `fs`
+    version: int # version of `fs` the index was built from
+
+    extensions: Tuple[str, ...] = ("tga", "jpg", "png")
+
+    # indices of the game paths that were used so far, shared by everything that resolves materials
+    loaded: Dict[str, 'TextureIndex'] = {}
+
+    def __init__(self, fs: GameFileSystem) -> None:
+        self.fs = fs
+        self.files = {}
+        self.version = -1
+        self.Build()
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def Build(self) -> None:
+        self.files.clear()
+        self.version = self.fs.version
+
+        priority = {ext: i for i, ext in enumerate(self.extensions)}
+        ranks: Dict[str, int] = {}
+
+        for path in self.fs:
+            name, ext = os.path.splitext(path)
+            rank = priority.get(ext[1:])
+
+            if rank is not None and rank < ranks.get(name, len(priority)):
+                ranks[name] = rank
+                self.files[name] = path
+
+    def Find(self, name: str) -> str:
+        """
+        Returns the file of the texture of a material (`base_wall/concrete`), or `None` if there isn't one.
+        """
+
+        return self.files.get(f"textures/{GameFileSystem.GetName(name)}")
+
+    def FindPath(self, path: str) -> str:
+        """
+        Returns the file of an image path relative to the game path, like the ones in shaders (`textures/base_wall/concrete.tga`).
+        The extension doesn't have to match the file's.
+        """
+
+        return self.files.get(GameFileSystem.GetName(os.path.splitext(path)[0]))
+
+    @staticmethod
+    def Get(gamePath: str) -> 'TextureIndex':
+        """
+        Returns the index of the textures of a game path, built again only if its files changed.
+        """
+
+        fs = GameFileSystem.Get(gamePath)
+        index = TextureIndex.loaded.get(gamePath)
+
+        if index is None or index.fs is not fs:
+            index = TextureIndex.loaded[gamePath] = TextureIndex(fs)
+        elif index.version != fs.version:
+            index.Build()
+
+        return index
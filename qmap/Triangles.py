@@ -0,0 +1,53 @@
+import numpy as np
+from typing import Tuple
+
+def SortWindings(verts: np.ndarray, normals: np.ndarray, faceStart: np.ndarray, faceVerts: np.ndarray) -> np.ndarray:
+    """
+    Sorts the vertex indices of every face by their angle around the face center, all faces in one pass.
+
+    `faceVerts` holds the vertex indices of all the faces one after another, with face `i` in `faceStart[i]:faceStart[i + 1]`.
+    Returns the sorted `faceVerts`, wound the same way `Face.SortVertices` sorts them.
+    """
+
+    numFaces = len(faceStart) - 1
+    counts = np.diff(faceStart)
+
+    if len(faceVerts) == 0:
+        return faceVerts.copy()
+
+    faceOf = np.repeat(np.arange(numFaces), counts)
+    pos = verts[faceVerts]
+
+    centers = np.stack([np.bincount(faceOf, pos[:, k], minlength=numFaces) for k in range(3)], axis=1)
+    centers /= np.maximum(counts, 1)[:, None]
+    rel = pos - centers[faceOf]
+
+    # a basis on each face plane, with u x w pointing along the normal
+    n = normals[faceOf]
+    axis = np.where(np.abs(n[:, 0:1]) < 0.9, np.array((1.0, 0.0, 0.0)), np.array((0.0, 1.0, 0.0)))
+    u = np.cross(n, axis)
+    u /= np.linalg.norm(u, axis=1, keepdims=True)
+    w = np.cross(n, u)
+
+    angle = np.arctan2(np.einsum("ij,ij->i", rel, w), np.einsum("ij,ij->i", rel, u))
+
+    # decreasing angles are clockwise around the normal
+    return faceVerts[np.lexsort((-angle, faceOf))]
+
+def FanTriangles(faceStart: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Triangulates every face as a fan around its first vertex.
+
+    Returns the offsets of each face's triangles, and a (T, 3) `int32` array of positions in the flat index arrays described by `faceStart`,
+    so the same triangles can be looked up in vertex and uv indices.
+    """
+
+    counts = np.maximum(np.diff(faceStart) - 2, 0)
+    triStart = np.zeros(len(counts) + 1, dtype=np.int32)
+    np.cumsum(counts, out=triStart[1:])
+
+    base = np.repeat(faceStart[:-1], counts)
+    local = np.arange(triStart[-1]) - np.repeat(triStart[:-1], counts) + 1
+
+    res = np.stack((base, base + local, base + local + 1), axis=1).astype(np.int32)
+    return triStart, res
@@ -0,0 +1,52 @@
+import numpy as np
+
+def ProjectUVs(verts: np.ndarray, faceOf: np.ndarray, normals: np.ndarray, valve: np.ndarray, params: np.ndarray, texSizes: np.ndarray) -> np.ndarray:
+    """
+    Calculates the uvs of many vertices in one pass, for both texture alignment formats.
+
+    `verts` is an (N, 3) array and `faceOf` the index of the face each vertex belongs to.
+    `normals`, `valve`, `params` and `texSizes` hold the normal, format, uv parameters (same layout as `FaceBatch.uvParams`) and texture size of each face.
+
+    Returns an (N, 2) array with the same results as `StandardUV.GetUV` and `ValveUV.GetUV`.
+    """
+
+    res = np.zeros((len(verts), 2))
+
+    if len(verts) == 0:
+        return res
+
+    isValve = valve[faceOf]
+    p = params[faceOf]
+    size = texSizes[faceOf]
+
+    # Valve format
+    v = verts[isValve]
+    pv = p[isValve]
+    sv = size[isValve]
+    res[isValve, 0] = np.einsum("ij,ij->i", v, pv[:, 0:3]) / (sv[:, 0] * pv[:, 8]) + pv[:, 3] / sv[:, 0]
+    res[isValve, 1] = np.einsum("ij,ij->i", v, pv[:, 4:7]) / (sv[:, 1] * pv[:, 9]) + pv[:, 7] / sv[:, 1]
+
+    # standard format
+    std = ~isValve
+    v = verts[std]
+    ps = p[std]
+    ss = size[std]
+
+    n = np.abs(normals[faceOf[std]])
+    du, dr, df = n[:, 2], n[:, 1], n[:, 0]
+    up = (du >= dr) & (du >= df)
+    right = ~up & (dr >= du) & (dr >= df)
+    front = ~up & ~right
+
+    x = np.where(front, v[:, 1], v[:, 0])
+    y = -np.where(up, v[:, 1], v[:, 2])
+
+    angle = np.radians(ps[:, 2])
+    cos, sin = np.cos(angle), np.sin(angle)
+    x = x * cos - y * sin
+    y = x * sin + y * cos # uses the rotated x, like StandardUV.GetUV does
+
+    res[std, 0] = x / ss[:, 0] / ps[:, 3] + ps[:, 0] / ss[:, 0]
+    res[std, 1] = y / ss[:, 1] / ps[:, 4] + ps[:, 1] / ss[:, 1]
+
+    return res
@@ -0,0 +1,109 @@
+import numpy as np
+from itertools import product
+from mathutils import Vector
+from typing import Dict, Iterator, List, Tuple
+
+class WeldBuffer:
+    """
+    A list of vertices or uvs where values closer than `epsilon` to each other are stored once.
+
+    Values are hashed by the cell of a grid with `epsilon` sized cells they fall in,
+    so finding a value only looks at its own cell and the cells around it instead of the whole list.
+    """
+
+    __slots__ = ("epsilon", "items", "cells", "offsets", "hashed")
+
+    epsilon: float
+    items: List[Vector]
+    cells: Dict[Tuple[int, ...], List[int]]
+    offsets: List[Tuple[int, ...]] # neighbouring cells, own cell first
+    hashed: int # number of items in cells
+
+    def __init__(self, epsilon: float, items: List[Vector] = None, size: int = 3) -> None:
+        """
+        `items` is used as the list of values, so the buffer can weld into a list another object already holds.
+        Values already in it, or appended to it from outside, are hashed as they are, without welding them to each other.
+        """
+
+        self.epsilon = epsilon
+        self.items = [] if items is None else items
+        self.cells = {}
+        self.offsets = sorted(product((-1, 0, 1), repeat=size), key=lambda offset: offset != (0,) * size)
+        self.hashed = 0
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __iter__(self) -> Iterator[Vector]:
+        return iter(self.items)
+
+    def __getitem__(self, index: int) -> Vector:
+        return self.items[index]
+
+    def GetCell(self, value) -> Tuple[int, ...]:
+        inv = 1.0 / self.epsilon
+        return tuple(int(c * inv // 1) for c in value)
+
+    def Sync(self) -> None:
+        """
+        Hashes the items that were added to `items` without going through the buffer.
+        """
+
+        for i in range(self.hashed, len(self.items)):
+            self.cells.setdefault(self.GetCell(self.items[i]), []).append(i)
+
+        self.hashed = len(self.items)
+
+    def Index(self, value) -> int:
+        """
+        Returns the index of a stored value within `epsilon` of `value` on every axis, or -1 if there isn't one.
+        """
+
+        if self.hashed != len(self.items):
+            self.Sync()
+
+        cell = self.GetCell(value)
+        epsilon = self.epsilon
+
+        for offset in self.offsets:
+            for i in self.cells.get(tuple(c + o for c, o in zip(cell, offset)), ()):
+                if all(abs(a - b) <= epsilon for a, b in zip(self.items[i], value)):
+                    return i
+
+        return -1
+
+    def Add(self, value) -> int:
+        """
+        Returns the index of `value`, adding it to the buffer if there is no stored value within `epsilon` of it.
+        """
+
+        idx = self.Index(value)
+
+        if idx != -1:
+            return idx
+
+        idx = len(self.items)
+        self.items.append(value)
+        self.cells.setdefault(self.GetCell(value), []).append(idx)
+        self.hashed += 1
+
+        return idx
+
+    def AddArray(self, values: np.ndarray) -> np.ndarray:
+        """
+        Adds every row of an (N, size) array and returns their indices.
+        """
+
+        return np.array([self.Add(value) for value in values.tolist()], dtype=np.int32)
+
+def WeldArray(values: np.ndarray, epsilon: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Welds the rows of an (N, size) array.
+
+    Returns the welded rows and the index of each input row in them.
+    """
+
+    buffer = WeldBuffer(epsilon, size=values.shape[1])
+    inverse = buffer.AddArray(values)
+
+    return np.array(buffer.items, dtype=values.dtype).reshape(-1, values.shape[1]), inverse
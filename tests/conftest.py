@@ -0,0 +1,104 @@
+"""
+Lets the tests import the addon's modules outside of Blender.
+
+`bpy` and `mathutils` are replaced by small stubs when they can't be imported, and the repository is loaded as the
+`mapcompiler` package without running its `__init__.py`, which needs Blender to register the addon.
+"""
+
+import math
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class Vector:
+    """
+    The parts of `mathutils.Vector` the tested code uses, in double precision.
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self, values=(0.0, 0.0, 0.0)) -> None:
+        self.values = [float(v) for v in values]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def __setitem__(self, index, value) -> None:
+        self.values[index] = float(value)
+
+    def __repr__(self) -> str:
+        return f"Vector({tuple(self.values)})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Vector) and self.values == other.values
+
+    def __add__(self, other) -> 'Vector':
+        return Vector([a + b for a, b in zip(self, other)])
+
+    def __sub__(self, other) -> 'Vector':
+        return Vector([a - b for a, b in zip(self, other)])
+
+    def __neg__(self) -> 'Vector':
+        return Vector([-a for a in self])
+
+    def __mul__(self, value: float) -> 'Vector':
+        return Vector([a * value for a in self])
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, value: float) -> 'Vector':
+        return Vector([a / value for a in self])
+
+    def dot(self, other) -> float:
+        return sum(a * b for a, b in zip(self, other))
+
+    def cross(self, other) -> 'Vector':
+        a, b = self, other
+        return Vector((a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0]))
+
+    @property
+    def length(self) -> float:
+        return math.sqrt(self.dot(self))
+
+    def normalized(self) -> 'Vector':
+        length = self.length
+        return Vector(self) if length == 0 else self / length
+
+    def copy(self) -> 'Vector':
+        return Vector(self)
+
+def Component(index: int) -> property:
+    return property(lambda self: self.values[index], lambda self, value: self.__setitem__(index, value))
+
+Vector.x, Vector.y, Vector.z = Component(0), Component(1), Component(2)
+
+def InstallStubs() -> None:
+    try:
+        import mathutils # noqa: F401
+    except ImportError:
+        mathutils = sys.modules["mathutils"] = types.ModuleType("mathutils")
+        mathutils.Vector = Vector
+        # imported by modules the tests load, but not used by them
+        mathutils.geometry = types.ModuleType("mathutils.geometry")
+
+    try:
+        import bpy # noqa: F401
+    except ImportError:
+        sys.modules["bpy"] = types.ModuleType("bpy")
+
+    package = types.ModuleType("mapcompiler")
+    package.__path__ = [ROOT]
+    sys.modules.setdefault("mapcompiler", package)
+
+    # pytest imports the repository's __init__.py under the name of its folder, the stub is used instead
+    sys.modules.setdefault(os.path.basename(ROOT), package)
+
+InstallStubs()
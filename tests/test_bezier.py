@@ -0,0 +1,152 @@
+"""
+Pins `TessellateGrid`, `GetPatchLevels` and `JoinGrids` to the per-point `evaluateQuadraticBezierPatch` they replaced.
+"""
+
+import numpy as np
+import pytest
+from mapcompiler.qmap.Bezier import GetPatchLevels, JoinGrids, TessellateGrid, TessellateGridLevels
+
+SIZES = [(3, 3), (3, 5), (5, 3), (5, 7), (9, 5)]
+LEVELS = [1, 2, 3, 4, 8]
+
+def binomialCoefficient(n, k):
+    coeff = 1
+    for i in range(k):
+        coeff *= (n - i)
+        coeff //= (i + 1)
+    return coeff
+
+def evaluateQuadraticBezierPatch(controlPoints, u, v):
+    """
+    The point of a 3x3 patch at (u, v), as the patch builder calculated it before, on (x, y, z, u, v) lists.
+    """
+
+    p = [0.0] * 5
+
+    for i in range(3):
+        q = [0.0] * 5
+        for j in range(3):
+            weight = binomialCoefficient(2, j) * pow(u, j) * pow(1.0 - u, 2 - j)
+            q = [a + b * weight for a, b in zip(q, controlPoints[i][j])]
+        weight = binomialCoefficient(2, i) * pow(v, i) * pow(1.0 - v, 2 - i)
+        p = [a + b * weight for a, b in zip(p, q)]
+
+    return p
+
+def Slice(grid: np.ndarray):
+    """
+    The 3x3 patches of a control grid as nested lists, in the order of `Patch.Slice`.
+    """
+
+    return [
+        grid[i - 1:i + 2, j - 1:j + 2].tolist()
+        for i in range(1, grid.shape[0] - 1, 2) for j in range(1, grid.shape[1] - 1, 2)
+    ]
+
+def Expected(controlPoints, rowLevel: int, colLevel: int) -> np.ndarray:
+    return np.array([
+        [evaluateQuadraticBezierPatch(controlPoints, x / colLevel, y / rowLevel) for x in range(colLevel + 1)]
+        for y in range(rowLevel + 1)
+    ], dtype=np.float64)
+
+def MakeGrid(size, seed: int, bend: float = 64.0) -> np.ndarray:
+    """
+    A (H, W, 5) control grid on a plane, with its positions pushed off the plane by up to `bend` map units.
+    """
+
+    rng = np.random.default_rng(seed)
+    y, x = np.meshgrid(np.arange(size[0], dtype=np.float64), np.arange(size[1], dtype=np.float64), indexing="ij")
+    grid = np.stack((x * 32.0, y * 32.0, np.zeros_like(x), x / 4.0, y / 4.0), axis=2)
+    grid[..., 0:3] += rng.uniform(-bend, bend, size=(*size, 3))
+    return grid
+
+@pytest.mark.parametrize("size", SIZES)
+@pytest.mark.parametrize("level", LEVELS)
+def test_tessellate_grid(size, level):
+    grid = MakeGrid(size, sum(size) * level)
+    expected = np.array([Expected(patch, level, level) for patch in Slice(grid)])
+
+    np.testing.assert_allclose(TessellateGrid(grid, level), expected, rtol=1e-12, atol=1e-9)
+
+@pytest.mark.parametrize("size", SIZES)
+def test_tessellate_grid_levels(size):
+    grid = MakeGrid(size, sum(size))
+    rowLevels = np.arange(1, (size[0] - 1) // 2 + 1, dtype=np.int32) + 1
+    colLevels = np.arange((size[1] - 1) // 2, 0, -1, dtype=np.int32) * 2
+    patches = Slice(grid)
+    numCols = len(colLevels)
+
+    for i, res in enumerate(TessellateGridLevels(grid, rowLevels, colLevels)):
+        expected = Expected(patches[i], int(rowLevels[i // numCols]), int(colLevels[i % numCols]))
+        np.testing.assert_allclose(res, expected, rtol=1e-12, atol=1e-9)
+
+@pytest.mark.parametrize("size", SIZES)
+def test_levels_without_tolerance(size):
+    rowLevels, colLevels = GetPatchLevels(MakeGrid(size, 0), 6)
+
+    assert rowLevels.tolist() == [6] * ((size[0] - 1) // 2)
+    assert colLevels.tolist() == [6] * ((size[1] - 1) // 2)
+
+def test_flat_patch_needs_one_level():
+    rowLevels, colLevels = GetPatchLevels(MakeGrid((5, 7), 0, bend=0.0), 8, tolerance=0.1)
+
+    assert rowLevels.tolist() == [1, 1]
+    assert colLevels.tolist() == [1, 1, 1]
+
+@pytest.mark.parametrize("size", SIZES)
+@pytest.mark.parametrize("tolerance", [0.25, 2.0, 16.0])
+def test_levels_within_tolerance(size, tolerance):
+    """
+    Every segment of the tessellation stays within `tolerance` of the surface halfway along it,
+    unless the level was capped at the maximum.
+    """
+
+    maxLevel = 16
+    grid = MakeGrid(size, int(tolerance * 8) + sum(size))
+    rowLevels, colLevels = GetPatchLevels(grid, maxLevel, tolerance)
+    numCols = len(colLevels)
+
+    for i, patch in enumerate(Slice(grid)):
+        rowLevel, colLevel = int(rowLevels[i // numCols]), int(colLevels[i % numCols])
+        corners = Expected(patch, rowLevel, colLevel)[..., 0:3]
+
+        # the surface halfway along each segment of the rows and of the columns of the tessellation
+        across = Expected(patch, rowLevel, colLevel * 2)[:, 1::2, 0:3]
+        down = Expected(patch, rowLevel * 2, colLevel)[1::2, :, 0:3]
+        acrossError = np.linalg.norm(across - (corners[:, :-1] + corners[:, 1:]) / 2.0, axis=-1).max()
+        downError = np.linalg.norm(down - (corners[:-1] + corners[1:]) / 2.0, axis=-1).max()
+
+        assert colLevel == maxLevel or acrossError <= tolerance + 1e-9
+        assert rowLevel == maxLevel or downError <= tolerance + 1e-9
+
+@pytest.mark.parametrize("size", SIZES)
+@pytest.mark.parametrize("level", [1, 2, 5])
+def test_join_grids(size, level):
+    """
+    The joined grid is the whole patch evaluated with the old function, one patch after the other,
+    with the rows and columns neighbouring patches share appearing once.
+    """
+
+    grid = MakeGrid(size, sum(size) + level)
+    numRows, numCols = (size[0] - 1) // 2, (size[1] - 1) // 2
+    patches = Slice(grid)
+
+    res = JoinGrids(list(TessellateGrid(grid, level)), numCols)
+    assert res.shape == (numRows * level + 1, numCols * level + 1, 5)
+
+    for i, patch in enumerate(patches):
+        r, c = (i // numCols) * level, (i % numCols) * level
+        np.testing.assert_allclose(res[r:r + level + 1, c:c + level + 1], Expected(patch, level, level), rtol=1e-12, atol=1e-9)
+
+def test_join_grids_levels():
+    grid = MakeGrid((5, 7), 3)
+    rowLevels, colLevels = np.array([2, 4], dtype=np.int32), np.array([3, 1, 2], dtype=np.int32)
+    rowStarts, colStarts = np.concatenate(([0], np.cumsum(rowLevels))), np.concatenate(([0], np.cumsum(colLevels)))
+
+    res = JoinGrids(TessellateGridLevels(grid, rowLevels, colLevels), len(colLevels))
+    assert res.shape == (rowStarts[-1] + 1, colStarts[-1] + 1, 5)
+
+    for i, patch in enumerate(Slice(grid)):
+        r, c = i // len(colLevels), i % len(colLevels)
+        expected = Expected(patch, int(rowLevels[r]), int(colLevels[c]))
+        np.testing.assert_allclose(res[rowStarts[r]:rowStarts[r + 1] + 1, colStarts[c]:colStarts[c + 1] + 1], expected, rtol=1e-12, atol=1e-9)
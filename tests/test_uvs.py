@@ -0,0 +1,106 @@
+"""
+Pins `ProjectUVs` to the per-vertex `StandardUV.GetUV` and `ValveUV.GetUV` it replaced, for both texture alignment formats.
+"""
+
+import itertools
+import numpy as np
+import pytest
+from mathutils import Vector
+from mapcompiler.qmap.Face import StandardUV, ValveUV
+from mapcompiler.qmap.UVs import ProjectUVs
+
+# axis aligned, diagonal (the projection axes tie) and oblique normals
+NORMALS = [
+    (0, 0, 1), (0, 0, -1), (0, 1, 0), (0, -1, 0), (1, 0, 0), (-1, 0, 0),
+    (1, 1, 0), (0, 1, 1), (1, 0, 1), (1, 1, 1), (-1, 1, 1),
+    (0.2, -0.5, 0.8), (0.9, 0.3, -0.2), (-0.3, 0.7, 0.1)
+]
+
+VERTS = [(0, 0, 0), (64, -32, 16), (-128.5, 256, 0.25), (1000, 1000, -1000), (3.75, -7.125, 99)]
+
+ROTATIONS = [0, 15, 45, 90, 180, 270, -30, 360]
+SCALES = [(1, 1), (0.5, 0.5), (0.25, 2), (-1, 1), (2, -0.5)]
+OFFSETS = [(0, 0), (16, -8), (-37.5, 123)]
+TEX_SIZES = [(512, 512), (128, 64), (256, 1024)]
+
+def Normal(normal) -> Vector:
+    return Vector(normal).normalized()
+
+def MakeStandard(rotation: float, scale, offset) -> StandardUV:
+    res = StandardUV()
+    res.rotation = rotation
+    res.xScale, res.yScale = scale
+    res.xOffset, res.yOffset = offset
+    return res
+
+def MakeValve(uAxis, vAxis, scale, offset) -> ValveUV:
+    res = ValveUV()
+    res.uAxis, res.vAxis = Vector(uAxis), Vector(vAxis)
+    res.uScale, res.vScale = scale
+    res.uOffset, res.vOffset = offset
+    return res
+
+def Project(faces) -> np.ndarray:
+    """
+    Runs `ProjectUVs` once over faces given as (uvData, normal, texSize, verts) tuples.
+    """
+
+    return ProjectUVs(
+        np.array([vert for _, _, _, verts in faces for vert in verts], dtype=np.float64).reshape(-1, 3),
+        np.repeat(np.arange(len(faces)), [len(verts) for _, _, _, verts in faces]),
+        np.array([tuple(normal) for _, normal, _, _ in faces], dtype=np.float64).reshape(-1, 3),
+        np.array([isinstance(uvData, ValveUV) for uvData, _, _, _ in faces], dtype=bool),
+        np.array([uvData.GetParams() for uvData, _, _, _ in faces], dtype=np.float64).reshape(-1, 10),
+        np.array([texSize for _, _, texSize, _ in faces], dtype=np.float64).reshape(-1, 2)
+    )
+
+def Expected(faces) -> np.ndarray:
+    return np.array([
+        tuple(uvData.GetUV(Vector(vert), normal, Vector(texSize)))
+        for uvData, normal, texSize, verts in faces for vert in verts
+    ], dtype=np.float64).reshape(-1, 2)
+
+def AssertSame(faces) -> None:
+    np.testing.assert_allclose(Project(faces), Expected(faces), rtol=1e-9, atol=1e-9)
+
+@pytest.mark.parametrize("rotation", ROTATIONS)
+@pytest.mark.parametrize("scale", SCALES)
+@pytest.mark.parametrize("offset", OFFSETS)
+def test_standard_grid(rotation, scale, offset):
+    uvData = MakeStandard(rotation, scale, offset)
+    AssertSame([(uvData, Normal(normal), texSize, VERTS) for normal in NORMALS for texSize in TEX_SIZES])
+
+@pytest.mark.parametrize("scale", SCALES)
+@pytest.mark.parametrize("offset", OFFSETS)
+def test_valve_grid(scale, offset):
+    axes = [((1, 0, 0), (0, -1, 0)), ((0, 1, 0), (0, 0, -1)), ((0.7071, 0.7071, 0), (0, 0, -1)), ((0.6, -0.8, 0.1), (0.3, 0.2, -0.9))]
+    faces = [
+        (MakeValve(uAxis, vAxis, scale, offset), Normal(normal), texSize, VERTS)
+        for (uAxis, vAxis), normal, texSize in itertools.product(axes, NORMALS[:6], TEX_SIZES)
+    ]
+    AssertSame(faces)
+
+@pytest.mark.parametrize("seed", range(8))
+def test_random_mixed_formats(seed):
+    rng = np.random.default_rng(seed)
+    faces = []
+
+    for _ in range(64):
+        normal = Normal(rng.normal(size=3).tolist())
+        scale = tuple((rng.uniform(0.1, 4.0, size=2) * rng.choice([-1.0, 1.0], size=2)).tolist())
+        offset = tuple(rng.uniform(-512.0, 512.0, size=2).tolist())
+        texSize = tuple(rng.choice([32.0, 64.0, 128.0, 256.0, 512.0, 1024.0], size=2).tolist())
+        verts = rng.uniform(-4096.0, 4096.0, size=(int(rng.integers(3, 9)), 3)).tolist()
+
+        if rng.random() < 0.5:
+            uvData = MakeValve(rng.normal(size=3).tolist(), rng.normal(size=3).tolist(), scale, offset)
+        else:
+            uvData = MakeStandard(float(rng.uniform(-360.0, 360.0)), scale, offset)
+
+        faces.append((uvData, normal, texSize, verts))
+
+    AssertSame(faces)
+
+def test_no_vertices():
+    faces = [(MakeStandard(0, (1, 1), (0, 0)), Normal((0, 0, 1)), (512, 512), [])]
+    assert Project(faces).shape == (0, 2)